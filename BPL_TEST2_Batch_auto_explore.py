@@ -0,0 +1,138 @@
+# Figure - Choice of backend and FMU for the batch reactor model
+#          run instead of a specific explore script, i.e. in the notebook: run -i BPL_TEST2_Batch_auto_explore.py
+#          and then the fastest valid of PyFMI ME, PyFMI CS and FMPy with available FMU is used on this host
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with micro-benchmark of backends in subprocesses and choice cached per host
+# 2026-10-19 - Candidates and check of agreement in BPL_TEST2_Batch_backend.py, with the reference backend
+#              used when no candidate agrees with the median
+#------------------------------------------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------------------------------------------
+#  Framework
+#------------------------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import hashlib
+import platform
+import subprocess
+import importlib.util
+from importlib.metadata import version
+import numpy as np
+
+from BPL_TEST2_Batch_backend import backend_candidates, backend_valid
+
+# Explore script for each backend and FMU files to consider in order of preference
+backend_script = {'pyfmi': 'BPL_TEST2_Batch_explore.py', 'fmpy': 'BPL_TEST2_Batch_fmpy_explore.py'}
+backend_fmu_list = ['BPL_TEST2_Batch_linux_om_me.fmu', 'BPL_TEST2_Batch_linux_2404_om_me.fmu', \
+                    'BPL_TEST2_Batch_linux_om_cs.fmu', 'BPL_TEST2_Batch_windows_jm_cs.fmu']
+
+# Cache of the choice per host
+backend_cache = os.path.join(os.path.expanduser('~'), '.cache', 'BPL_TEST2_Batch', 'backend.json')
+
+# Calibration-style workload run by each candidate in a subprocess, i.e. simulations with varied parameters
+backend_workload = '''
+import sys, json, time, locale, platform
+if platform.system() == 'Linux':
+   try: locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+   except locale.Error: pass
+backend, flag_type, fmu_model, n = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+parSets = [{'bioreactor.culture.Y': 0.4+0.2*k/n, 'bioreactor.culture.qSmax': 1.2-0.4*k/n} for k in range(n)]
+X_final = []
+if backend == 'pyfmi':
+   from pyfmi import load_fmu
+   model = load_fmu(fmu_model, kind=flag_type, log_level=0)
+   opts = model.simulate_options()
+   if flag_type == 'ME': opts['CVode_options']['verbosity'] = 50
+   else: opts['silent_mode'] = True
+   opts['ncp'] = 12
+   opts['result_handling'] = 'memory'
+   start_time = time.perf_counter()
+   for parSet in parSets:
+      model.reset()
+      for key in parSet.keys(): model.set(key, parSet[key])
+      sim_res = model.simulate(final_time=6.0, options=opts)
+      X_final.append(float(sim_res['bioreactor.c[1]'][-1]))
+else:
+   from fmpy import simulate_fmu
+   start_time = time.perf_counter()
+   for parSet in parSets:
+      sim_res = simulate_fmu(fmu_model, validate=False, fmi_type='ModelExchange' if flag_type == 'ME' else 'CoSimulation',
+                             stop_time=6.0, output_interval=0.5, start_values=parSet, output=['bioreactor.c[1]'])
+      X_final.append(float(sim_res['bioreactor.c[1]'][-1]))
+print(json.dumps({'time': (time.perf_counter()-start_time)/n, 'X_final': X_final}))
+'''
+
+#------------------------------------------------------------------------------------------------------------------
+#  Candidates, benchmark and choice
+#------------------------------------------------------------------------------------------------------------------
+
+def backend_benchmark(candidate, n=20, timeout=120):
+   """Run the workload for one candidate in a subprocess and return the time per simulation,
+      or None if the candidate fails, e.g. FMU and platform do not match."""
+   backend, flag_type, fmu_model = candidate
+   try:
+      output = subprocess.run([sys.executable, '-c', backend_workload, backend, flag_type, fmu_model, str(n)], \
+                              capture_output=True, text=True, timeout=timeout)
+      return json.loads(output.stdout.strip().splitlines()[-1])
+   except (subprocess.TimeoutExpired, json.JSONDecodeError, IndexError):
+      return None
+
+def backend_key(candidates):
+   """Key for the cache given by host, Python and backend versions and the content of the candidate FMU files"""
+   h = hashlib.sha256()
+   h.update((platform.node() + platform.python_version()).encode())
+   for backend in backend_script.keys():
+      if importlib.util.find_spec(backend) is not None: h.update((backend + version(backend)).encode())
+   for candidate in candidates:
+      h.update(repr(candidate).encode())
+      with open(candidate[2], 'rb') as f: h.update(hashlib.sha256(f.read()).digest())
+   return h.hexdigest()
+
+def backend_select(refresh=False, n=20, tolerance=1e-3, verbose=True):
+   """Choose the fastest valid candidate, where valid means that the simulations agree with the
+      median of all candidates. The choice is cached per host and used until FMU files or backends change."""
+   candidates = backend_candidates(backend_fmu_list)
+   if candidates == []:
+      print('There is no backend and FMU for this platform')
+      return None
+   key = backend_key(candidates)
+   try:
+      with open(backend_cache) as f: cache = json.load(f)
+   except (FileNotFoundError, json.JSONDecodeError):
+      cache = {}
+   if (not refresh) and key in cache.keys():
+      return cache[key]
+
+   # Benchmark all candidates and check results against each other
+   results = {candidate: backend_benchmark(candidate, n) for candidate in candidates}
+   valid = backend_valid(results, 'X_final', tolerance, verbose)
+   if valid == {}:
+      print('Error: None of the candidates could simulate', candidates)
+      return None
+   if verbose:
+      for candidate, result in results.items():
+         print(candidate, ':', 'failed' if result is None else str(np.round(1000*result['time'], 2)) + ' ms', \
+               '' if candidate in valid.keys() else '- not valid')
+   backend, flag_type, fmu_model = min(valid.keys(), key=lambda candidate: valid[candidate]['time'])
+   choice = {'backend': backend, 'flag_type': flag_type, 'fmu_model': fmu_model, \
+             'time': valid[(backend, flag_type, fmu_model)]['time']}
+
+   cache[key] = choice
+   os.makedirs(os.path.dirname(backend_cache), exist_ok=True)
+   with open(backend_cache + '.tmp', 'w') as f: json.dump(cache, f, indent=3)
+   os.replace(backend_cache + '.tmp', backend_cache)
+   return choice
+
+#------------------------------------------------------------------------------------------------------------------
+#  Startup - the explore script for the chosen backend reads backend_choice
+#------------------------------------------------------------------------------------------------------------------
+
+backend_choice = backend_select()
+if backend_choice is not None:
+   print('Backend', backend_choice['backend'], backend_choice['flag_type'], 'with', backend_choice['fmu_model'])
+   exec(open(backend_script[backend_choice['backend']]).read())
@@ -0,0 +1,53 @@
+# Figure - Candidates of backend and FMU for the batch reactor model and check that their simulations agree
+#          imported by BPL_TEST2_Batch_auto_explore.py and BPL_TEST2_Batch_fmu_compare.py
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with candidates and check against the median moved here from BPL_TEST2_Batch_auto_explore.py
+#------------------------------------------------------------------------------------------------------------------
+
+import os
+import zipfile
+import platform
+import importlib.util
+import numpy as np
+
+# Backends in order of preference, where the first is the reference when candidates disagree
+backend_list = ['pyfmi', 'fmpy']
+
+def backend_candidates(fmu_list, backends=backend_list):
+   """List of (backend, flag_type, fmu_model) where the backend is installed and the FMU is on disk
+      with binaries for this platform and supports the FMU type."""
+   platform_folder = {'Linux': 'linux64', 'Windows': 'win64', 'Darwin': 'darwin64'}.get(platform.system(), '')
+   candidates = []
+   for fmu_model in fmu_list:
+      if not os.path.exists(fmu_model): continue
+      with zipfile.ZipFile(fmu_model, 'r') as fmu:
+         names = fmu.namelist()
+         model_description = fmu.read('modelDescription.xml').decode('utf-8')
+      if not any([name.startswith('binaries/'+platform_folder+'/') for name in names]): continue
+      for flag_type, tag in [('ME', '<ModelExchange'), ('CS', '<CoSimulation')]:
+         if tag not in model_description: continue
+         for backend in backends:
+            if importlib.util.find_spec(backend) is not None:
+               candidates.append((backend, flag_type, fmu_model))
+   return candidates
+
+def backend_valid(results, key, tolerance=1e-3, verbose=True):
+   """Candidates of results, a dictionary of candidate and result or None, that simulated with finite
+      values of result[key] within tolerance relative to the median of all candidates. If none agree
+      with the median, e.g. two candidates that differ, the candidates of the most preferred backend
+      that simulated are kept. Return a dictionary of the valid candidates and their results."""
+   valid = {candidate: result for candidate, result in results.items() \
+            if result is not None and np.all(np.isfinite(result[key]))}
+   if valid == {}: return {}
+   median = np.median(np.array([result[key] for result in valid.values()]), axis=0)
+   agree = {candidate: result for candidate, result in valid.items() \
+            if np.max(np.abs(np.array(result[key]) - median)) <= tolerance*np.max(np.abs(median))}
+   if agree == {}:
+      reference = min(valid.keys(), key=lambda candidate: backend_list.index(candidate[0]) \
+                      if candidate[0] in backend_list else len(backend_list))[0]
+      agree = {candidate: result for candidate, result in valid.items() if candidate[0] == reference}
+      if verbose: print('Warning: The candidates do not agree, the reference backend', reference, 'is used')
+   return agree
@@ -0,0 +1,1486 @@
+# Figure - Calibration tools for the batch reactor model
+#          run after BPL_TEST2_Batch_explore.py or BPL_TEST2_Batch_fmpy_explore.py,
+#          i.e. in the notebook: run -i BPL_TEST2_Batch_calibration_explore.py
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with worker pool, loss function and profile likelihood for the estimated parameters
+# 2026-10-19 - Introduced calibrate() and bootstrap() with streaming statistics in StreamStats
+# 2026-10-19 - Introduced mcmc() ensemble sampler with batch evaluation in the pool and checkpoints
+# 2026-10-19 - Introduced montecarlo() with trajectories in a memory-mapped file and streaming prediction bands
+# 2026-10-19 - Introduced store of calibrations and calibrate_warm() with start from nearest earlier datasets
+# 2026-10-19 - Introduced online_start() and online_update() for moving horizon estimation during a batch
+# 2026-10-19 - Introduced SeriesLoss for large time series with weights, binning and robust loss
+# 2026-10-19 - Introduced calibrate() with differential evolution where each generation is one batch in the pool
+# 2026-10-19 - Introduced sweep() with time budget per simulation and workers replaced when hung or crashed
+# 2026-10-19 - Introduced SharedTrajectories and ensemble_simulate() where workers write into shared memory
+# 2026-10-19 - Introduced ParTransform with scaled, log and logit parameters for calibrate() and a benchmark
+# 2026-10-19 - Loss functions simulate only up to the last time of data with options from opts_stop()
+# 2026-10-19 - Introduced cluster_start() where pool_map() and bootstrap() use workers on other machines over TCP
+# 2026-10-19 - Profile likelihood and MCMC evaluated by objective_safe() and objective_batch() with timeout
+# 2026-10-19 - Parameter sets of ensemble_simulate() checked with parCheck before simulation
+# 2026-10-19 - Evaluations to target given for each transform in transform_benchmark()
+# 2026-10-19 - Residuals give an error when the simulation does not cover the times of data
+# 2026-10-19 - Workers of cluster_start() use the backend of the notebook
+# 2026-10-19 - Chunks of montecarlo() given to the pool at most two for each worker ahead by pool_imap_bounded()
+# 2026-10-19 - Resume of mcmc() from a checkpoint with more steps than nsteps gives an error
+#------------------------------------------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------------------------------------------
+#  Framework
+#------------------------------------------------------------------------------------------------------------------
+
+# Setup framework - the explore script must be run before and give par(), model_simulate() etc
+import os
+import time
+import json
+import queue
+import hashlib
+import itertools
+import collections
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.resource_tracker
+from multiprocessing import shared_memory
+import numpy as np
+import matplotlib.pyplot as plt
+import scipy.optimize
+import scipy.stats
+
+from BPL_TEST2_Batch_cluster import Coordinator
+
+# Location of the measured variables in the model
+dataLocation = {}
+dataLocation['X'] = 'bioreactor.c[1]'
+dataLocation['S'] = 'bioreactor.c[2]'
+
+# Location of variables stored in Monte-Carlo simulations
+mcLocation = {}
+mcLocation['X'] = 'bioreactor.c[1]'
+mcLocation['S'] = 'bioreactor.c[2]'
+mcLocation['mu'] = 'bioreactor.culture.mu'
+
+#------------------------------------------------------------------------------------------------------------------
+#  Worker pool
+#------------------------------------------------------------------------------------------------------------------
+
+# The worker processes are forked from the notebook and inherit functions and dictionaries defined there.
+# Each task bring a copy of parValue since a change with par() after the pool start is not seen by the workers.
+pool = None
+
+def pool_worker_init():
+   """Each worker process loads its own instance of the FMU"""
+   model_load()
+
+def pool_start(processes=None, recycle=None):
+   """Start pool of worker processes, default one per core. With recycle each worker is replaced,
+      with the FMU loaded again, after that number of tasks."""
+   global pool
+   if pool is None:
+      multiprocessing.resource_tracker.ensure_running()
+      pool = multiprocessing.get_context('fork').Pool(processes, initializer=pool_worker_init, maxtasksperchild=recycle)
+   return pool
+
+def pool_stop():
+   """Stop the pool of worker processes"""
+   global pool
+   if pool is not None:
+      pool.close()
+      pool.join()
+      pool = None
+
+def pool_size():
+   """Number of worker processes, of the cluster if started, and one when evaluated in the notebook"""
+   if cluster is not None:
+      return max(cluster.size(), 1)
+   elif pool is None:
+      return 1
+   else:
+      return pool._processes
+
+def pool_map(function, tasks, chunksize=1, remote=True):
+   """Map tasks to the cluster or pool if started and otherwise evaluate them one by one in the notebook.
+      Tasks that use shared memory or files of this machine are given remote=False."""
+   if cluster is not None and remote:
+      return cluster.map(function.__name__, tasks)
+   elif pool is None:
+      return [function(task) for task in tasks]
+   else:
+      return pool.map(function, tasks, chunksize)
+
+def pool_imap_unordered(function, tasks):
+   """Results of tasks in the order they are finished, from the cluster or pool if started"""
+   if cluster is not None:
+      return (value for value in cluster.map_unordered(function.__name__, tasks))
+   elif pool is None:
+      return map(function, tasks)
+   else:
+      return pool.imap_unordered(function, tasks)
+
+def pool_imap_bounded(function, tasks, ahead):
+   """Results of tasks in the order they are finished from the pool, where at most ahead tasks are given to
+      the pool and not yet finished. A generator of tasks is thus drawn from only as the workers need them,
+      unlike Pool.imap_unordered() that takes all tasks at once."""
+   tasks = iter(tasks)
+   if pool is None:
+      for task in tasks: yield function(task)
+      return
+   done = queue.Queue()
+   def submit(task):
+      pool.apply_async(function, (task,), callback=lambda value: done.put((True, value)), \
+                       error_callback=lambda error: done.put((False, error)))
+   running = 0
+   for task in itertools.islice(tasks, ahead):
+      submit(task)
+      running = running + 1
+   while running > 0:
+      (success, value) = done.get()
+      running = running - 1
+      if not success: raise value
+      for task in itertools.islice(tasks, 1):
+         submit(task)
+         running = running + 1
+      yield value
+
+#------------------------------------------------------------------------------------------------------------------
+#  Cluster of worker machines
+#------------------------------------------------------------------------------------------------------------------
+
+# Workers on other machines join over TCP with the command printed by cluster_start(). They run the explore and
+# calibration scripts themselves and each loads the FMU from the cache of extracted FMU files of its machine.
+# Tasks are sent as the name of the function and its arguments, so only functions defined in these scripts,
+# or in scripts given to the workers with --script, can be used.
+cluster = None
+
+def cluster_start(port=5555, workers=0, timeout=None, authkey=None, silence=60, retries=2, deadline=300):
+   """Start the coordinator on port, and wait for the number of workers given. The shared key is taken
+      from ~/.cache/BPL_TEST2_Batch/cluster.key that must be copied to the worker machines. The workers use
+      the backend, FMU type and FMU file of the notebook, and workers with another backend are refused.
+      A sweep gives up when no worker has been present for deadline seconds."""
+   global cluster
+   if cluster is None:
+      cluster = Coordinator(('', port), authkey, silence, retries, deadline, \
+                            {'backend': backend_name, 'flag_type': flag_type, 'fmu_model': os.path.basename(fmu_model)})
+      host, port = cluster.address
+      print('Start workers with: python BPL_TEST2_Batch_cluster.py worker --coordinator ' + host + ':' + str(port))
+   if workers > 0: cluster.wait_workers(workers, timeout)
+   return cluster
+
+def cluster_stop():
+   """Ask the workers to stop and close the coordinator"""
+   global cluster
+   if cluster is not None:
+      cluster.close()
+      cluster = None
+
+def cluster_status():
+   """Print the workers and the latest joins and leaves"""
+   if cluster is None:
+      print('Cluster not started')
+      return
+   for worker in cluster.status():
+      print(worker['host'], worker['pid'], worker['backend'], '- chunks done', worker['done'], \
+            '- busy' if worker['busy'] else '')
+   for (t, text, worker) in list(cluster.events)[-10:]:
+      print(time.strftime('%H:%M:%S', time.localtime(t)), text, worker if worker is not None else '')
+
+#------------------------------------------------------------------------------------------------------------------
+#  Sweep with time budget and failure isolation
+#------------------------------------------------------------------------------------------------------------------
+
+# A simulation that hangs in the solver or crashes the process stops pool.map() for good. In sweep() each task
+# is sent to a worker process of its own, and a worker that exceeds the time budget is killed, and one that
+# dies is noted, and both are replaced by a new worker with the FMU loaded again. Workers are also replaced
+# after recycle tasks since the FMU may crash after many simulations in the same process.
+
+def sweep_worker(connection, function):
+   """Loop of a sweep worker: load the FMU, tell that it is ready and evaluate tasks until None is received"""
+   model_load()
+   connection.send(('ready', None))
+   while True:
+      task = connection.recv()
+      if task is None: break
+      try:
+         connection.send(('ok', function(task)))
+      except Exception as error:
+         connection.send(('failed', type(error).__name__ + ': ' + str(error)))
+   connection.close()
+
+def sweep_worker_start(context, function):
+   connection, connection_worker = context.Pipe()
+   process = context.Process(target=sweep_worker, args=(connection_worker, function), daemon=True)
+   process.start()
+   connection_worker.close()
+   return {'process': process, 'connection': connection, 'ready': False, 'started': time.monotonic(), \
+           'index': None, 'deadline': None, 'count': 0}
+
+def sweep_worker_stop(worker, kill=False):
+   if kill:
+      worker['process'].kill()
+   else:
+      try:
+         worker['connection'].send(None)
+      except (BrokenPipeError, OSError):
+         pass
+   worker['process'].join()
+   worker['connection'].close()
+
+def sweep(function, tasks, timeout=None, processes=None, recycle=500, failed=np.nan, start_timeout=60):
+   """Evaluate function for each task in worker processes, where each task is given at most timeout seconds
+      of wall time. A task that raises an exception, exceeds the time or crashes the worker gets the value
+      failed and a reason, and the worker is replaced. Return a dictionary with results in the order of
+      tasks, failures as index and reason, and the wall time."""
+   tasks = list(tasks)
+   result = {'results': [failed]*len(tasks), 'failures': {}, 'time': 0.0}
+   if len(tasks) == 0: return result
+   start = time.perf_counter()
+   context = multiprocessing.get_context('fork')
+   multiprocessing.resource_tracker.ensure_running()
+   processes = min(processes if processes is not None else os.cpu_count(), len(tasks))
+   queue = collections.deque(range(len(tasks)))
+   workers = [sweep_worker_start(context, function) for _ in range(processes)]
+
+   def replace(worker, kill=False):
+      sweep_worker_stop(worker, kill)
+      workers[workers.index(worker)] = sweep_worker_start(context, function)
+
+   try:
+      while len(queue) > 0 or any([worker['index'] is not None for worker in workers]):
+         for worker in workers:
+            if worker['ready'] and worker['index'] is None and len(queue) > 0:
+               worker['index'] = queue.popleft()
+               worker['connection'].send(tasks[worker['index']])
+               worker['deadline'] = None if timeout is None else time.monotonic() + timeout
+         deadlines = [worker['deadline'] for worker in workers if worker['deadline'] is not None] + \
+                     [worker['started'] + start_timeout for worker in workers if not worker['ready']]
+         wait = None if deadlines == [] else max(min(deadlines) - time.monotonic(), 0)
+         connections = multiprocessing.connection.wait([worker['connection'] for worker in workers], wait)
+         for worker in list(workers):
+            if worker['connection'] in connections:
+               try:
+                  kind, value = worker['connection'].recv()
+               except (EOFError, OSError):
+                  if not worker['ready']:
+                     raise RuntimeError('Sweep worker could not start, exit code ' + str(worker['process'].exitcode))
+                  worker['process'].join()
+                  result['failures'][worker['index']] = 'worker died with exit code ' + str(worker['process'].exitcode)
+                  replace(worker, kill=True)
+                  continue
+               if kind == 'ready':
+                  worker['ready'] = True
+                  continue
+               if kind == 'ok':
+                  result['results'][worker['index']] = value
+               else:
+                  result['failures'][worker['index']] = value
+               worker['index'], worker['deadline'] = None, None
+               worker['count'] = worker['count'] + 1
+               if worker['count'] >= recycle and len(queue) > 0: replace(worker)
+            elif worker['deadline'] is not None and time.monotonic() > worker['deadline']:
+               result['failures'][worker['index']] = 'timeout after ' + str(timeout) + ' s'
+               replace(worker, kill=True)
+            elif not worker['ready'] and time.monotonic() > worker['started'] + start_timeout:
+               raise RuntimeError('Sweep worker did not start within ' + str(start_timeout) + ' s')
+   finally:
+      for worker in workers: sweep_worker_stop(worker, kill=worker['index'] is not None or not worker['ready'])
+   result['time'] = time.perf_counter() - start
+   return result
+
+#------------------------------------------------------------------------------------------------------------------
+#  Loss function
+#------------------------------------------------------------------------------------------------------------------
+
+def options_ncp(options, ncp):
+   """Copy of options with another number of communication points, named ncp for PyFMI and NCP for FMPy"""
+   options = options.copy()
+   for key in list(options.keys()):
+      if key in ['ncp', 'NCP']: options[key] = ncp
+   return options
+
+def data_arrays(data, dataLocation=dataLocation):
+   """Convert data given as DataFrame or dictionary with time, X and S to a dictionary of arrays"""
+   return {key: np.asarray(data[key], dtype=float) for key in ['time'] + list(dataLocation.keys())}
+
+def data_hash(*values):
+   """Short hash of data, options and other values, to check that a checkpoint belongs to the same problem"""
+   h = hashlib.sha256()
+   def update(value):
+      if isinstance(value, dict):
+         for key in sorted(value.keys(), key=str):
+            h.update(repr(key).encode())
+            update(value[key])
+      elif isinstance(value, (list, tuple)):
+         h.update(b'[')
+         for item in value: update(item)
+         h.update(b']')
+      elif isinstance(value, np.ndarray) or hasattr(value, 'to_numpy'):
+         array = np.ascontiguousarray(np.asarray(value))
+         h.update((str(array.shape) + str(array.dtype)).encode())
+         h.update(array.tobytes() if array.dtype != object else repr(array.tolist()).encode())
+      elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+         h.update(repr(float(value)).encode())
+      elif hasattr(value, '__dict__') and not callable(value):
+         update(vars(value))
+      else:
+         h.update(repr(value).encode())
+   for value in values: update(value)
+   return h.hexdigest()[:16]
+
+def data_stop_time(data, options):
+   """Last time of data if options from opts_stop() ask for it, otherwise None"""
+   stop = options.get('stop')
+   if stop is None or not stop['data']: return None
+   if isinstance(data, SeriesLoss): return max([np.max(data.data[key]['time']) for key in data.data.keys()])
+   return float(np.max(data['time']))
+
+def residuals(x, parEstim, data, simulationTime=simulationTime, options=opts_fast, parValue=parValue, \
+              parLocation=parLocation, dataLocation=dataLocation):
+   """Simulate with the parameters x for parEstim and return a dictionary of residuals for X and S.
+      The simulation is done with model_simulate() and can be run in the notebook or in the workers.
+      A simulation that does not cover the times of data is an error, rather than NaN residuals."""
+   parValueLocal = dict(parValue)
+   for i, p in enumerate(parEstim): parValueLocal[p] = x[i]
+   res = model_simulate({parLocation[k]:parValueLocal[k] for k in parValueLocal.keys()}, simulationTime, options, \
+                        output=list(dataLocation.values()), stop_time=data_stop_time(data, options))
+   simulated = {key: np.interp(data['time'], res['time'], res[dataLocation[key]]) for key in dataLocation.keys()}
+   if any([np.any(np.isnan(simulated[key])) for key in simulated.keys()]):
+      raise ValueError('Simulation result is NaN at times of data up to ' + str(np.max(data['time'])))
+   return {key: data[key] - simulated[key] for key in dataLocation.keys()}
+
+def loss(r):
+   """Loss function V as in the notebook, i.e. sum of the norm of residuals for X and S"""
+   return sum([np.linalg.norm(r[key]) for key in r.keys()])
+
+def loglik(r, eps=1e-12):
+   """Minus two times log-likelihood for Gaussian residuals with a separate and unknown variance
+      for X and S, where the variances are replaced by their maximum likelihood estimate."""
+   return sum([len(r[key])*np.log(max(np.sum(r[key]**2)/len(r[key]), eps)) for key in r.keys()])
+
+def criterion_value(r, criterion='loss'):
+   """From residuals the loss function V for criterion 'loss', minus two log-likelihood with unknown
+      variances for 'loglik', or with known standard deviations given as a dictionary for X and S"""
+   if isinstance(criterion, dict):
+      return sum([np.sum((r[key]/criterion[key])**2) for key in r.keys()])
+   elif criterion == 'loglik':
+      return loglik(r)
+   return loss(r)
+
+def objective_data(x, parEstim, data, simulationTime=simulationTime, options=opts_fast, parValue=parValue, \
+                   criterion='loss'):
+   """Loss function V for the parameters x, corresponds to objective() in the notebook.
+      The data can also be a SeriesLoss for large time series. Other criteria as for criterion_value()."""
+   if isinstance(data, SeriesLoss):
+      if criterion != 'loss': raise ValueError('SeriesLoss gives only the criterion loss')
+      parValueLocal = dict(parValue)
+      for i, p in enumerate(parEstim): parValueLocal[p] = x[i]
+      res = model_simulate({parLocation[k]:parValueLocal[k] for k in parValueLocal.keys()}, simulationTime, options, \
+                           output=list(data.location.values()), stop_time=data_stop_time(data, options))
+      return data(res)
+   return criterion_value(residuals(x, parEstim, data, simulationTime, options, parValue), criterion)
+
+class SeriesLoss:
+   """Loss function for large and irregular time series, e.g. online sensors, prepared once for many evaluations.
+      The series is a dictionary with (time, values) for each measured variable in location, or a DataFrame
+      with column time. Weights per series are a number or an array for each sample. Samples can be averaged
+      in bins of width bin_width, or decimated to every k-th, before use. The loss is 'norm' as V in the
+      notebook, 'ssr' for weighted sum of squares, 'huber' with the limit delta, or 'relative' that is the
+      norm of residuals relative to the measured values. Each evaluation interpolates the simulation result
+      into preallocated buffers, and interpolation indices are kept as long as the simulation time grid is the same."""
+
+   def __init__(self, series, location=dataLocation, weights={}, loss='norm', delta=1.0, bin_width=None, \
+                decimate=1, eps=1e-6):
+      if loss not in ['norm', 'ssr', 'huber', 'relative']: raise ValueError('Unknown loss ' + str(loss))
+      self.location = {key: location[key] for key in location.keys() if key in series.keys()}
+      self.loss = loss
+      self.delta = delta
+      self.data = {}
+      for key in self.location.keys():
+         if isinstance(series[key], tuple):
+            t, y = series[key]
+         else:
+            t, y = series['time'], series[key]
+         t, y = np.asarray(t, dtype=float), np.asarray(y, dtype=float)
+         w = np.broadcast_to(np.asarray(weights.get(key, 1.0), dtype=float), t.shape)
+         keep = np.isfinite(t) & np.isfinite(y)
+         t, y, w = t[keep], y[keep], w[keep]
+         index = np.argsort(t, kind='stable')
+         t, y, w = t[index], y[index], w[index]
+         if bin_width is not None:
+            bins = np.floor((t - t[0])/bin_width).astype(int)
+            bins, inverse, count = np.unique(bins, return_inverse=True, return_counts=True)
+            t = np.bincount(inverse, weights=t)/count
+            y = np.bincount(inverse, weights=y)/count
+            w = np.bincount(inverse, weights=w)
+         elif decimate > 1:
+            t, y, w = t[::decimate], y[::decimate], w[::decimate]
+         if loss == 'relative': w = w/np.maximum(np.abs(y), eps)**2
+         self.data[key] = {'time': t, 'values': y, 'weights': np.ascontiguousarray(w), \
+                           'buffer': np.empty(len(t)), 'buffer_next': np.empty(len(t))}
+      self.grid = None
+      self.interpolation = {}
+
+   def __len__(self):
+      return sum([len(self.data[key]['time']) for key in self.data.keys()])
+
+   def prepare(self, time):
+      """Indices and fractions for linear interpolation from the simulation time grid to the data times"""
+      if self.grid is not None and len(self.grid) == len(time) and np.array_equal(self.grid, time): return
+      self.grid = np.array(time, dtype=float)
+      for key in self.data.keys():
+         index = np.clip(np.searchsorted(self.grid, self.data[key]['time'], side='right') - 1, 0, len(self.grid) - 2)
+         step = self.grid[index+1] - self.grid[index]
+         fraction = np.where(step > 0, (self.data[key]['time'] - self.grid[index])/np.where(step > 0, step, 1), 0)
+         fraction = np.clip(fraction, 0, 1)
+         self.interpolation[key] = (index, np.where(fraction > 0, index + 1, index), fraction)
+
+   def residuals(self, res):
+      """Residuals data minus simulation for each series, the arrays are buffers reused by the next call"""
+      self.prepare(res['time'])
+      r = {}
+      for key in self.data.keys():
+         index, index_next, fraction = self.interpolation[key]
+         y = np.asarray(res[self.location[key]], dtype=float)
+         buffer, buffer_next = self.data[key]['buffer'], self.data[key]['buffer_next']
+         np.take(y, index, out=buffer)
+         np.take(y, index_next, out=buffer_next)
+         np.subtract(buffer_next, buffer, out=buffer_next)
+         np.multiply(buffer_next, fraction, out=buffer_next)
+         np.add(buffer, buffer_next, out=buffer)
+         np.subtract(self.data[key]['values'], buffer, out=buffer)
+         r[key] = buffer
+      return r
+
+   def __call__(self, res):
+      """Loss function for a simulation result"""
+      V = 0
+      for key, r in self.residuals(res).items():
+         w = self.data[key]['weights']
+         if self.loss == 'huber':
+            a = np.abs(r, out=r)
+            q = np.minimum(a, self.delta, out=self.data[key]['buffer_next'])
+            V = V + np.dot(w, 0.5*q*q + self.delta*(a - q))
+         else:
+            ssr = np.dot(w, r*r)
+            V = V + (ssr if self.loss == 'ssr' else np.sqrt(ssr))
+      return V
+
+def parcheck_batch(rows, parEstim, parValue=parValue, parCheck=parCheck):
+   """Evaluate parCheck for all rows of parameters at once, where parValue holds arrays for parEstim.
+      A check that does not evaluate element-wise is evaluated row by row."""
+   rows = np.atleast_2d(rows)
+   ok = np.ones(len(rows), dtype=bool)
+   parValueArray = {key: parValue[key] for key in parValue.keys()}
+   for i, p in enumerate(parEstim): parValueArray[p] = rows[:,i]
+   for check in parCheck:
+      try:
+         result = np.broadcast_to(eval(check, globals(), {'parValue': parValueArray}), (len(rows),))
+      except (ValueError, TypeError):
+         result = np.zeros(len(rows), dtype=bool)
+         for k, x in enumerate(rows):
+            parValueLocal = dict(parValue)
+            for i, p in enumerate(parEstim): parValueLocal[p] = x[i]
+            result[k] = eval(check, globals(), {'parValue': parValueLocal})
+      ok = ok & result
+   return ok
+
+def parcheck_set(parSet, parValue=parValue, parCheck=parCheck):
+   """Whether parCheck holds for parValue updated with the dictionary parSet, where None does not hold"""
+   if parSet is None: return False
+   parValueLocal = dict(parValue); parValueLocal.update(parSet)
+   return all([bool(eval(check, globals(), {'parValue': parValueLocal})) for check in parCheck])
+
+# Parameters and reason of simulations that failed in calibrate() and objective_batch(), latest last
+objective_failures = []
+
+def objective_safe(x, parEstim, data, simulationTime=simulationTime, options=opts_fast, parValue=parValue, \
+                   criterion='loss'):
+   """Loss function V as objective_data() but infinite if the simulation fails, with the reason kept in
+      objective_failures, so that an optimizer continues past parameters where the solver fails.
+      Give options from opts_limit() for a time budget of each simulation."""
+   try:
+      return objective_data(x, parEstim, data, simulationTime, options, parValue, criterion)
+   except Exception as error:
+      objective_failures.append({'x': [float(v) for v in x], 'reason': type(error).__name__ + ': ' + str(error)})
+      return np.inf
+
+def objective_row(task):
+   """Loss function V for one row of parameters, used by sweep()"""
+   return objective_data(*task)
+
+def objective_chunk(task):
+   """Loss function V for a chunk of parameter rows, infinite if a simulation fails"""
+   (rows, parEstim, data, simulationTime, options, parValue, criterion) = task
+   V = np.full(len(rows), np.inf)
+   for k, x in enumerate(rows):
+      try:
+         V[k] = objective_data(x, parEstim, data, simulationTime, options, parValue, criterion)
+      except Exception:
+         pass
+   return V
+
+def objective_batch(rows, parEstim, data, simulationTime=simulationTime, options=opts_fast, parValue=parValue, \
+                    parCheck=parCheck, timeout=None, criterion='loss'):
+   """Loss function V for all rows as one batch split evenly over the workers, or other criterion as for
+      criterion_value(). Rows that do not satisfy parCheck get infinite loss without simulation.
+      With timeout each row is evaluated by sweep() with that time budget, and failed rows get
+      infinite loss with the reason kept in objective_failures."""
+   rows = np.atleast_2d(rows)
+   V = np.full(len(rows), np.inf)
+   index = np.flatnonzero(parcheck_batch(rows, parEstim, parValue, parCheck))
+   if len(index) > 0 and timeout is not None:
+      tasks = [(rows[k], parEstim, data, simulationTime, options, parValue, criterion) for k in index]
+      result = sweep(objective_row, tasks, timeout, pool_size() if pool is not None else None, failed=np.inf)
+      V[index] = result['results']
+      for i, reason in sorted(result['failures'].items()):
+         objective_failures.append({'x': [float(v) for v in rows[index[i]]], 'reason': reason})
+   elif len(index) > 0:
+      chunks = np.array_split(index, min(pool_size(), len(index)))
+      tasks = [(rows[chunk], parEstim, data, simulationTime, options, parValue, criterion) for chunk in chunks]
+      V[np.concatenate(chunks)] = np.concatenate(pool_map(objective_chunk, tasks))
+   return V
+
+class ParTransform:
+   """Transform between parameters x of parEstim, as given to par(), and internal parameters z seen by the
+      optimizer. The kind for each parameter is 'scaled' to [0, 1] within the bounds, 'log' that is the
+      logarithm scaled to [0, 1] within the bounds, 'logit' that is unbounded and keeps x within the bounds,
+      or None for no transform. Kinds are given as a dictionary, e.g. {'Y': 'scaled', 'Ks': 'log'}, or as
+      one kind for all."""
+
+   kinds = ['scaled', 'log', 'logit', None]
+
+   def __init__(self, parEstim, parBounds, kind='scaled'):
+      self.parEstim = list(parEstim)
+      self.kind = [kind.get(p) if isinstance(kind, dict) else kind for p in self.parEstim]
+      for k in self.kind:
+         if k not in self.kinds: raise ValueError('Unknown transform ' + str(k) + ', use scaled, log, logit or None')
+      self.lower = np.array([bound[0] for bound in parBounds], dtype=float)
+      self.upper = np.array([bound[1] for bound in parBounds], dtype=float)
+      for i, k in enumerate(self.kind):
+         if k == 'log' and self.lower[i] <= 0: raise ValueError('Transform log needs positive bounds for ' + self.parEstim[i])
+
+   def to_internal(self, x):
+      """Internal parameters z from parameters x"""
+      x = np.asarray(x, dtype=float)
+      z = x.copy()
+      for i, k in enumerate(self.kind):
+         lower, upper = self.lower[i], self.upper[i]
+         if k == 'scaled':
+            z[..., i] = (x[..., i] - lower)/(upper - lower)
+         elif k == 'log':
+            z[..., i] = np.log(x[..., i]/lower)/np.log(upper/lower)
+         elif k == 'logit':
+            u = np.clip((x[..., i] - lower)/(upper - lower), 1e-9, 1 - 1e-9)
+            z[..., i] = np.log(u/(1 - u))
+      return z
+
+   def to_par(self, z):
+      """Parameters x from internal parameters z"""
+      z = np.asarray(z, dtype=float)
+      x = z.copy()
+      for i, k in enumerate(self.kind):
+         lower, upper = self.lower[i], self.upper[i]
+         if k == 'scaled':
+            x[..., i] = lower + (upper - lower)*z[..., i]
+         elif k == 'log':
+            x[..., i] = lower*(upper/lower)**z[..., i]
+         elif k == 'logit':
+            x[..., i] = lower + (upper - lower)/(1 + np.exp(-z[..., i]))
+      return x
+
+   def simplex(self, z, step=0.1):
+      """Initial simplex for Nelder-Mead at internal parameters z with the same step for all parameters, as
+      fraction of the bounds, and directed away from the nearest bound"""
+      z = np.asarray(z, dtype=float)
+      rows = [z]
+      for i, k in enumerate(self.kind):
+         h = step*(4.0 if k == 'logit' else (self.upper[i] - self.lower[i] if k is None else 1.0))
+         upper = self.upper[i] if k is None else 1.0
+         if k != 'logit' and z[i] + h > upper: h = -h
+         rows.append(z + h*np.eye(len(z))[i])
+      return np.vstack(rows)
+
+   def bounds(self):
+      """Bounds of the internal parameters, where logit is unbounded"""
+      return [(None, None) if k == 'logit' else ((0.0, 1.0) if k in ['scaled', 'log'] else (self.lower[i], self.upper[i])) \
+              for i, k in enumerate(self.kind)]
+
+def objective_transformed(z, transform, parEstim, data, simulationTime, options, parValue):
+   """Loss function V for internal parameters z of the transform"""
+   return objective_safe(transform.to_par(z), parEstim, data, simulationTime, options, parValue)
+
+def calibrate(x_0, parEstim, parBounds, data, simulationTime=simulationTime, method='Nelder-Mead', \
+              options=opts_fast, parValue=parValue, simplex_step=None, xatol=1e-4, fatol=1e-4, initial_simplex=None, \
+              popsize=15, maxiter=100, seed=None, polish=True, timeout=None, transform=None):
+   """Minimize the loss function V as in the notebook but without plots and return the result from minimize().
+      With simplex_step, e.g. 0.05, the initial simplex is that fraction of the parameter ranges, which
+      is a good choice for Nelder-Mead when x_0 is a warm start close to the minimum. 
+      Alternatively an initial_simplex can be given. The data can also be a SeriesLoss.
+      With method 'differential_evolution' the global search is within parBounds, where x_0 is one of
+      the initial population of popsize times the number of parameters. Each generation is evaluated
+      as one batch in the pool, and with polish the result is refined with Nelder-Mead.
+      Parameters where the simulation fails get infinite loss and are noted in objective_failures, and
+      with timeout each simulation of differential evolution is given that time budget by sweep().
+      With transform, a ParTransform or its kind, e.g. {'Y': 'scaled', 'qSmax': 'scaled', 'Ks': 'log'}, the
+      optimizer works on the internal parameters while x_0, initial_simplex and result.x are as for par(),
+      and the initial simplex of Nelder-Mead has the step simplex_step, default 0.1, of the scaled bounds.
+      Differential evolution samples within parBounds and does not use the transform."""
+   if not isinstance(data, SeriesLoss): data = data_arrays(data)
+   if transform is not None and method != 'differential_evolution':
+      if not isinstance(transform, ParTransform): transform = ParTransform(parEstim, parBounds, transform)
+      z_0 = transform.to_internal(x_0)
+      minimize_options = {'xatol': xatol, 'fatol': fatol} if method == 'Nelder-Mead' else {}
+      if method == 'Nelder-Mead' and initial_simplex is not None:
+         minimize_options['initial_simplex'] = transform.to_internal(initial_simplex)
+      elif method == 'Nelder-Mead':
+         minimize_options['initial_simplex'] = transform.simplex(z_0, 0.1 if simplex_step is None else simplex_step)
+      result = scipy.optimize.minimize(objective_transformed, x0=z_0, method=method, bounds=transform.bounds(), \
+                                       args=(transform, parEstim, data, simulationTime, options, parValue), \
+                                       options=minimize_options)
+      result.z = result.x
+      result.x = transform.to_par(result.z)
+      return result
+   if method == 'differential_evolution':
+      nfev = [0]
+      def objective_generation(X):
+         nfev[0] = nfev[0] + X.shape[1]
+         return objective_batch(X.T, parEstim, data, simulationTime, options, parValue, timeout=timeout)
+      result = scipy.optimize.differential_evolution(objective_generation, parBounds, x0=x_0, popsize=popsize, \
+                                                     maxiter=maxiter, seed=seed, polish=False, \
+                                                     vectorized=True, updating='deferred')
+      result.nfev = nfev[0]
+      if polish:
+         local = calibrate(result.x, parEstim, parBounds, data, simulationTime, options=options, \
+                           parValue=parValue, simplex_step=0.02, xatol=xatol, fatol=fatol)
+         if local.fun < result.fun: result.x, result.fun = local.x, local.fun
+         result.nfev = result.nfev + local.nfev
+      return result
+   minimize_options = {}
+   if method == 'Nelder-Mead':
+      minimize_options = {'xatol': xatol, 'fatol': fatol}
+      if initial_simplex is not None:
+         minimize_options['initial_simplex'] = initial_simplex
+      elif simplex_step is not None:
+         x_0 = np.asarray(x_0, dtype=float)
+         step = simplex_step*np.array([parBounds[k][1]-parBounds[k][0] for k in range(len(parBounds))])
+         minimize_options['initial_simplex'] = np.vstack([x_0] + [x_0 + step[k]*np.eye(len(x_0))[k] \
+                                                                  for k in range(len(x_0))])
+   return scipy.optimize.minimize(objective_safe, x0=x_0, args=(parEstim, data, simulationTime, options, parValue), \
+                                  method=method, bounds=parBounds, options=minimize_options)
+
+def transform_benchmark_run(task):
+   """Nelder-Mead with one transform from one start value, return the trace of loss and the estimate"""
+   (kind, x, parEstim, parBounds, data, simulationTime, xatol, fatol, options, parValue) = task
+   transform = ParTransform(parEstim, parBounds, kind)
+   trace = []
+   def f(z):
+      trace.append(objective_safe(transform.to_par(z), parEstim, data, simulationTime, options, parValue))
+      return trace[-1]
+   minimize_options = {'xatol': xatol, 'fatol': fatol}
+   if kind is not None: minimize_options['initial_simplex'] = transform.simplex(transform.to_internal(x))
+   result = scipy.optimize.minimize(f, transform.to_internal(x), method='Nelder-Mead', bounds=transform.bounds(), \
+                                    options=minimize_options)
+   return (np.array(trace), transform.to_par(result.x))
+
+def transform_benchmark(x_0, parEstim, parBounds, data, transforms={'none': None, 'scaled': 'scaled', 'log': 'log', \
+                        'logit': 'logit'}, simulationTime=simulationTime, rtol=1e-3, xatol=1e-4, fatol=1e-4, \
+                        options=opts_fast, parValue=parValue):
+   """Number of evaluations of the loss function for Nelder-Mead to reach the same loss from each of the start
+      values in the list x_0, for each kind of ParTransform in transforms, where none is the default of
+      calibrate() with the simplex of scipy. The target for a start value is
+      the lowest loss found with any transform, plus the fraction rtol. Print for each transform the number
+      of start values where the target is reached, the mean number of evaluations to reach it and in total,
+      and the ratio to the first transform where both reached the target, if any. Return a table with one row
+      for each transform and start value. The runs are done in the worker pool if started, preferably with
+      pool_start(recycle=1) for a fresh FMU in each run."""
+   if not isinstance(data, SeriesLoss): data = data_arrays(data)
+   keys = [(name, j) for name in transforms.keys() for j in range(len(x_0))]
+   tasks = [(transforms[name], x_0[j], parEstim, parBounds, data, simulationTime, xatol, fatol, options, parValue) \
+            for (name, j) in keys]
+   traces = dict(zip(keys, pool_map(transform_benchmark_run, tasks)))
+   table = []
+   for j in range(len(x_0)):
+      target = min([np.min(traces[(name, j)][0]) for name in transforms.keys()])*(1 + rtol)
+      for name in transforms.keys():
+         trace, x = traces[(name, j)]
+         reached = np.flatnonzero(trace <= target)
+         table.append({'transform': name, 'start': j, 'nfev_target': int(reached[0]) + 1 if len(reached) > 0 else None, \
+                       'nfev': len(trace), 'loss': float(np.min(trace)), 'x': [float(v) for v in x]})
+   reference = list(transforms.keys())[0]
+   nfev = {(row['transform'], row['start']): row['nfev_target'] for row in table}
+   for name in transforms.keys():
+      reached = [nfev[(name, j)] for j in range(len(x_0)) if nfev[(name, j)] is not None]
+      both = [j for j in range(len(x_0)) if nfev[(name, j)] is not None and nfev[(reference, j)] is not None]
+      print(name, ': target reached from', len(reached), 'of', len(x_0), 'start values with', \
+            np.round(np.mean(reached), 1) if reached != [] else '-', 'evaluations to target,', \
+            np.round(np.mean([row['nfev'] for row in table if row['transform'] == name]), 1), 'evaluations in total', \
+            end='')
+      if name != reference and both != []:
+         ratio = np.mean([nfev[(name, j)] for j in both])/np.mean([nfev[(reference, j)] for j in both])
+         print(', evaluations to target', np.round(ratio, 2), 'of', reference, 'where both reached', end='')
+      print()
+   return table
+
+#------------------------------------------------------------------------------------------------------------------
+#  Profile likelihood
+#------------------------------------------------------------------------------------------------------------------
+
+def profile_chain(task):
+   """Step along the grid values of one parameter and re-optimize the other parameters.
+      Each grid point is warm-started from the previous one and with a small initial simplex.
+      Return the chain and the failed simulations, which get infinite criterion."""
+   (i, grid, x_opt, parEstim, parBounds, data, simulationTime, options, parValue, xatol) = task
+   others = [k for k in range(len(parEstim)) if k != i]
+   x = np.array(x_opt, dtype=float)
+   chain = []
+   start = len(objective_failures)
+   for value in grid:
+      x[i] = value
+      if len(others) > 0:
+         def f(z):
+            x[others] = z
+            return objective_safe(x, parEstim, data, simulationTime, options, parValue, 'loglik')
+         z_0 = x[others].copy()
+         step = [0.05*(parBounds[k][1]-parBounds[k][0]) for k in others]
+         simplex = np.vstack([z_0] + [z_0 + step[j]*np.eye(len(others))[j] for j in range(len(others))])
+         res = scipy.optimize.minimize(f, x0=z_0, method='Nelder-Mead', bounds=[parBounds[k] for k in others], \
+                                       options={'initial_simplex': simplex, 'xatol': xatol, 'fatol': 1e-4})
+         x[others] = res.x
+         chain.append((value, res.fun, x.copy(), res.nfev))
+      else:
+         chain.append((value, objective_safe(x, parEstim, data, simulationTime, options, parValue, 'loglik'), \
+                       x.copy(), 1))
+   failures = objective_failures[start:]
+   del objective_failures[start:]
+   return chain, failures
+
+def profile(x_opt, parEstim, parBounds, data, simulationTime=simulationTime, npoints=21, alpha=0.05, \
+            options=opts_fast, parValue=parValue, xatol=1e-4, timeout=None):
+   """Profile likelihood for each of the parameters in parEstim around the estimate x_opt, e.g. result.x.
+      The grid is split at x_opt in one chain upwards and one downwards for each parameter, and
+      all the chains are run in parallel if the pool is started with pool_start().
+      With timeout each simulation is limited to that wall time by opts_limit(). Failed simulations
+      get infinite criterion and are noted in objective_failures.
+      Return a dictionary with profiles and confidence intervals for the parameters."""
+
+   data = data_arrays(data)
+   parValue = dict(parValue)
+   if timeout is not None: options = opts_limit(options, timeout)
+
+   # Create chains that start from x_opt
+   tasks = []
+   for i in range(len(parEstim)):
+      grid = np.linspace(parBounds[i][0], parBounds[i][1], npoints)
+      grid_up = [x_opt[i]] + [g for g in grid if g > x_opt[i]]
+      grid_down = sorted([g for g in grid if g < x_opt[i]], reverse=True)
+      for chain_grid in [grid_up, grid_down]:
+         if len(chain_grid) > 0:
+            tasks.append((i, chain_grid, x_opt, parEstim, parBounds, data, simulationTime, options, parValue, xatol))
+   chains = []
+   for chain, failures in pool_map(profile_chain, tasks):
+      chains.append(chain)
+      objective_failures.extend(failures)
+
+   # Collect the chains for each parameter
+   prof = {}
+   for task, chain in zip(tasks, chains):
+      p = parEstim[task[0]]
+      if p not in prof.keys(): prof[p] = []
+      prof[p] = prof[p] + chain
+   V_min = min([point[1] for p in prof.keys() for point in prof[p]])
+   threshold = scipy.stats.chi2.ppf(1-alpha, 1)
+
+   # Confidence interval where the profile crosses the threshold, otherwise the bound is given
+   result = {'threshold': threshold, 'alpha': alpha, 'V_min': V_min, 'nfev': 0}
+   for i, p in enumerate(parEstim):
+      points = sorted(prof[p], key=lambda point: point[0])
+      value = np.array([point[0] for point in points])
+      dV = np.array([point[1] for point in points]) - V_min
+      result['nfev'] = result['nfev'] + sum([point[3] for point in points])
+      k_opt = int(np.argmin(dV))
+      ci = [parBounds[i][0], parBounds[i][1]]
+      for k in range(k_opt, 0, -1):
+         if dV[k-1] > threshold:
+            ci[0] = np.interp(threshold, [dV[k], dV[k-1]], [value[k], value[k-1]])
+            break
+      for k in range(k_opt, len(value)-1):
+         if dV[k+1] > threshold:
+            ci[1] = np.interp(threshold, [dV[k], dV[k+1]], [value[k], value[k+1]])
+            break
+      result[p] = {'value': value, 'dV': dV, 'x': np.array([point[2] for point in points]), 'ci': ci}
+   return result
+
+def profile_plot(prof, parEstim):
+   """Plot the profile likelihood with threshold and confidence interval for each parameter"""
+   plt.figure()
+   for i, p in enumerate(parEstim):
+      ax = plt.subplot(1, len(parEstim), i+1)
+      ax.plot(prof[p]['value'], prof[p]['dV'], 'b-o', markersize=3)
+      ax.axhline(prof['threshold'], color='r', linestyle='--')
+      for bound in prof[p]['ci']: ax.axvline(bound, color='k', linestyle=':')
+      ax.set_title(p)
+      ax.set_xlabel(p)
+      ax.grid()
+      if i == 0: ax.set_ylabel('Profile likelihood increase')
+   plt.tight_layout()
+   plt.show()
+
+#------------------------------------------------------------------------------------------------------------------
+#  Streaming statistics
+#------------------------------------------------------------------------------------------------------------------
+
+class StreamQuantile:
+   """Estimate of the quantile p for each element of a stream of arrays without storing them.
+      The P-square algorithm by Jain and Chlamtac (1985) with five markers, vectorized over the elements."""
+
+   def __init__(self, p, shape):
+      self.p = p
+      self.shape = shape
+      self.count = 0
+      self.q = np.zeros((5,) + tuple(shape))
+      self.n = np.zeros((5,) + tuple(shape))
+      self.n_desired = np.array([0, 2*p, 4*p, 2+2*p, 4])
+      self.dn = np.array([0, p/2, p, (1+p)/2, 1])
+
+   def update(self, x):
+      x = np.asarray(x, dtype=float)
+      if self.count < 5:
+         self.q[self.count] = x
+         self.count = self.count + 1
+         if self.count == 5:
+            self.q = np.sort(self.q, axis=0)
+            self.n = np.zeros(self.q.shape) + np.arange(5).reshape((5,) + (1,)*len(self.shape))
+         return
+      self.count = self.count + 1
+      q, n = self.q, self.n
+      q[0] = np.minimum(q[0], x)
+      q[4] = np.maximum(q[4], x)
+      k = (x >= q[1]).astype(int) + (x >= q[2]) + (x >= q[3])
+      for i in range(1, 5): n[i] += (i > k)
+      self.n_desired = self.n_desired + self.dn
+      for i in range(1, 4):
+         d = self.n_desired[i] - n[i]
+         move = ((d >= 1) & (n[i+1]-n[i] > 1)) | ((d <= -1) & (n[i-1]-n[i] < -1))
+         if not np.any(move): continue
+         d = np.sign(d)*move
+         q_par = q[i] + d/(n[i+1]-n[i-1])*((n[i]-n[i-1]+d)*(q[i+1]-q[i])/(n[i+1]-n[i]) \
+                                          + (n[i+1]-n[i]-d)*(q[i]-q[i-1])/(n[i]-n[i-1]))
+         inside = (q[i-1] < q_par) & (q_par < q[i+1])
+         j = np.where(d > 0, i+1, i-1)
+         q_j = np.choose(j-i+1, [q[i-1], q[i], q[i+1]])
+         n_j = np.choose(j-i+1, [n[i-1], n[i], n[i+1]])
+         q_lin = q[i] + d*(q_j - q[i])/np.where(n_j == n[i], 1, n_j - n[i])
+         q[i] = np.where(move, np.where(inside, q_par, q_lin), q[i])
+         n[i] = n[i] + d
+
+   def value(self):
+      if self.count < 5:
+         return np.quantile(self.q[:self.count], self.p, axis=0)
+      return self.q[2].copy()
+
+class StreamStats:
+   """Mean, covariance and quantiles for a stream of vectors, e.g. parameter estimates, without storing them.
+      Mean and covariance are updated with Welford's algorithm one batch of rows at a time."""
+
+   def __init__(self, dim, quantiles=[0.025, 0.5, 0.975]):
+      self.count = 0
+      self.mean = np.zeros(dim)
+      self.M2 = np.zeros((dim, dim))
+      self.quantiles = {p: StreamQuantile(p, (dim,)) for p in quantiles}
+
+   def update(self, rows):
+      rows = np.atleast_2d(np.asarray(rows, dtype=float))
+      m = len(rows)
+      if m == 0: return
+      mean_rows = rows.mean(axis=0)
+      delta = mean_rows - self.mean
+      self.M2 = self.M2 + (rows-mean_rows).T @ (rows-mean_rows) + np.outer(delta, delta)*self.count*m/(self.count+m)
+      self.mean = self.mean + delta*m/(self.count+m)
+      self.count = self.count + m
+      for row in rows:
+         for p in self.quantiles.keys(): self.quantiles[p].update(row)
+
+   def cov(self):
+      return self.M2/max(self.count-1, 1)
+
+   def quantile(self, p):
+      return self.quantiles[p].value()
+
+#------------------------------------------------------------------------------------------------------------------
+#  Bootstrap
+#------------------------------------------------------------------------------------------------------------------
+
+def bootstrap_chunk(task):
+   """Calibrate the model for a chunk of bootstrap replicates of data, each warm-started from x_opt.
+      Return rows with estimated parameters, loss function V and number of evaluations."""
+   (seeds, method, x_opt, parEstim, parBounds, data, fit, r, simulationTime, options, parValue, simplex_step) = task
+   rows = []
+   for seed in seeds:
+      rng = np.random.default_rng(seed)
+      if method == 'residuals':
+         data_b = {'time': data['time']}
+         for key in r.keys(): data_b[key] = fit[key] + rng.choice(r[key], size=len(r[key]))
+      else:
+         index = rng.integers(0, len(data['time']), len(data['time']))
+         data_b = {key: data[key][index] for key in data.keys()}
+      res = calibrate(x_opt, parEstim, parBounds, data_b, simulationTime, options=options, parValue=parValue, \
+                      simplex_step=simplex_step)
+      rows.append(list(res.x) + [res.fun, res.nfev])
+   return np.array(rows)
+
+def bootstrap(x_opt, parEstim, parBounds, data, simulationTime=simulationTime, n=1000, method='residuals', \
+              quantiles=[0.025, 0.5, 0.975], seed=None, chunksize=8, keep=False, options=opts_fast, \
+              parValue=parValue, simplex_step=0.05):
+   """Bootstrap of the parameter estimate x_opt, e.g. result.x, where method is 'residuals' or 'rows' of data.
+      The replicates are calibrated in the worker pool or cluster if started and the estimates are
+      streamed into StreamStats as chunks are finished. Return a dictionary with the statistics and
+      confidence intervals and, if keep is True, also all the estimates."""
+
+   data = data_arrays(data)
+   parValue = dict(parValue)
+   r = residuals(x_opt, parEstim, data, simulationTime, options, parValue)
+   fit = {key: data[key] - r[key] for key in r.keys()}
+
+   # Chunks of replicates with independent random streams
+   seeds = np.random.SeedSequence(seed).spawn(n)
+   tasks = [(seeds[k:k+chunksize], method, x_opt, parEstim, parBounds, data, fit, r, simulationTime, options, \
+             parValue, simplex_step) for k in range(0, n, chunksize)]
+   chunks = pool_imap_unordered(bootstrap_chunk, tasks)
+
+   # Stream the estimates into the statistics
+   stats = StreamStats(len(parEstim), quantiles)
+   estimates = []
+   nfev = 0
+   for rows in chunks:
+      stats.update(rows[:, :len(parEstim)])
+      nfev = nfev + int(np.sum(rows[:, -1]))
+      if keep: estimates.append(rows)
+
+   result = {'n': stats.count, 'nfev': nfev, 'mean': stats.mean, 'cov': stats.cov(), \
+             'std': np.sqrt(np.diag(stats.cov())), 'stats': stats}
+   for p in quantiles: result[p] = stats.quantile(p)
+   result['ci'] = {parEstim[i]: [stats.quantile(min(quantiles))[i], stats.quantile(max(quantiles))[i]] \
+                   for i in range(len(parEstim))}
+   if keep: result['estimates'] = np.vstack(estimates)
+   return result
+
+#------------------------------------------------------------------------------------------------------------------
+#  Bayesian calibration with MCMC
+#------------------------------------------------------------------------------------------------------------------
+
+def logpost_batch(rows, parEstim, parBounds, data, sigma, simulationTime, options, parValue, timeout=None):
+   """Log-posterior for all rows as one batch by objective_batch(), where the prior is uniform within parBounds.
+      With sigma None the unknown variances of X and S are integrated out with a Jeffreys prior,
+      and otherwise sigma is a dictionary with the standard deviation of the measurements.
+      Rows outside parBounds are rejected directly without simulation, and with timeout each simulation
+      is given that time budget by sweep()."""
+   lower = np.array([bound[0] for bound in parBounds])
+   upper = np.array([bound[1] for bound in parBounds])
+   inside = np.all((rows >= lower) & (rows <= upper), axis=1)
+   logp = np.full(len(rows), -np.inf)
+   index = np.flatnonzero(inside)
+   if len(index) > 0:
+      logp[index] = -0.5*objective_batch(rows[index], parEstim, data, simulationTime, options, parValue, \
+                                         timeout=timeout, criterion='loglik' if sigma is None else sigma)
+   return logp
+
+def mcmc_save(file, state):
+   """Save checkpoint of the sampler atomically, i.e. an interrupted save leave the previous file"""
+   file_temp = file + '.tmp.npz'
+   np.savez(file_temp, **state)
+   os.replace(file_temp, file)
+
+def mcmc(x_0, parEstim, parBounds, data, simulationTime=simulationTime, nsteps=1000, nwalkers=None, sigma=None, \
+         a=2.0, scatter=0.01, seed=None, checkpoint=None, checkpoint_every=20, options=opts_fast, parValue=parValue, \
+         timeout=None):
+   """Affine invariant ensemble sampler with the stretch move by Goodman and Weare (2010), as in emcee.
+      The walkers start in a small ball around x_0, e.g. result.x, and are updated in two halves where
+      each half is evaluated as one batch in the worker pool if started with pool_start().
+      With a file name for checkpoint the chains are saved regularly and a later call continue from there,
+      if nwalkers, parEstim, parBounds, data, sigma, simulationTime, options and parValue are the same,
+      and nsteps is at least the steps in the checkpoint.
+      With timeout each simulation is given that time budget and failed ones get zero posterior.
+      Return a dictionary with the chain of shape (nsteps, nwalkers, len(parEstim)) and log-posterior."""
+
+   data = data_arrays(data)
+   parValue = dict(parValue)
+   ndim = len(parEstim)
+   rng = np.random.default_rng(seed)
+   args = (parEstim, parBounds, data, sigma, simulationTime, options, parValue)
+   problem = data_hash(*args)
+   resume = (checkpoint is not None) and os.path.exists(checkpoint)
+   if resume:
+      state = dict(np.load(checkpoint, allow_pickle=True))
+      if 'problem' not in state.keys():
+         raise ValueError('Checkpoint ' + checkpoint + ' has no description of the problem, remove it to start again')
+      if [str(p) for p in state['parEstim']] != list(parEstim):
+         raise ValueError('Checkpoint ' + checkpoint + ' is for parEstim ' + str([str(p) for p in state['parEstim']]) + \
+                          ' and not ' + str(list(parEstim)))
+      if nwalkers is not None and nwalkers + nwalkers % 2 != int(state['nwalkers']):
+         raise ValueError('Checkpoint ' + checkpoint + ' has ' + str(int(state['nwalkers'])) + ' walkers and not ' + \
+                          str(nwalkers + nwalkers % 2))
+      if str(state['problem']) != problem:
+         raise ValueError('Checkpoint ' + checkpoint + ' is for other parBounds, data, sigma, simulationTime, ' + \
+                          'options or parValue, remove it or give another file')
+      nwalkers = int(state['nwalkers'])
+   if nwalkers is None: nwalkers = max(4*ndim, 2*pool_size())
+   nwalkers = nwalkers + nwalkers % 2
+
+   # Start from checkpoint or from a ball around x_0 within the bounds
+   if resume:
+      step_0 = int(state['step'])
+      if step_0 > nsteps:
+         raise ValueError('Checkpoint ' + checkpoint + ' has ' + str(step_0) + ' steps, more than nsteps ' + str(nsteps) + \
+                          ', give nsteps at least ' + str(step_0) + ' or another file')
+      walkers = state['walkers']
+      logp = state['logp_walkers']
+      chain = np.concatenate([state['chain'][:step_0], np.zeros((max(nsteps-step_0, 0), nwalkers, ndim))])
+      chain_logp = np.concatenate([state['chain_logp'][:step_0], np.zeros((max(nsteps-step_0, 0), nwalkers))])
+      accepted = state['accepted']
+      rng.bit_generator.state = state['rng_state'].item()
+   else:
+      step_0 = 0
+      width = np.array([bound[1]-bound[0] for bound in parBounds])
+      walkers = np.array(x_0, dtype=float) + scatter*width*rng.standard_normal((nwalkers, ndim))
+      walkers = np.clip(walkers, [bound[0] for bound in parBounds], [bound[1] for bound in parBounds])
+      logp = logpost_batch(walkers, *args, timeout=timeout)
+      chain = np.zeros((nsteps, nwalkers, ndim))
+      chain_logp = np.zeros((nsteps, nwalkers))
+      accepted = np.zeros(nwalkers)
+
+   # Stretch moves for each half of the ensemble with the other half as complement
+   half = [np.arange(0, nwalkers//2), np.arange(nwalkers//2, nwalkers)]
+   start_time = time.time()
+   for step in range(step_0, nsteps):
+      for s in range(2):
+         active, other = half[s], half[1-s]
+         z = ((a-1)*rng.random(len(active)) + 1)**2/a
+         partner = walkers[rng.choice(other, len(active))]
+         proposal = partner + z[:, None]*(walkers[active] - partner)
+         logp_proposal = logpost_batch(proposal, *args, timeout=timeout)
+         accept = np.log(rng.random(len(active))) < (ndim-1)*np.log(z) + logp_proposal - logp[active]
+         walkers[active[accept]] = proposal[accept]
+         logp[active[accept]] = logp_proposal[accept]
+         accepted[active] = accepted[active] + accept
+      chain[step] = walkers
+      chain_logp[step] = logp
+      if (checkpoint is not None) and ((step+1) % checkpoint_every == 0 or step+1 == nsteps):
+         mcmc_save(checkpoint, {'step': step+1, 'walkers': walkers, 'logp_walkers': logp, 'chain': chain[:step+1], \
+                                'chain_logp': chain_logp[:step+1], 'accepted': accepted, \
+                                'rng_state': np.array(rng.bit_generator.state, dtype=object), \
+                                'nwalkers': nwalkers, 'parEstim': np.array(parEstim), 'problem': problem})
+   elapsed = time.time() - start_time
+
+   return {'chain': chain, 'logp': chain_logp, 'acceptance': accepted/max(nsteps, 1), \
+           'samples_per_second': (nsteps-step_0)*nwalkers/max(elapsed, 1e-9)}
+
+def mcmc_summary(res, parEstim, burnin=0.5, quantiles=[0.025, 0.5, 0.975]):
+   """Posterior mean and quantiles after the first fraction burnin of the chain is discarded"""
+   chain = res['chain'][int(burnin*len(res['chain'])):]
+   samples = chain.reshape(-1, chain.shape[-1])
+   summary = {}
+   for i, p in enumerate(parEstim):
+      summary[p] = {'mean': np.mean(samples[:, i]), 'std': np.std(samples[:, i])}
+      for q in quantiles: summary[p][q] = np.quantile(samples[:, i], q)
+   return summary
+
+def mcmc_plot(res, parEstim, burnin=0.5):
+   """Plot traces of the walkers and histogram of the posterior for each parameter"""
+   chain = res['chain']
+   plt.figure()
+   for i, p in enumerate(parEstim):
+      ax = plt.subplot(len(parEstim), 2, 2*i+1)
+      ax.plot(chain[:, :, i], color='b', alpha=0.2)
+      ax.axvline(int(burnin*len(chain)), color='k', linestyle=':')
+      ax.set_ylabel(p)
+      ax.grid()
+      ax = plt.subplot(len(parEstim), 2, 2*i+2)
+      ax.hist(chain[int(burnin*len(chain)):, :, i].ravel(), 40, color='b')
+      ax.grid()
+   plt.tight_layout()
+   plt.show()
+
+#------------------------------------------------------------------------------------------------------------------
+#  Trajectories in shared memory
+#------------------------------------------------------------------------------------------------------------------
+
+# Workers write trajectories directly into a block of shared memory created by the notebook and send back only
+# the number of the chunk, instead of pickled results. The workers are forked after the resource tracker is
+# started, see pool_start(), so they share it with the notebook that alone unlinks the block.
+
+# Blocks created by the notebook, and the block attached in this worker process that is kept between chunks
+shared_owned = {}
+shared_attached = {}
+
+class SharedTrajectories:
+   """Trajectories of runs stored in one block of shared memory as an array of shape (run, variable, time).
+      Variables are a list of model names or a dictionary of alias and name, e.g. mcLocation. The array and
+      the views from indexing by variable share memory with the block, i.e. no copy, and rows of failed
+      runs are NaN. Release the block with close() when done, or use it in a with-statement."""
+
+   def __init__(self, runs, variables, time, dtype='float64'):
+      self.variables = dict(variables) if isinstance(variables, dict) else {name: name for name in variables}
+      self.time = np.asarray(time, dtype=float)
+      self.shape = (runs, len(self.variables), len(self.time))
+      self.dtype = np.dtype(dtype)
+      self.block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(self.shape))*self.dtype.itemsize, 1))
+      self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.block.buf)
+      self.array[:] = np.nan
+      self.failed = []
+      shared_owned[self.block.name] = self.block
+
+   def __getitem__(self, key):
+      """View of shape (run, time) for a variable given by alias or model name"""
+      names = list(self.variables.keys())
+      if key not in names: key = names[list(self.variables.values()).index(key)]
+      return self.array[:, names.index(key)]
+
+   def __len__(self):
+      return self.shape[0]
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *args):
+      self.close()
+
+   def handle(self):
+      """Name, shape and dtype of the block that are sent to the workers"""
+      return (self.block.name, self.shape, self.dtype.str)
+
+   def close(self):
+      """Release the block, the array and views must not be used after"""
+      if self.block is None: return
+      self.array = None
+      shared_owned.pop(self.block.name, None)
+      self.block.close()
+      self.block.unlink()
+      self.block = None
+
+def shared_view(handle):
+   """Array of a SharedTrajectories block in a worker, attached once per process and block"""
+   name, shape, dtype = handle
+   if name in shared_owned.keys():
+      return np.ndarray(shape, dtype=dtype, buffer=shared_owned[name].buf)
+   if name not in shared_attached.keys():
+      for block in shared_attached.values(): block.close()
+      shared_attached.clear()
+      shared_attached[name] = shared_memory.SharedMemory(name=name)
+   return np.ndarray(shape, dtype=dtype, buffer=shared_attached[name].buf)
+
+def ensemble_chunk(task):
+   """Simulate a chunk of parameter sets and write the trajectories on the time grid into shared memory.
+      Return the start row and the rows that failed."""
+   (handle, start, parSets, t, simulationTime, options, parValue, parLocation, variables) = task
+   array = shared_view(handle)
+   failed = []
+   for k, parSet in enumerate(parSets):
+      try:
+         if parSet is None: raise ValueError('parCheck does not hold')
+         parValueLocal = dict(parValue); parValueLocal.update(parSet)
+         res = model_simulate({parLocation[key]:parValueLocal[key] for key in parValueLocal.keys()}, simulationTime, \
+                              options, output=list(variables.values()))
+         for j, location in enumerate(variables.values()):
+            array[start+k, j] = np.interp(t, res['time'], res[location])
+      except Exception:
+         array[start+k] = np.nan
+         failed.append(start+k)
+   del array
+   return (start, failed)
+
+def ensemble_simulate(parSets, simulationTime=simulationTime, ncp=500, variables=mcLocation, chunksize=16, \
+                      dtype='float64', options=opts_fast, parValue=parValue, parLocation=parLocation, parCheck=parCheck):
+   """Simulate each of parSets, dictionaries that update parValue, in the worker pool if started, and
+      return SharedTrajectories with the variables on a time grid of ncp+1 points. Parameter sets that
+      do not hold parCheck are not simulated. Failed runs are NaN and listed in the attribute failed.
+      Call close() on the result when done."""
+   t = np.linspace(0, simulationTime, ncp+1)
+   options = options_ncp(options, ncp)
+   parSets = [parSet if parcheck_set(parSet, parValue, parCheck) else None for parSet in parSets]
+   shared = SharedTrajectories(len(parSets), variables, t, dtype)
+   tasks = [(shared.handle(), start, parSets[start:start+chunksize], t, simulationTime, options, parValue, \
+             parLocation, shared.variables) for start in range(0, len(parSets), chunksize)]
+   try:
+      shared.failed = sorted([k for (start, failed) in pool_map(ensemble_chunk, tasks, remote=False) for k in failed])
+   except BaseException:
+      shared.close()
+      raise
+   return shared
+
+#------------------------------------------------------------------------------------------------------------------
+#  Monte-Carlo simulation for prediction bands
+#------------------------------------------------------------------------------------------------------------------
+
+def montecarlo_sample(rng, n, parDistribution, parSamples=None, parValue=parValue, parCheck=parCheck):
+   """Draw n parameter sets as a list of dictionaries. The parDistribution is a dictionary of parValue-names
+      with ('normal', mean, std), ('lognormal', mean, std) of the logarithm, or ('uniform', low, high).
+      Joint samples, e.g. bootstrap estimates or a MCMC chain, are given as parSamples = (names, rows)
+      and drawn with replacement. Parameter sets that do not hold parCheck are marked with None."""
+   columns = {}
+   for key, (kind, a, b) in parDistribution.items():
+      if kind == 'normal':
+         columns[key] = rng.normal(a, b, n)
+      elif kind == 'lognormal':
+         columns[key] = rng.lognormal(a, b, n)
+      elif kind == 'uniform':
+         columns[key] = rng.uniform(a, b, n)
+      else:
+         print('Error:', kind, '- distribution not available, use normal, lognormal or uniform')
+   if parSamples is not None:
+      names, rows = parSamples
+      index = rng.integers(0, len(rows), n)
+      for i, key in enumerate(names): columns[key] = np.asarray(rows)[index, i]
+   parSets = []
+   for k in range(n):
+      parValueLocal = dict(parValue)
+      for key in columns.keys(): parValueLocal[key] = columns[key][k]
+      if parcheck_set(parValueLocal, parValue, parCheck):
+         parSets.append(parValueLocal)
+      else:
+         parSets.append(None)
+   return parSets
+
+def montecarlo_chunk(task):
+   """Simulate a chunk of parameter sets and write the trajectories interpolated to the time grid directly
+      into the memory-mapped file, or shared memory given by its handle, where failed simulations are given NaN.
+      Return only the number of failures."""
+   (target, start, parSets, t, simulationTime, options, parLocation, mcLocation) = task
+   trajectories = np.load(target, mmap_mode='r+') if isinstance(target, str) else shared_view(target)
+   failed = 0
+   for k, parValueLocal in enumerate(parSets):
+      try:
+         if parValueLocal is None: raise ValueError('parCheck does not hold')
+         res = model_simulate({parLocation[key]:parValueLocal[key] for key in parValueLocal.keys()}, simulationTime, \
+                              options, output=list(mcLocation.values()))
+         for j, key in enumerate(mcLocation.keys()):
+            trajectories[start+k, j] = np.interp(t, res['time'], res[mcLocation[key]])
+      except Exception:
+         trajectories[start+k] = np.nan
+         failed = failed + 1
+   if isinstance(trajectories, np.memmap): trajectories.flush()
+   del trajectories
+   return (start, len(parSets), failed)
+
+def montecarlo(parDistribution, n, file=None, simulationTime=simulationTime, parSamples=None, ncp=100, \
+               quantiles=[0.05, 0.5, 0.95], chunksize=64, seed=None, dtype='float32', options=opts_fast, \
+               parValue=parValue, parLocation=parLocation, mcLocation=mcLocation, parCheck=parCheck):
+   """Propagate parameter uncertainty by n simulations with parameters drawn as in montecarlo_sample().
+      The trajectories of mcLocation variables are written by the workers to a memory-mapped npy-file of
+      shape (n, variables, ncp+1) and the prediction bands are computed per time point as streaming quantiles
+      while chunks are finished. Peak memory is thus independent of n. Read the file with np.load(file, mmap_mode='r').
+      With file None the trajectories are kept in shared memory instead, given as SharedTrajectories in the
+      result under trajectories, and released by its close() when done."""
+
+   rng = np.random.default_rng(seed)
+   t = np.linspace(0, simulationTime, ncp+1)
+   options = options_ncp(options, ncp)
+   if file is None:
+      shared = SharedTrajectories(n, mcLocation, t, dtype)
+      target = shared.handle()
+   else:
+      trajectories = np.lib.format.open_memmap(file, mode='w+', dtype=dtype, shape=(n, len(mcLocation), len(t)))
+      del trajectories
+      target = file
+
+   # Tasks with parameter sets drawn chunk by chunk, at most two chunks for each worker ahead of the results
+   def tasks():
+      for start in range(0, n, chunksize):
+         parSets = montecarlo_sample(rng, min(chunksize, n-start), parDistribution, parSamples, parValue, parCheck)
+         yield (target, start, parSets, t, simulationTime, options, parLocation, mcLocation)
+   chunks = pool_imap_bounded(montecarlo_chunk, tasks(), 2*pool_size())
+
+   # Stream finished chunks from the file into quantiles and mean
+   trajectories = shared.array if file is None else np.load(file, mmap_mode='r')
+   bands = {p: StreamQuantile(p, (len(mcLocation), len(t))) for p in quantiles}
+   total = np.zeros((len(mcLocation), len(t)))
+   count = 0
+   failed = 0
+   for (start, length, failed_chunk) in chunks:
+      failed = failed + failed_chunk
+      for row in np.asarray(trajectories[start:start+length], dtype=float):
+         if np.any(np.isnan(row)): continue
+         for p in quantiles: bands[p].update(row)
+         total = total + row
+         count = count + 1
+
+   result = {'time': t, 'file': file, 'n': n, 'failed': failed}
+   if file is None: result['trajectories'] = shared
+   for j, key in enumerate(mcLocation.keys()):
+      result[key] = {'mean': total[j]/max(count, 1)}
+      for p in quantiles: result[key][p] = bands[p].value()[j]
+   return result
+
+def montecarlo_plot(mc, data=None, quantiles=[0.05, 0.95]):
+   """Plot prediction bands from montecarlo() for X, S and mu together with data if given"""
+   plt.figure()
+   ax1 = plt.subplot(2,1,1)
+   ax2 = plt.subplot(2,1,2)
+   for key, color in [('X','r'), ('S','b')]:
+      ax1.fill_between(mc['time'], mc[key][quantiles[0]], mc[key][quantiles[1]], color=color, alpha=0.3)
+      ax1.plot(mc['time'], mc[key]['mean'], color=color)
+      if data is not None: ax1.plot(data['time'], data[key], color+'*')
+   ax1.set_ylabel('X and S [g/L]')
+   ax1.grid()
+   ax2.fill_between(mc['time'], mc['mu'][quantiles[0]], mc['mu'][quantiles[1]], color='r', alpha=0.3)
+   ax2.plot(mc['time'], mc['mu']['mean'], color='r')
+   ax2.set_ylabel('mu [1/h]')
+   ax2.set_xlabel('Time [h]')
+   ax2.grid()
+   plt.show()
+
+#------------------------------------------------------------------------------------------------------------------
+#  Store of calibrations for warm start
+#------------------------------------------------------------------------------------------------------------------
+
+def data_features(data, depletion=0.05):
+   """Features of a batch dataset: initial and final X and S, yield of X on S,
+      and time when S is depleted to the fraction depletion of its initial value."""
+   data = data_arrays(data)
+   index = np.argsort(data['time'])
+   t, X, S = data['time'][index], data['X'][index], data['S'][index]
+   below = np.flatnonzero(S <= depletion*S[0])
+   if len(below) == 0:
+      t_depletion = t[-1]
+   elif below[0] == 0:
+      t_depletion = t[0]
+   else:
+      k = below[0]
+      t_depletion = np.interp(depletion*S[0], [S[k], S[k-1]], [t[k], t[k-1]])
+   yield_XS = (X[-1]-X[0])/max(S[0]-S[-1], 1e-12)
+   return {'X_0': X[0], 'S_0': S[0], 'X_end': X[-1], 'S_end': S[-1], 'yield': yield_XS, 't_depletion': t_depletion}
+
+def store_read(file='BPL_TEST2_Batch_calibrations.jsonl', parEstim=None):
+   """Read the stored calibrations, optionally only those with the same parEstim"""
+   records = []
+   try:
+      with open(file) as f:
+         for line in f:
+            try:
+               record = json.loads(line)
+            except json.JSONDecodeError:
+               continue
+            if parEstim is None or record['parEstim'] == list(parEstim): records.append(record)
+   except FileNotFoundError:
+      pass
+   return records
+
+def store_add(data, parEstim, x_0, result, file='BPL_TEST2_Batch_calibrations.jsonl', name=''):
+   """Append a calibration result with features of the dataset to the store"""
+   record = {'name': name, 'time': time.time(), 'parEstim': list(parEstim), \
+             'features': {key: float(value) for key, value in data_features(data).items()}, \
+             'x_0': [float(v) for v in x_0], 'x': [float(v) for v in result.x], 'loss': float(result.fun), \
+             'nfev': int(result.nfev)}
+   with open(file, 'a') as f: f.write(json.dumps(record) + '\n')
+
+def store_start(data, parEstim, parBounds, file='BPL_TEST2_Batch_calibrations.jsonl', k=5):
+   """Start value and initial simplex from the k nearest stored datasets, where the features are scaled
+      by their spread in the store. The start is the estimate of the nearest dataset and the simplex steps
+      follow the spread of the estimates of the k nearest, within 1 and 10 percent of the parameter ranges.
+      Return (x_0, initial_simplex) or (None, None) when the store is empty."""
+   records = store_read(file, parEstim)
+   if records == []: return None, None
+   features = data_features(data)
+   keys = sorted(features.keys())
+   F = np.array([[record['features'][key] for key in keys] for record in records])
+   scale = np.std(F, axis=0)
+   scale[scale == 0] = 1
+   distance = np.linalg.norm((F - np.array([features[key] for key in keys]))/scale, axis=1)
+   nearest = np.argsort(distance)[:k]
+   estimates = np.array([records[j]['x'] for j in nearest])
+   lower = np.array([bound[0] for bound in parBounds])
+   upper = np.array([bound[1] for bound in parBounds])
+   x_0 = np.clip(estimates[0], lower, upper)
+   step = np.clip(np.std(estimates, axis=0), 0.01*(upper-lower), 0.1*(upper-lower))
+   step = np.where(x_0 + step > upper, -step, step)
+   initial_simplex = np.vstack([x_0] + [x_0 + step[i]*np.eye(len(x_0))[i] for i in range(len(x_0))])
+   return x_0, initial_simplex
+
+def calibrate_warm(data, parEstim, parBounds, simulationTime=simulationTime, file='BPL_TEST2_Batch_calibrations.jsonl', \
+                   k=5, name='', options=opts_fast, parValue=parValue):
+   """Calibrate with start from the store, or from the middle of parBounds as in the notebook
+      when the store is empty, and add the result to the store."""
+   x_0, initial_simplex = store_start(data, parEstim, parBounds, file, k)
+   if x_0 is None: x_0 = [np.mean(parBounds[i]) for i in range(len(parBounds))]
+   result = calibrate(x_0, parEstim, parBounds, data, simulationTime, options=options, parValue=parValue, \
+                      initial_simplex=initial_simplex)
+   store_add(data, parEstim, x_0, result, file, name)
+   return result
+
+#------------------------------------------------------------------------------------------------------------------
+#  Online moving horizon estimation as data arrives during a batch
+#------------------------------------------------------------------------------------------------------------------
+
+# State of the online estimation where the anchor is the simulated state at the start of the horizon
+online = {}
+
+def online_start(x_0, parEstim, parBounds, horizon=2.0, maxfev=20, simplex_step=0.02, weight=0.1, \
+                 options=opts_fast, parValue=parValue):
+   """Start online estimation from x_0, e.g. the result of an earlier calibration. Each update
+      re-estimates the parameters from the data within horizon before the last measurement with at
+      most maxfev simulations, which bounds the computation time per measurement. The term
+      weight*|x - x_previous|, scaled with the parameter ranges, keeps the estimate when data are not informative."""
+   online.clear()
+   online.update({'parEstim': list(parEstim), 'parBounds': parBounds, 'x': np.array(x_0, dtype=float), \
+                  'horizon': horizon, 'maxfev': maxfev, 'simplex_step': simplex_step, 'weight': weight, \
+                  'options': options, 'parValue': dict(parValue), 't_anchor': 0.0, 'anchor': {}, \
+                  'time': [], 'X': [], 'S': [], 'history': []})
+
+def online_start_values(x):
+   """Start values for a simulation from the anchor with parameters x"""
+   parValueLocal = dict(online['parValue'])
+   for i, p in enumerate(online['parEstim']): parValueLocal[p] = x[i]
+   start_values = {parLocation[key]: parValueLocal[key] for key in parValueLocal.keys()}
+   start_values.update(online['anchor'])
+   return start_values
+
+def online_objective(x, data):
+   """Loss function V over the horizon data simulated from the anchor, plus the weight term"""
+   t_anchor = online['t_anchor']
+   res = model_simulate(online_start_values(x), data['time'][-1] - t_anchor, online['options'], start_time=t_anchor, \
+                        output=list(dataLocation.values()))
+   r = {key: data[key] - np.interp(data['time'], res['time'], res[dataLocation[key]]) for key in dataLocation.keys()}
+   scale = np.array([bound[1]-bound[0] for bound in online['parBounds']])
+   return loss(r) + online['weight']*np.linalg.norm((x - online['x'])/scale)
+
+def online_update(t, X, S):
+   """Add a measurement at time t and update the estimate. The anchor is moved forward with continued
+      simulation from the previous anchor with the current estimate, so that no simulation starts from
+      time zero. Return the estimate and store it with time and number of simulations in online['history']."""
+   start_time = time.perf_counter()
+   online['time'].append(t); online['X'].append(X); online['S'].append(S)
+   x = online['x']
+
+   # Move the anchor to the start of the horizon
+   t_anchor_new = t - online['horizon']
+   if t_anchor_new > online['t_anchor']:
+      res = model_simulate(online_start_values(x), t_anchor_new - online['t_anchor'], \
+                           options_ncp(online['options'], 1), start_time=online['t_anchor'])
+      online['anchor'] = {stateValueInitial[key]: float(res[key][-1]) for key in stateValue.keys()}
+      online['t_anchor'] = t_anchor_new
+
+   # Re-estimate from the data within the horizon with a few warm-started iterations
+   index = [k for k in range(len(online['time'])) if online['time'][k] >= online['t_anchor']]
+   data = {key: np.array([online[key][k] for k in index]) for key in ['time', 'X', 'S']}
+   nfev = 0
+   if len(index) > 1 and data['time'][-1] > online['t_anchor']:
+      step = online['simplex_step']*np.array([bound[1]-bound[0] for bound in online['parBounds']])
+      initial_simplex = np.vstack([x] + [x + step[i]*np.eye(len(x))[i] for i in range(len(x))])
+      result = scipy.optimize.minimize(online_objective, x0=x, args=(data,), method='Nelder-Mead', \
+                                       bounds=online['parBounds'], \
+                                       options={'maxfev': online['maxfev'], 'initial_simplex': initial_simplex})
+      online['x'], nfev = result.x, result.nfev
+   online['history'].append({'time': t, 'x': online['x'].copy(), 'nfev': nfev, \
+                             'wall_time': time.perf_counter() - start_time})
+   return online['x']
+
+def online_plot(parEstim=None):
+   """Diagram of the parameter estimates during the batch"""
+   parEstim = online['parEstim'] if parEstim is None else parEstim
+   t = [h['time'] for h in online['history']]
+   plt.figure()
+   for i, p in enumerate(parEstim):
+      plt.subplot(len(parEstim), 1, i+1)
+      plt.step(t, [h['x'][i] for h in online['history']], where='post')
+      plt.ylabel(p); plt.grid()
+   plt.xlabel('Time [h]')
+   plt.show()
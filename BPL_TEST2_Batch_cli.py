@@ -0,0 +1,204 @@
+# Figure - Command line calibration of the batch reactor model without notebook
+#          e.g. python BPL_TEST2_Batch_cli.py calibrate --data data_batch_1.xlsx --estimate Y,qSmax,Ks
+#                      --bounds 0.4:0.8,0.7:1.3,0.05:0.2 --out results
+#          and for each dataset the figures, a JSON-file with the result and a timing breakdown are written
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with the steps of the notebook BPL_TEST2_Batch_calibration: data, simulation over the
+#              parameter bounds, calibration and contour of the loss function, evaluated in the worker pool
+# 2026-10-19 - Option --timeout for a time budget per simulation where failed simulations are reported
+#------------------------------------------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------------------------------------------
+#  Framework
+#------------------------------------------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import argparse
+import itertools
+import matplotlib
+matplotlib.use('Agg')
+
+# Explore script for each backend, where auto choose by a benchmark on this host
+cli_script = {'auto': 'BPL_TEST2_Batch_auto_explore.py', 'pyfmi': 'BPL_TEST2_Batch_explore.py', \
+              'fmpy': 'BPL_TEST2_Batch_fmpy_explore.py'}
+
+def cli_arguments(argv=None):
+   parser = argparse.ArgumentParser(description='Calibration of the batch reactor model BPL_TEST2_Batch')
+   commands = parser.add_subparsers(dest='command', required=True)
+   command = commands.add_parser('calibrate', help='estimate parameters from data and write figures and results')
+   command.add_argument('--data', nargs='+', required=True, help='xlsx- or csv-files with columns time, X and S')
+   command.add_argument('--sheet', default=0, help='sheet of xlsx-files, default the first')
+   command.add_argument('--estimate', default='Y,qSmax,Ks', help='parameters to estimate, default Y,qSmax,Ks')
+   command.add_argument('--bounds', default='0.4:0.8,0.7:1.3,0.05:0.20', \
+                        help='lower:upper for each estimated parameter, default 0.4:0.8,0.7:1.3,0.05:0.20')
+   command.add_argument('--par', default='', help='other parameters and initial values, e.g. VS_start=10,VX_start=1')
+   command.add_argument('--method', default='Nelder-Mead', help='Nelder-Mead, differential_evolution or SLSQP etc')
+   command.add_argument('--simulation-time', type=float, default=None, help='default the last time in data')
+   command.add_argument('--contour', type=int, default=20, help='grid points per axis of the contour, 0 to skip')
+   command.add_argument('--workers', type=int, default=None, help='worker processes, default one per core')
+   command.add_argument('--timeout', type=float, default=None, \
+                        help='wall time in seconds for each simulation of the sweeps, failed ones are reported')
+   command.add_argument('--backend', default='auto', choices=cli_script.keys())
+   command.add_argument('--out', default='.', help='directory for figures and results')
+   return parser.parse_args(argv)
+
+def cli_values(text):
+   """Dictionary from text like VS_start=10,VX_start=1"""
+   return {item.split('=')[0].strip(): float(item.split('=')[1]) for item in text.split(',') if item.strip() != ''}
+
+def cli_bounds(text, parEstim):
+   """List of bounds from text like 0.4:0.8,0.7:1.3"""
+   parBounds = [tuple(float(v) for v in item.split(':')) for item in text.split(',')]
+   if len(parBounds) != len(parEstim) or any([len(bound) != 2 for bound in parBounds]):
+      raise SystemExit('Error: --bounds must give lower:upper for each of ' + ','.join(parEstim))
+   return parBounds
+
+def cli_read_data(file, sheet=0):
+   """DataFrame with columns time, X and S from an xlsx- or csv-file"""
+   import pandas as pd
+   if file.endswith('.csv'):
+      data = pd.read_csv(file)
+   else:
+      data = pd.read_excel(file, sheet_name=int(sheet) if str(sheet).isdigit() else sheet)
+   missing = [column for column in ['time', 'X', 'S'] if column not in data.columns]
+   if missing != []: raise SystemExit('Error: ' + file + ' has no column ' + ', '.join(missing))
+   return data[['time', 'X', 'S']].astype(float)
+
+#------------------------------------------------------------------------------------------------------------------
+#  Steps of the notebook
+#------------------------------------------------------------------------------------------------------------------
+
+def cli_simulate_chunk(task):
+   """Trajectories of X and S on the time grid for a chunk of parameter rows"""
+   (rows, parEstim, t, simulationTime, options, parValue) = task
+   result = []
+   for x in rows:
+      parValueLocal = dict(parValue)
+      for i, p in enumerate(parEstim): parValueLocal[p] = x[i]
+      res = model_simulate({parLocation[key]: parValueLocal[key] for key in parValueLocal.keys()}, simulationTime, \
+                           options, output=list(dataLocation.values()))
+      result.append({key: np.interp(t, res['time'], res[dataLocation[key]]) for key in dataLocation.keys()})
+   return result
+
+def cli_simulate(rows, parEstim, simulationTime, ncp=100, timeout=None):
+   """Simulate all rows of parameters split over the workers. With timeout each row is simulated by
+      sweep() with that time budget and failed rows give NaN."""
+   t = np.linspace(0, simulationTime, ncp+1)
+   if timeout is not None:
+      tasks = [(np.asarray(rows)[[k]], parEstim, t, simulationTime, options_ncp(opts_fast, ncp), dict(parValue)) \
+               for k in range(len(rows))]
+      result = sweep(cli_simulate_chunk, tasks, timeout, pool_size(), failed=[{key: np.full(len(t), np.nan) \
+                                                                               for key in dataLocation.keys()}])
+      for k, reason in sorted(result['failures'].items()): objective_failures.append({'x': list(rows[k]), 'reason': reason})
+      return t, [chunk[0] for chunk in result['results']]
+   chunks = np.array_split(np.arange(len(rows)), min(pool_size(), len(rows)))
+   tasks = [(np.asarray(rows)[chunk], parEstim, t, simulationTime, options_ncp(opts_fast, ncp), dict(parValue)) \
+            for chunk in chunks]
+   return t, [trajectory for chunk in pool_map(cli_simulate_chunk, tasks) for trajectory in chunk]
+
+def cli_figure_simulation(file, t, trajectories, data, title='Batch cultivation'):
+   """Diagram of S and X as the notebook plotType Demo_1 with data as stars"""
+   fig, (ax1, ax2) = plt.subplots(2, 1)
+   ax1.set_title(title)
+   for trajectory in trajectories:
+      ax1.plot(t, trajectory['S'], 'b-')
+      ax2.plot(t, trajectory['X'], 'r-')
+   ax1.plot(data['time'], data['S'], 'b*')
+   ax2.plot(data['time'], data['X'], 'r*')
+   ax1.set_ylabel('S [g/L]'); ax1.grid()
+   ax2.set_ylabel('X [g/L]'); ax2.set_xlabel('Time [h]'); ax2.grid()
+   fig.savefig(file)
+   plt.close(fig)
+
+def cli_contour(file, x_opt, parEstim, parBounds, data, simulationTime, n=20, timeout=None):
+   """Contour of the loss function V over the first two estimated parameters with the others at
+      the estimate, where all grid points are evaluated as one batch in the pool"""
+   a = np.linspace(parBounds[0][0], parBounds[0][1], n)
+   b = np.linspace(parBounds[1][0], parBounds[1][1], n)
+   rows = np.array([[a[j], b[k]] + list(x_opt[2:]) for k in range(n) for j in range(n)])
+   V = objective_batch(rows, parEstim, data_arrays(data), simulationTime, opts_fast, parValue, \
+                       timeout=timeout).reshape(n, n)
+   fig = plt.figure()
+   plt.contourf(a, b, V, 20, cmap='RdGy')
+   plt.plot(x_opt[0], x_opt[1], 'k+')
+   plt.colorbar()
+   plt.xlabel(parEstim[0]); plt.ylabel(parEstim[1])
+   fig.savefig(file)
+   plt.close(fig)
+   return V
+
+def cli_calibrate(file, args, timings_setup):
+   """All steps for one dataset, return the result that is also written to JSON"""
+   timings = dict(timings_setup)
+   stem = os.path.join(args.out, os.path.splitext(os.path.basename(file))[0])
+   start_time = time.perf_counter()
+
+   def lap(name):
+      nonlocal start_time
+      timings[name] = round(time.perf_counter() - start_time, 3)
+      start_time = time.perf_counter()
+
+   data = cli_read_data(file, args.sheet)
+   parEstim = args.estimate.split(',')
+   parBounds = cli_bounds(args.bounds, parEstim)
+   simulationTime = args.simulation_time if args.simulation_time is not None else float(data['time'].max())
+   if args.par != '': par(**cli_values(args.par))
+   x_0 = [np.mean(parBounds[k]) for k in range(len(parBounds))]
+   del objective_failures[:]
+   lap('data')
+
+   t, trajectories = cli_simulate(list(itertools.product(*parBounds)), parEstim, simulationTime, timeout=args.timeout)
+   cli_figure_simulation(stem + '_bounds_sweep.png', t, trajectories, data)
+   lap('bounds_sweep')
+
+   result = calibrate(x_0, parEstim, parBounds, data, simulationTime, method=args.method, timeout=args.timeout)
+   lap('calibration')
+
+   t, trajectories = cli_simulate([result.x], parEstim, simulationTime)
+   cli_figure_simulation(stem + '_simu_data.png', t, trajectories, data)
+   lap('simulation')
+
+   if args.contour > 0 and len(parEstim) >= 2:
+      cli_contour(stem + '_loss_function_contour.png', result.x, parEstim, parBounds, data, simulationTime, args.contour, \
+                  args.timeout)
+   lap('contour')
+
+   output = {'data': os.path.abspath(file), 'estimate': dict(zip(parEstim, [float(v) for v in result.x])), \
+             'bounds': dict(zip(parEstim, parBounds)), 'loss': float(result.fun), 'nfev': int(result.nfev), \
+             'success': bool(result.success), 'message': str(result.message), 'method': args.method, \
+             'simulationTime': simulationTime, 'parValue': {key: float(parValue[key]) for key in parValue.keys()}, \
+             'fmu_model': fmu_model, 'flag_type': flag_type, 'workers': pool_size(), 'timings': timings, \
+             'failures': list(objective_failures)}
+   output['timings']['total'] = round(sum([v for key, v in timings.items() if key != 'setup']), 3)
+   with open(stem + '_result.json', 'w') as f: json.dump(output, f, indent=3)
+   return output
+
+#------------------------------------------------------------------------------------------------------------------
+#  Main - the explore and calibration scripts are run here as in the notebook with run -i
+#------------------------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+   args = cli_arguments()
+   args.data = [os.path.abspath(file) for file in args.data]
+   args.out = os.path.abspath(args.out)
+   os.makedirs(args.out, exist_ok=True)
+   os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+   start_time = time.perf_counter()
+   exec(open(cli_script[args.backend]).read())
+   exec(open('BPL_TEST2_Batch_calibration_explore.py').read())
+   pool_start(args.workers)
+   timings_setup = {'setup': round(time.perf_counter() - start_time, 3)}
+
+   try:
+      for file in args.data:
+         output = cli_calibrate(file, args, timings_setup)
+         print(os.path.basename(file), ':', ', '.join([p + ' = ' + str(np.round(v, 4)) for p, v in output['estimate'].items()]), \
+               '- loss', np.round(output['loss'], 4), '-', len(output['failures']), 'failed -', output['timings'])
+   finally:
+      pool_stop()
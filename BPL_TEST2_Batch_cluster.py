@@ -0,0 +1,424 @@
+# Figure - Coordinator and workers over TCP for simulations of the batch reactor model on several machines
+#          imported by BPL_TEST2_Batch_calibration_explore.py for the coordinator, and on each machine run as
+#          e.g. python BPL_TEST2_Batch_cluster.py worker --coordinator host:5555 --processes 8
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with chunks of tasks sent to workers that join and leave at any time, where the chunk of
+#              a worker that dies or goes silent is sent again, and results streamed back as they are finished
+# 2026-10-19 - Authentication and introduction of each worker in a thread of its own, and accept() ended by close()
+# 2026-10-19 - Backend announced by the coordinator, used by default by the workers and others refused
+# 2026-10-19 - A map without workers for deadline seconds gives an error instead of waiting forever
+#------------------------------------------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------------------------------------------
+#  Framework
+#------------------------------------------------------------------------------------------------------------------
+
+# Messages are pickled tuples over multiprocessing.connection on TCP, where the connection is authenticated
+# with a shared key before anything is unpickled. Messages from the coordinator are ('task', id, name, task)
+# and ('stop',), and from the workers ('join', info), ('alive',), ('result', id, value), ('error', id, text)
+# and ('leave', reason). After authentication the coordinator announces its backend with ('backend', choice),
+# where choice is a dictionary of backend, flag_type and fmu_model as backend_choice of the explore scripts,
+# and refuses a worker with another backend or FMU type with ('refuse', reason). Each worker keeps its own instance of the FMU from its own cache of extracted FMU files.
+
+import os
+import sys
+import time
+import queue
+import socket
+import secrets
+import argparse
+import threading
+import traceback
+import collections
+import multiprocessing
+import multiprocessing.connection
+
+# Shared key of coordinator and workers, from the environment or a file in the cache created at first use
+cluster_key_file = os.path.join(os.path.expanduser('~'), '.cache', 'BPL_TEST2_Batch', 'cluster.key')
+
+def cluster_authkey(authkey=None):
+   """Key as bytes given, from BPL_TEST2_BATCH_AUTHKEY, or from the key file that is created if missing.
+      Copy the key file to the other machines, since a worker only accepts a coordinator with the same key."""
+   if authkey is None: authkey = os.environ.get('BPL_TEST2_BATCH_AUTHKEY')
+   if authkey is None:
+      if not os.path.exists(cluster_key_file):
+         os.makedirs(os.path.dirname(cluster_key_file), exist_ok=True)
+         with open(os.open(cluster_key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+            f.write(secrets.token_hex(32))
+      with open(cluster_key_file) as f: authkey = f.read().strip()
+   return authkey.encode() if isinstance(authkey, str) else authkey
+
+def cluster_address(text, port=5555):
+   """Address (host, port) from text like host:5555"""
+   host, _, number = text.rpartition(':')
+   return (host, int(number)) if host != '' else (text, port)
+
+#------------------------------------------------------------------------------------------------------------------
+#  Coordinator
+#------------------------------------------------------------------------------------------------------------------
+
+class Coordinator:
+   """Accept workers on address and send them chunks of tasks. Workers may join and leave at any time.
+      A chunk of a worker that leaves, crashes or is silent longer than silence seconds is sent to another
+      worker, at most retries times. A Python error in a task is not retried but reported. A map without any
+      worker for deadline seconds gives RuntimeError. With backend, a dictionary of backend, flag_type and
+      fmu_model, only workers with the same backend and flag_type join."""
+
+   def __init__(self, address=('', 5555), authkey=None, silence=60, retries=2, deadline=300, backend=None):
+      self.listener = multiprocessing.connection.Listener(address, family='AF_INET')
+      self.authkey = cluster_authkey(authkey)
+      self.backend = backend
+      self.silence = silence
+      self.retries = retries
+      self.deadline = deadline
+      self.workers = {}
+      self.joined = queue.Queue()
+      self.events = collections.deque(maxlen=1000)
+      self.maps = 0
+      self.closed = False
+      self.thread = threading.Thread(target=self.accept, daemon=True)
+      self.thread.start()
+
+   @property
+   def address(self):
+      host, port = self.listener.address
+      return (socket.gethostname() if host in ('', '0.0.0.0') else host, port)
+
+   def event(self, text, info=None):
+      self.events.append((time.time(), text, None if info is None else info['host'] + ':' + str(info['pid'])))
+
+   def accept(self):
+      """Accept connections and authenticate and wait for the introduction of each in a thread of its own,
+         so that a slow or silent connection does not delay other workers or close()"""
+      while not self.closed:
+         try:
+            connection = self.listener.accept()
+         except (EOFError, OSError):
+            if self.closed: break
+            continue
+         if self.closed:
+            connection.close()
+            break
+         threading.Thread(target=self.welcome, args=(connection,), daemon=True).start()
+
+   def welcome(self, connection, wait=10):
+      """Authenticate the connection with the shared key, announce the backend and pass a worker with the
+         same backend that introduces itself within wait seconds to the map that is running"""
+      try:
+         multiprocessing.connection.deliver_challenge(connection, self.authkey)
+         multiprocessing.connection.answer_challenge(connection, self.authkey)
+         connection.send(('backend', self.backend))
+         message = connection.recv() if connection.poll(wait) else None
+         if message is not None and message[0] == 'join' and self.backend is not None:
+            choice = (message[1].get('backend'), message[1].get('flag_type'))
+            if choice != (self.backend['backend'], self.backend['flag_type']):
+               self.event('refused worker on ' + str(message[1].get('host')) + ' with backend ' + \
+                          ' '.join([str(value) for value in choice]))
+               connection.send(('refuse', 'the coordinator uses ' + self.backend['backend'] + ' ' + \
+                                self.backend['flag_type']))
+               message = None
+      except multiprocessing.AuthenticationError:
+         self.event('refused worker with other key')
+         message = None
+      except (EOFError, OSError):
+         message = None
+      if message is None or message[0] != 'join' or self.closed:
+         connection.close()
+         return
+      self.joined.put((connection, message[1]))
+
+   def size(self):
+      """Number of workers, including those joined since the last map"""
+      self.admit()
+      return len(self.workers)
+
+   def admit(self):
+      while True:
+         try:
+            connection, info = self.joined.get_nowait()
+         except queue.Empty:
+            return
+         self.workers[connection] = {'info': info, 'task': None, 'last': time.monotonic(), 'done': 0}
+         self.event('join', info)
+
+   def wait_workers(self, n=1, timeout=None):
+      """Wait until at least n workers have joined, return the number of workers"""
+      start = time.monotonic()
+      while self.size() < n and (timeout is None or time.monotonic() - start < timeout):
+         time.sleep(0.1)
+      return len(self.workers)
+
+   def drop(self, connection, reason):
+      """Remove a worker and return the id of its chunk in progress, if any"""
+      worker = self.workers.pop(connection)
+      self.event(reason, worker['info'])
+      try:
+         connection.close()
+      except OSError:
+         pass
+      return worker['task']
+
+   def imap(self, name, tasks):
+      """Send each task to the function name on the workers and yield (index, value, reason) as chunks
+         are finished, where reason is None for success and otherwise value is None"""
+      self.maps = self.maps + 1
+      pending = collections.deque(enumerate(tasks))
+      task_of = dict(pending)
+      attempts = collections.Counter()
+      busy = set()
+      now = time.monotonic()
+      for worker in self.workers.values(): worker['last'] = now
+      alone = now
+      while len(pending) > 0 or len(busy) > 0:
+         self.admit()
+         lost = []
+
+         # Give up when no worker has been present for deadline seconds
+         if self.workers:
+            alone = time.monotonic()
+         elif time.monotonic() - alone > self.deadline:
+            raise RuntimeError('No workers joined the coordinator within ' + str(self.deadline) + ' s, ' + \
+                               str(len(pending) + len(busy)) + ' tasks of ' + name + ' not done')
+
+         # Send chunks to idle workers
+         for connection, worker in list(self.workers.items()):
+            if len(pending) == 0: break
+            if worker['task'] is not None: continue
+            index, task = pending.popleft()
+            try:
+               connection.send(('task', (self.maps, index), name, task))
+            except OSError:
+               pending.appendleft((index, task))
+               self.drop(connection, 'lost')
+               continue
+            worker['task'] = (self.maps, index)
+            busy.add(index)
+
+         # Receive results, heartbeats and goodbyes
+         ready = multiprocessing.connection.wait(list(self.workers.keys()), timeout=0.2) if self.workers else []
+         if not self.workers: time.sleep(0.2)
+         for connection in ready:
+            worker = self.workers[connection]
+            try:
+               message = connection.recv()
+            except (EOFError, OSError):
+               lost.append(self.drop(connection, 'lost'))
+               continue
+            worker['last'] = time.monotonic()
+            if message[0] in ('result', 'error'):
+               (current, index) = message[1]
+               worker['task'] = None
+               if current != self.maps: continue
+               busy.discard(index)
+               worker['done'] = worker['done'] + 1
+               if message[0] == 'result':
+                  yield (index, message[2], None)
+               else:
+                  yield (index, None, message[2])
+            elif message[0] == 'leave':
+               lost.append(self.drop(connection, 'leave ' + message[1]))
+
+         # Workers silent too long are considered dead
+         now = time.monotonic()
+         for connection, worker in list(self.workers.items()):
+            if now - worker['last'] > self.silence:
+               lost.append(self.drop(connection, 'silent'))
+
+         # Chunks of lost workers are sent again, or reported when tried too many times
+         for task in lost:
+            if task is None or task[0] != self.maps: continue
+            index = task[1]
+            busy.discard(index)
+            attempts[index] = attempts[index] + 1
+            if attempts[index] > self.retries:
+               yield (index, None, 'worker lost ' + str(attempts[index]) + ' times')
+            else:
+               pending.appendleft((index, task_of[index]))
+
+   def map(self, name, tasks):
+      """List of results in the order of tasks, as Pool.map() with RuntimeError if a chunk fails"""
+      tasks = list(tasks)
+      result = [None]*len(tasks)
+      for index, value, reason in self.imap(name, tasks):
+         if reason is not None: raise RuntimeError('Task ' + str(index) + ' of ' + name + ' failed: ' + reason)
+         result[index] = value
+      return result
+
+   def map_unordered(self, name, tasks):
+      """Yield results as chunks are finished, as Pool.imap_unordered() with RuntimeError if a chunk fails"""
+      for index, value, reason in self.imap(name, tasks):
+         if reason is not None: raise RuntimeError('Task ' + str(index) + ' of ' + name + ' failed: ' + reason)
+         yield value
+
+   def status(self):
+      """List of workers with host, pid, backend and number of chunks done"""
+      self.admit()
+      return [dict(worker['info'], done=worker['done'], busy=worker['task'] is not None) \
+              for worker in self.workers.values()]
+
+   def close(self):
+      """Ask the workers to stop and close the listener"""
+      self.closed = True
+      self.admit()
+      for connection in list(self.workers.keys()):
+         try:
+            connection.send(('stop',))
+         except OSError:
+            pass
+         self.drop(connection, 'stop')
+      # Wake the thread waiting in accept() by a connection of its own before the listener is closed
+      host, port = self.listener.address
+      try:
+         socket.create_connection(('127.0.0.1' if host in ('', '0.0.0.0') else host, port), timeout=1).close()
+      except OSError:
+         pass
+      self.thread.join(1)
+      self.listener.close()
+
+#------------------------------------------------------------------------------------------------------------------
+#  Worker
+#------------------------------------------------------------------------------------------------------------------
+
+# Exit codes of a worker process to the supervisor
+worker_stop, worker_gone, worker_recycle = 0, 4, 3
+
+def worker_connect(address, authkey, wait=60):
+   """Connection to the coordinator, trying again during wait seconds"""
+   start = time.monotonic()
+   while True:
+      try:
+         return multiprocessing.connection.Client(address, family='AF_INET', authkey=authkey)
+      except (ConnectionRefusedError, ConnectionResetError, socket.gaierror, TimeoutError):
+         if time.monotonic() - start > wait: return None
+         time.sleep(1)
+
+def worker_backend(address, authkey, wait=60):
+   """Backend announced by the coordinator as a dictionary like backend_choice, or None if not reached"""
+   connection = worker_connect(address, authkey, wait)
+   if connection is None: return None
+   try:
+      message = connection.recv() if connection.poll(wait) else None
+   except (EOFError, OSError):
+      message = None
+   finally:
+      connection.close()
+   return message[1] if message is not None and message[0] == 'backend' else None
+
+def worker_serve(address, authkey, namespace, info, recycle=None, heartbeat=5, wait=60):
+   """Serve chunks of tasks from the coordinator with functions found by name in namespace. A thread
+      sends a heartbeat so that the coordinator knows the worker is alive during long chunks.
+      Return the exit code for the supervisor."""
+   connection = worker_connect(address, authkey, wait)
+   if connection is None: return worker_gone
+   try:
+      connection.recv()
+   except (EOFError, OSError):
+      connection.close()
+      return worker_gone
+   lock = threading.Lock()
+   stopped = threading.Event()
+
+   def send(message):
+      with lock: connection.send(message)
+
+   def beat():
+      while not stopped.wait(heartbeat):
+         try:
+            send(('alive',))
+         except OSError:
+            return
+
+   send(('join', info))
+   threading.Thread(target=beat, daemon=True).start()
+   done = 0
+   try:
+      while True:
+         try:
+            message = connection.recv()
+         except (EOFError, OSError):
+            return worker_gone
+         if message[0] == 'stop': return worker_stop
+         if message[0] == 'refuse':
+            print('Worker refused since', message[1], flush=True)
+            return worker_stop
+         (_, key, name, task) = message
+         try:
+            send(('result', key, namespace[name](task)))
+         except Exception:
+            send(('error', key, traceback.format_exc(limit=-1).strip().splitlines()[-1]))
+         done = done + 1
+         if recycle is not None and done >= recycle:
+            send(('leave', 'recycle'))
+            return worker_recycle
+   except OSError:
+      return worker_gone
+   finally:
+      stopped.set()
+      connection.close()
+
+def worker_process(address, authkey, namespace, info, recycle, wait):
+   """Worker process forked from the supervisor that loads its own instance of the FMU"""
+   namespace['pool_worker_init']()
+   info = dict(info, pid=os.getpid())
+   os._exit(worker_serve(address, authkey, namespace, info, recycle, wait=wait))
+
+def worker_supervise(address, authkey, namespace, info, processes=1, recycle=None, wait=60):
+   """Keep processes workers connected to the coordinator. A worker that is recycled or crashes is
+      replaced, and the supervisor ends when the coordinator stops or cannot be reached."""
+   context = multiprocessing.get_context('fork')
+   start = lambda: context.Process(target=worker_process, args=(address, authkey, namespace, info, recycle, wait))
+   workers = [start() for k in range(processes)]
+   for worker in workers: worker.start()
+   stopped = False
+   while len(workers) > 0:
+      multiprocessing.connection.wait([worker.sentinel for worker in workers])
+      for worker in list(workers):
+         if worker.exitcode is None: continue
+         workers.remove(worker)
+         if worker.exitcode == worker_stop and not stopped:
+            stopped = True
+            for other in workers: other.terminate()
+         if stopped or worker.exitcode == worker_gone: continue
+         if worker.exitcode != worker_recycle:
+            print('Worker', worker.pid, 'ended with exit code', worker.exitcode, '- started again', flush=True)
+            time.sleep(1)
+         workers.append(start())
+         workers[-1].start()
+
+#------------------------------------------------------------------------------------------------------------------
+#  Main - the explore and calibration scripts are run here as in the notebook with run -i
+#------------------------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description='Worker for simulations of BPL_TEST2_Batch on this machine')
+   commands = parser.add_subparsers(dest='command', required=True)
+   command = commands.add_parser('worker', help='join the coordinator and simulate chunks of tasks')
+   command.add_argument('--coordinator', required=True, help='host:port of the coordinator')
+   command.add_argument('--backend', default=None, choices=['auto', 'pyfmi', 'fmpy'], \
+                        help='default the backend and FMU announced by the coordinator')
+   command.add_argument('--processes', type=int, default=os.cpu_count(), help='worker processes, default one per core')
+   command.add_argument('--recycle', type=int, default=None, help='chunks before a worker process is replaced')
+   command.add_argument('--script', nargs='*', default=[], help='more scripts with task functions, e.g. design')
+   command.add_argument('--wait', type=float, default=60, help='seconds to wait for the coordinator')
+   command.add_argument('--authkey', default=None, help='shared key, default from the environment or key file')
+   args = parser.parse_args()
+   args.script = [os.path.abspath(file) for file in args.script]
+   os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+   address, authkey = cluster_address(args.coordinator), cluster_authkey(args.authkey)
+   if args.backend is None:
+      backend_choice = worker_backend(address, authkey, args.wait)
+      if backend_choice is None: sys.exit('Error: The coordinator did not announce a backend, use --backend')
+      print('Backend', backend_choice['backend'], backend_choice['flag_type'], 'with', backend_choice['fmu_model'], \
+            'announced by the coordinator')
+      args.backend = backend_choice['backend']
+   script = {'auto': 'BPL_TEST2_Batch_auto_explore.py', 'pyfmi': 'BPL_TEST2_Batch_explore.py', \
+             'fmpy': 'BPL_TEST2_Batch_fmpy_explore.py'}[args.backend]
+   exec(open(script).read())
+   exec(open('BPL_TEST2_Batch_calibration_explore.py').read())
+   for file in args.script: exec(open(file).read())
+   info = {'host': socket.gethostname(), 'backend': backend_name, 'flag_type': flag_type, 'fmu_model': fmu_model}
+   worker_supervise(address, authkey, globals(), info, args.processes, args.recycle, args.wait)
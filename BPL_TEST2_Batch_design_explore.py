@@ -0,0 +1,125 @@
+# Figure - Optimal experimental design for calibration of the batch reactor model
+#          run after BPL_TEST2_Batch_explore.py or BPL_TEST2_Batch_fmpy_explore.py and
+#          BPL_TEST2_Batch_calibration_explore.py that gives the worker pool, i.e. in the notebook:
+#          run -i BPL_TEST2_Batch_design_explore.py
+#          and start the pool with pool_start() after this script so that the workers get design_chunk()
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with Fisher information for candidate initial values and sampling schedules,
+#              ranked by D- or E-optimality
+# 2026-10-19 - Cache of sensitivities keyed also by the options
+#------------------------------------------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------------------------------------------
+#  Framework
+#------------------------------------------------------------------------------------------------------------------
+
+import itertools
+import numpy as np
+import matplotlib.pyplot as plt
+
+# Sensitivities on a fine time grid for each initial value, shared by all sampling schedules
+design_cache = {}
+
+#------------------------------------------------------------------------------------------------------------------
+#  Sensitivities
+#------------------------------------------------------------------------------------------------------------------
+
+def design_chunk(task):
+   """Relative sensitivities d y/d log p of the measured variables on the time grid for a chunk
+      of initial values, by central differences in log p. Return a list of (initial, sensitivity)
+      where sensitivity has shape (time, variable, parameter), or None if a simulation fails."""
+   (initials, parEstim, grid, h, options, parValue) = task
+   result = []
+   for initial in initials:
+      parValueLocal = dict(parValue)
+      parValueLocal.update(initial)
+      sensitivity = np.zeros((len(grid), len(dataLocation), len(parEstim)))
+      try:
+         for i, p in enumerate(parEstim):
+            y = []
+            for sign in [1, -1]:
+               parValueSign = dict(parValueLocal)
+               parValueSign[p] = parValueLocal[p]*np.exp(sign*h)
+               res = model_simulate({parLocation[k]: parValueSign[k] for k in parValueSign.keys()}, grid[-1], \
+                                    options, output=list(dataLocation.values()))
+               y.append(np.array([np.interp(grid, res['time'], res[dataLocation[key]]) for key in dataLocation.keys()]).T)
+            sensitivity[:,:,i] = (y[0] - y[1])/(2*h)
+      except Exception:
+         sensitivity = None
+      result.append((initial, sensitivity))
+   return result
+
+def design_sensitivities(initials, parEstim, simulationTime=simulationTime, ngrid=121, h=0.02, chunksize=4, \
+                         options=opts_fast, parValue=parValue):
+   """Sensitivities for a list of initial values, e.g. [{'VS_start': 10, 'VX_start': 1}, ...], computed in
+      chunks over the pool. Results are cached so that only new initial values, or other options etc, are simulated."""
+   grid = np.linspace(0, simulationTime, ngrid)
+   key_common = (tuple(parEstim), simulationTime, ngrid, h, tuple(sorted(parValue.items())), data_hash(options))
+   keys = [key_common + (tuple(sorted(initial.items())),) for initial in initials]
+   new = [initial for initial, key in zip(initials, keys) if key not in design_cache.keys()]
+   new = [dict(t) for t in dict.fromkeys([tuple(sorted(initial.items())) for initial in new])]
+   tasks = [(new[k:k+chunksize], parEstim, grid, h, options_ncp(options, ngrid-1), parValue) \
+            for k in range(0, len(new), chunksize)]
+   for chunk in pool_map(design_chunk, tasks):
+      for initial, sensitivity in chunk:
+         design_cache[key_common + (tuple(sorted(initial.items())),)] = (grid, sensitivity)
+   return [design_cache[key] for key in keys]
+
+#------------------------------------------------------------------------------------------------------------------
+#  Fisher information and ranking of designs
+#------------------------------------------------------------------------------------------------------------------
+
+def design_schedules(n, simulationTime=simulationTime, number=20, dt=0.25, seed=None):
+   """Candidate sampling schedules with n samples: evenly spaced over the batch, over each half,
+      and random choices on a grid with step dt"""
+   rng = np.random.default_rng(seed)
+   schedules = [np.linspace(simulationTime/n, simulationTime, n), np.linspace(0, simulationTime/2, n), \
+                np.linspace(simulationTime/2, simulationTime, n)]
+   times = np.arange(dt, simulationTime + dt/2, dt)
+   for _ in range(number): schedules.append(np.sort(rng.choice(times, size=min(n, len(times)), replace=False)))
+   return schedules
+
+def design_fisher(sensitivity, schedule, sigma={'X': 0.1, 'S': 0.1}):
+   """Fisher information for the relative parameters from sensitivities at the sample times of the
+      schedule and measurement standard deviation sigma for each variable"""
+   grid, S = sensitivity
+   index = np.searchsorted(grid, schedule)
+   index = np.clip(index, 1, len(grid)-1)
+   fraction = ((np.asarray(schedule) - grid[index-1])/(grid[index] - grid[index-1]))[:, None, None]
+   J = S[index-1] + fraction*(S[index] - S[index-1])
+   J = J/np.array([sigma[key] for key in dataLocation.keys()])[None, :, None]
+   J = J.reshape(-1, S.shape[2])
+   return J.T @ J
+
+def design_rank(initials, schedules, parEstim=['Y', 'qSmax', 'Ks'], criterion='D', sigma={'X': 0.1, 'S': 0.1}, \
+                simulationTime=simulationTime, ngrid=121, options=opts_fast, parValue=parValue):
+   """Rank all combinations of initial values and sampling schedules by D-optimality, i.e. log det of
+      the Fisher information, or E-optimality, i.e. its smallest eigenvalue. Return a list of designs
+      from the best with criterion values and the relative standard deviation of each parameter."""
+   sensitivities = design_sensitivities(initials, parEstim, simulationTime, ngrid, options=options, parValue=parValue)
+   designs = []
+   for (initial, sensitivity), schedule in itertools.product(zip(initials, sensitivities), schedules):
+      if sensitivity[1] is None: continue
+      F = design_fisher(sensitivity, schedule, sigma)
+      eigenvalues = np.linalg.eigvalsh(F)
+      design = {'initial': initial, 'schedule': np.asarray(schedule), \
+                'D': np.sum(np.log(np.maximum(eigenvalues, 1e-300))), 'E': eigenvalues[0]}
+      design['std'] = dict(zip(parEstim, np.sqrt(np.diag(np.linalg.pinv(F))))) if eigenvalues[0] > 0 else None
+      designs.append(design)
+   return sorted(designs, key=lambda design: -design[criterion])
+
+def design_plot(designs, criterion='D', x='VS_start', y='VX_start'):
+   """Diagram of the best criterion value over schedules for each initial value"""
+   best = {}
+   for design in designs:
+      key = (design['initial'][x], design['initial'][y])
+      best[key] = max(best.get(key, -np.inf), design[criterion])
+   keys = list(best.keys())
+   plt.figure()
+   plt.scatter([k[0] for k in keys], [k[1] for k in keys], c=[best[k] for k in keys])
+   plt.colorbar(label=criterion + '-criterion')
+   plt.xlabel(x); plt.ylabel(y); plt.grid()
+   plt.show()
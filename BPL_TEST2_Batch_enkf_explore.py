@@ -0,0 +1,200 @@
+# Figure - Ensemble Kalman filter soft sensor for the batch reactor model
+#          run after BPL_TEST2_Batch_explore.py or BPL_TEST2_Batch_fmpy_explore.py and
+#          BPL_TEST2_Batch_calibration_explore.py that gives the worker pool, i.e. in the notebook:
+#          run -i BPL_TEST2_Batch_enkf_explore.py
+#          and start the pool with pool_start() after this script so that the workers get enkf_chunk()
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with ensemble in the worker pool, analysis of X and S with update of states and parameters
+#              and asyncio measurement feed, also a simulated feed from a dataset
+# 2026-10-19 - All chunks of the forecast end at the deadline, where late members are skipped in the workers
+#------------------------------------------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------------------------------------------
+#  Framework
+#------------------------------------------------------------------------------------------------------------------
+
+import time
+import asyncio
+import numpy as np
+import matplotlib.pyplot as plt
+
+# State of the filter where each row of states and params is one member of the ensemble
+enkf = {}
+
+# States in the order of the columns, and the outputs estimated by the filter
+enkfStates = list(stateValue.keys())
+enkfOutputs = list(mcLocation.keys())
+
+#------------------------------------------------------------------------------------------------------------------
+#  Forecast of the ensemble in the worker pool
+#------------------------------------------------------------------------------------------------------------------
+
+def enkf_chunk(task):
+   """Simulate a chunk of members from time t to t+dt and return the final states and outputs,
+      a member that fails gives a row of NaN. Members are skipped when the deadline, given as
+      time.time(), has passed, and each simulation is limited to the time left."""
+   (index, t, dt, states, params, parEstim, options, parValue, deadline) = task
+   rows = np.full((len(states), len(enkfStates) + len(enkfOutputs)), np.nan)
+   for k in range(len(states)):
+      left = deadline - time.time()
+      if left <= 0: break
+      parValueLocal = dict(parValue)
+      for i, p in enumerate(parEstim): parValueLocal[p] = params[k,i]
+      start_values = {parLocation[key]: parValueLocal[key] for key in parValueLocal.keys()}
+      start_values.update({stateValueInitial[key]: states[k,j] for j, key in enumerate(enkfStates)})
+      try:
+         res = model_simulate(start_values, dt, opts_limit(options, timeout=left), start_time=t, \
+                              output=list(mcLocation.values()))
+         rows[k,:] = [res[key][-1] for key in enkfStates] + [res[mcLocation[key]][-1] for key in enkfOutputs]
+      except Exception:
+         pass
+   return index, rows
+
+def enkf_forecast(t, deadline):
+   """Advance all members to time t in chunks over the pool. Members that fail or are not back
+      before the deadline, given as time.time(), are replaced by copies of other members.
+      Each chunk is a separate task in the pool and results that come late are discarded, while
+      the workers skip the remaining members of late chunks, so nothing is left for the next
+      forecast. Return the number replaced."""
+   n = len(enkf['states'])
+   dt = t - enkf['t']
+   nchunks = min(n, 4*pool_size())
+   chunks = np.array_split(np.arange(n), nchunks)
+   tasks = [(chunk, enkf['t'], dt, enkf['states'][chunk], enkf['params'][chunk], enkf['parEstim'], \
+             enkf['options'], enkf['parValue'], deadline) for chunk in chunks if len(chunk) > 0]
+   rows = np.full((n, len(enkfStates) + len(enkfOutputs)), np.nan)
+   if pool is None:
+      for task in tasks:
+         index, result = enkf_chunk(task)
+         rows[index] = result
+   else:
+      results = [pool.apply_async(enkf_chunk, (task,)) for task in tasks]
+      for result in results:
+         result.wait(max(deadline - time.time(), 0))
+         if result.ready() and result.successful():
+            index, rows_chunk = result.get()
+            rows[index] = rows_chunk
+   ok = np.all(np.isfinite(rows), axis=1)
+   if not np.any(ok): raise RuntimeError('No member of the ensemble could be simulated to time ' + str(t) + \
+                                         ' within the budget of ' + str(enkf['budget']) + ' s')
+   replace = np.flatnonzero(~ok)
+   source = enkf['rng'].choice(np.flatnonzero(ok), size=len(replace))
+   rows[replace] = rows[source]
+   enkf['params'][replace] = enkf['params'][source]
+   enkf['states'] = rows[:, :len(enkfStates)]
+   enkf['outputs'] = rows[:, len(enkfStates):]
+   enkf['t'] = t
+   return len(replace)
+
+#------------------------------------------------------------------------------------------------------------------
+#  Filter
+#------------------------------------------------------------------------------------------------------------------
+
+def enkf_start(parEstim=['Y', 'qSmax'], parStd=0.1, n=100, stateStd=0.05, R={'X': 0.1**2, 'S': 0.1**2}, \
+               q_state=0.01, q_par=0.01, budget=1.0, ncp=1, seed=None, options=opts_fast, parValue=parValue):
+   """Start the filter with n members at time zero. Initial states are from parValue and parameters
+      in parEstim with relative standard deviation stateStd and parStd. R is the measurement variance,
+      q_state and q_par the relative process noise per hour for states and parameters.
+      Each assimilation cycle should finish within budget seconds."""
+   rng = np.random.default_rng(seed)
+   parLocationReverse = {parLocation[key]: key for key in parLocation.keys()}
+   state_0 = np.array([parValue[parLocationReverse[stateValueInitial[key]]] for key in enkfStates])
+   par_0 = np.array([parValue[p] for p in parEstim])
+   enkf.clear()
+   enkf.update({'t': 0.0, 'parEstim': list(parEstim), 'R': dict(R), 'q_state': q_state, 'q_par': q_par, \
+                'budget': budget, 'options': options_ncp(options, ncp), 'parValue': dict(parValue), 'rng': rng, \
+                'states': state_0*np.exp(stateStd*rng.standard_normal((n, len(enkfStates)))), \
+                'params': par_0*np.exp(parStd*rng.standard_normal((n, len(parEstim)))), \
+                'outputs': None, 'history': []})
+
+def enkf_cycle(t, y):
+   """Forecast to time t and assimilate the measurements y, a dictionary with X and S where
+      a missing value is None. Parameters are updated as logarithms to stay positive.
+      Return a record of the estimates with mean and standard deviation."""
+   start_time = time.perf_counter()
+   deadline = time.time() + enkf['budget']
+   rng = enkf['rng']
+   dt = t - enkf['t']
+   if dt <= 0: return None
+
+   # Forecast with process noise
+   replaced = enkf_forecast(t, deadline)
+   n = len(enkf['states'])
+   enkf['states'] = enkf['states']*np.exp(enkf['q_state']*np.sqrt(dt)*rng.standard_normal(enkf['states'].shape))
+   enkf['params'] = enkf['params']*np.exp(enkf['q_par']*np.sqrt(dt)*rng.standard_normal(enkf['params'].shape))
+
+   # Analysis with perturbed measurements on the augmented vector of states, log-parameters and outputs
+   measured = [key for key in enkf['R'].keys() if y.get(key) is not None]
+   if measured != []:
+      ns, npar = len(enkfStates), len(enkf['parEstim'])
+      Z = np.hstack([enkf['states'], np.log(enkf['params']), enkf['outputs']])
+      Y = enkf['outputs'][:, [enkfOutputs.index(key) for key in measured]]
+      A = Z - Z.mean(axis=0)
+      B = Y - Y.mean(axis=0)
+      R = np.diag([enkf['R'][key] for key in measured])
+      C_zy = A.T @ B/(n-1)
+      C_yy = B.T @ B/(n-1) + R
+      y_obs = np.array([y[key] for key in measured]) + rng.multivariate_normal(np.zeros(len(measured)), R, size=n)
+      Z = Z + np.linalg.solve(C_yy, (y_obs - Y).T).T @ C_zy.T
+      enkf['states'] = np.maximum(Z[:, :ns], 0)
+      enkf['params'] = np.exp(Z[:, ns:ns+npar])
+      enkf['outputs'] = Z[:, ns+npar:]
+
+   record = {'time': t, 'replaced': replaced, 'wall_time': time.perf_counter() - start_time}
+   record['budget_ok'] = record['wall_time'] <= enkf['budget']
+   for j, key in enumerate(enkfOutputs):
+      record[key] = (float(np.mean(enkf['outputs'][:,j])), float(np.std(enkf['outputs'][:,j])))
+   for i, p in enumerate(enkf['parEstim']):
+      record[p] = (float(np.mean(enkf['params'][:,i])), float(np.std(enkf['params'][:,i])))
+   enkf['history'].append(record)
+   return record
+
+#------------------------------------------------------------------------------------------------------------------
+#  Measurement feed
+#------------------------------------------------------------------------------------------------------------------
+
+async def enkf_run(feed, callback=None):
+   """Run the filter on an asynchronous feed that gives (t, y) for each measurement. The cycle is
+      run in a thread so that the event loop is free while the pool works. In the notebook use
+      await enkf_run(feed) and in a script asyncio.run(enkf_run(feed))."""
+   loop = asyncio.get_running_loop()
+   records = []
+   async for t, y in feed:
+      record = await loop.run_in_executor(None, enkf_cycle, t, y)
+      if record is None: continue
+      records.append(record)
+      if callback is not None: callback(record)
+   return records
+
+async def enkf_feed_simulated(data, interval=0, noise={}, every={}, seed=None):
+   """Simulated feed of measurements from a dataset, e.g. a simulation or the data in the notebook,
+      with interval seconds between measurements. The dictionary noise gives standard deviation
+      added to X and S and the dictionary every that X or S is only given every k-th time."""
+   rng = np.random.default_rng(seed)
+   data = data_arrays(data)
+   for k in range(len(data['time'])):
+      y = {}
+      for key in dataLocation.keys():
+         if k % every.get(key, 1) == 0: y[key] = float(data[key][k] + noise.get(key, 0)*rng.standard_normal())
+         else: y[key] = None
+      yield float(data['time'][k]), y
+      await asyncio.sleep(interval)
+
+def enkf_plot(records=None, data=None):
+   """Diagram of estimated X, S and mu with plus minus two standard deviations and the data if given"""
+   records = enkf['history'] if records is None else records
+   t = np.array([record['time'] for record in records])
+   plt.figure()
+   for j, key in enumerate(enkfOutputs):
+      mean = np.array([record[key][0] for record in records])
+      std = np.array([record[key][1] for record in records])
+      plt.subplot(len(enkfOutputs), 1, j+1)
+      plt.fill_between(t, mean-2*std, mean+2*std, alpha=0.3)
+      plt.plot(t, mean)
+      if data is not None and key in dataLocation.keys(): plt.plot(data_arrays(data)['time'], data_arrays(data)[key], 'r.')
+      plt.ylabel(key); plt.grid()
+   plt.xlabel('Time [h]')
+   plt.show()
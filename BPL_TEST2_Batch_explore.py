@@ -74,6 +74,22 @@
 # 2025-11-19 - FMU-explore 1.0.2 corrected again parLocation() with sheets as argument
 # 2026-03-31 - FMU-explore 1.0.3 and switch to the right FMU for Ubuntu 22-04
 # 2026-04-11 - BPL 2.3.2
+# 2026-10-19 - Introduced model_simulate() and model_load() for use by calibration tools and worker processes
+# 2026-10-19 - Introduced opts_tune() and opts_load() for CVode tolerances saved as named opts-profiles
+# 2026-10-19 - FMU type and file can be chosen by BPL_TEST2_Batch_auto_explore.py through backend_choice
+# 2026-10-19 - Value references resolved once and used for bulk set_real() and get_real() in simu() and disp()
+# 2026-10-19 - Introduced opt-in telemetry of each simulation with telemetry_start()
+# 2026-10-19 - FMU loaded from a shared cache where it is extracted once, see BPL_TEST2_Batch_fmucache.py
+# 2026-10-19 - Introduced SimResult for compact results of model_simulate() with export to pandas and Arrow
+# 2026-10-19 - Introduced opts_limit() with wall time and step limit for each simulation in sweeps
+# 2026-10-19 - Introduced simu_schedule() with changes of parameters and states during one run
+# 2026-10-19 - Introduced opts_stop() and stop_time in model_simulate() to end when the culture has stopped
+# 2026-10-19 - Changes of simu_schedule() made by initialization from the current state as fixed parameters
+# 2026-10-19 - Changes of simu_schedule() of tunable parameters and states of ME-FMU made in the run
+# 2026-10-19 - The FMU loaded again by model_load() and others is of the type flag_type
+# 2026-10-19 - Stop condition of opts_stop() checked at each output time by a result handler in one simulation
+# 2026-10-19 - Simulation with stop_time ends at the first output time at or after stop_time
+# 2026-10-19 - Introduced backend_name of the explore script
 #------------------------------------------------------------------------------------------------------------------
 
 #------------------------------------------------------------------------------------------------------------------
@@ -87,14 +103,34 @@ import locale
 import numpy as np 
 import matplotlib.pyplot as plt
 import matplotlib.image as img
-import zipfile 
+import json
+import time
 
 from pyfmi import load_fmu
-from pyfmi.fmi import FMUException
+from pyfmi.fmi import FMUException, FMI2_REAL, FMI2_TUNABLE
+from pyfmi.fmi_algorithm_drivers import FMIResult
+from pyfmi.common.io import ResultHandlerMemory
 
 from itertools import cycle
 from importlib.metadata import version  
 
+import BPL_TEST2_Batch_telemetry
+from BPL_TEST2_Batch_telemetry import telemetry_stop, telemetry_active, telemetry_record, telemetry_summary
+from BPL_TEST2_Batch_simresult import SimResult
+from BPL_TEST2_Batch_fmucache import fmu_extract, fmu_file
+
+# Value references and data types of the loaded FMU, used for bulk set and get of real variables
+valueRef = {}
+
+def fmu_load(fmu_model, **kwargs):
+   """ Load FMU from the shared cache of extracted FMU files, or from the FMU file with an older PyFMI.
+       The value references of an earlier loaded FMU are forgotten."""
+   valueRef.clear()
+   try:
+      return load_fmu(fmu_extract(fmu_model), allow_unzipped_fmu=True, **kwargs)
+   except TypeError:
+      return load_fmu(fmu_model, **kwargs)
+
 # Set the environment - for Linux a JSON-file in the FMU is read
 if platform.system() == 'Linux': locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
 
@@ -102,25 +138,31 @@ if platform.system() == 'Linux': locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
 #  Setup application FMU
 #------------------------------------------------------------------------------------------------------------------
 
+# Backend of this explore script, e.g. announced to the workers by cluster_start()
+backend_name = 'pyfmi'
+
 # Provde the right FMU and load for different platforms in user dialogue:
 if platform.system() == 'Windows':
    print('Windows - run FMU pre-compiled JModelica 2.14')
    flag_vendor = 'JM'
    flag_type = 'CS'
    fmu_model ='BPL_TEST2_Batch_windows_jm_cs.fmu'        
-   model = load_fmu(fmu_model, log_level=0)  
+   model = fmu_load(fmu_model, log_level=0)  
 elif platform.system() == 'Linux': 
    flag_vendor = 'OM'
    flag_type = 'ME'
+   if 'backend_choice' in globals(): flag_type = backend_choice['flag_type']
    if flag_vendor in ['OM','om']:
       print('Linux - run FMU pre-compiled OpenModelica') 
       if flag_type in ['CS','cs']:         
          fmu_model ='BPL_TEST2_Batch_linux_om_cs.fmu'    
-         model = load_fmu(fmu_model, log_level=0) 
+         if 'backend_choice' in globals(): fmu_model = backend_choice['fmu_model']
+         model = fmu_load(fmu_model, kind='CS', log_level=0) 
       if flag_type in ['ME','me']:         
          fmu_model ='BPL_TEST2_Batch_linux_om_me.fmu' 
 #        fmu_model ='BPL_TEST2_Batch_linux_2404_om_me.fmu'     
-         model = load_fmu(fmu_model, log_level=0)
+         if 'backend_choice' in globals(): fmu_model = backend_choice['fmu_model']
+         model = fmu_load(fmu_model, kind='ME', log_level=0)
    else:    
       print('There is no FMU for this platform')
 
@@ -188,6 +230,26 @@ stateValue =  {}
 stateValue = model.get_states_list()
 stateValue.update(timeDiscreteStates)
 
+# Create stateValueInitial with the names of the start values for the states used in 'cont':
+stateValueInitial = {}
+for key in stateValue.keys():
+   if not key[-1] == ']':
+      if key[-3:] == 'I.y': 
+         stateValueInitial[key] = key[:-10]+'I_start'
+      elif key[-3:] == 'D.x': 
+         stateValueInitial[key] = key[:-10]+'D_start'
+      else:
+         stateValueInitial[key] = key+'_start'
+   elif key[-3] == '[':
+      stateValueInitial[key] = key[:-3]+'_start'+key[-3:]
+   elif key[-4] == '[':
+      stateValueInitial[key] = key[:-4]+'_start'+key[-4:]
+   elif key[-5] == '[':
+      stateValueInitial[key] = key[:-5]+'_start'+key[-5:]
+   else:
+      print('The state vecotr has more than 1000 states')
+      break
+
 # Create dictionaries parValue[] and parLocation[]
 parValue = {}
 parValue['V_start'] = 1.0
@@ -456,6 +518,36 @@ def readParLocation(file, sheets, parLocation=parLocation):
          parLocation_local[table['Par'][k]] = table['Location'][k]
    parLocation.update(parLocation_local)
       
+def model_valueref(names):
+   """ Value reference and data type of each variable, looked up in the loaded FMU only the first time."""
+   for name in names:
+      if name not in valueRef.keys():
+         valueRef[name] = (model.get_variable_valueref(name), model.get_variable_data_type(name))
+   return [valueRef[name] for name in names]
+
+def model_set_values(values):
+   """ Set values given as a dictionary with location names, where all real values are set in one call."""
+   names = list(values.keys())
+   refs = model_valueref(names)
+   real = [k for k in range(len(names)) if refs[k][1] == FMI2_REAL]
+   if len(real) > 0:
+      model.set_real(np.array([refs[k][0] for k in real], dtype=np.uint32), \
+                     np.array([values[names[k]] for k in real], dtype=float))
+   for k in range(len(names)):
+      if refs[k][1] != FMI2_REAL: model.set(names[k], values[names[k]])
+
+def model_get_values(names):
+   """ Get values as a dictionary with location names, where all real values are read in one call."""
+   refs = model_valueref(names)
+   real = [k for k in range(len(names)) if refs[k][1] == FMI2_REAL]
+   values = {}
+   if len(real) > 0:
+      real_values = model.get_real(np.array([refs[k][0] for k in real], dtype=np.uint32))
+      for j, k in enumerate(real): values[names[k]] = real_values[j]
+   for k in range(len(names)):
+      if refs[k][1] != FMI2_REAL: values[names[k]] = model.get(names[k])[0]
+   return values
+
 def disp(name='', decimals=3, mode='short', parValue=parValue, parLocation=parLocation):
    """ Display intial values and parameters in the model that include "name" and is in parLocation list.
        Note, it does not take the value from the dictionary par but from the model. """
@@ -464,38 +556,42 @@ def disp(name='', decimals=3, mode='short', parValue=parValue, parLocation=parLo
    def dict_reverser(d):
       seen = set()
       return {v: k for k, v in d.items() if v not in seen or seen.add(v)}
+
+   # Reverse dictionary and values from the model obtained once
+   parLocationReverse = dict_reverser(parLocation)
+   value = model_get_values(list(set([parLocation[k] for k in parValue.keys()])))
    
    if mode in ['short']:
       k = 0
       for Location in [parLocation[k] for k in parValue.keys()]:
          if name in Location:
-            if type(model.get(Location)[0]) != np.bool_:
-               print(dict_reverser(parLocation)[Location] , ':', np.round(model.get(Location)[0],decimals))
+            if type(value[Location]) != np.bool_:
+               print(parLocationReverse[Location] , ':', np.round(value[Location],decimals))
             else:
-               print(dict_reverser(parLocation)[Location] , ':', model.get(Location)[0])               
+               print(parLocationReverse[Location] , ':', value[Location])               
          else:
             k = k+1
       if k == len(parLocation):
          for parName in parValue.keys():
             if name in parName:
-               if type(model.get(Location)[0]) != np.bool_:
-                  print(parName,':', np.round(model.get(parLocation[parName])[0],decimals))
+               if type(value[Location]) != np.bool_:
+                  print(parName,':', np.round(value[parLocation[parName]],decimals))
                else: 
-                  print(parName,':', model.get(parLocation[parName])[0])
+                  print(parName,':', value[parLocation[parName]])
    if mode in ['long','location']:
       k = 0
       for Location in [parLocation[k] for k in parValue.keys()]:
          if name in Location:
-            if type(model.get(Location)[0]) != np.bool_:       
-               print(Location,':', dict_reverser(parLocation)[Location] , ':', np.round(model.get(Location)[0],decimals))
+            if type(value[Location]) != np.bool_:       
+               print(Location,':', parLocationReverse[Location] , ':', np.round(value[Location],decimals))
          else:
             k = k+1
       if k == len(parLocation):
          for parName in parValue.keys():
             if name in parName:
-               if type(model.get(Location)[0]) != np.bool_:
-                  print(parLocation[parName], ':', dict_reverser(parLocation)[Location], ':', parName,':', 
-                     np.round(model.get(parLocation[parName])[0],decimals))
+               if type(value[Location]) != np.bool_:
+                  print(parLocation[parName], ':', parLocationReverse[Location], ':', parName,':', 
+                     np.round(value[parLocation[parName]],decimals))
 
 # Line types
 def setLines(lines=['-','--',':','-.']):
@@ -511,6 +607,30 @@ def show(diagrams=diagrams):
    # Plot diagrams 
    for command in diagrams: eval(command)
 
+# Telemetry of simulations, see BPL_TEST2_Batch_telemetry.py
+def telemetry_start(file='BPL_TEST2_Batch_telemetry.jsonl', batch=100):
+   """ Start telemetry where each simulation append a record to file, read with telemetry_summary(file)."""
+   BPL_TEST2_Batch_telemetry.telemetry_start(file, batch, backend=backend_name, flag_type=flag_type, fmu_model=fmu_model)
+
+def simulate_logged(mode, values, **kwargs):
+   """ Call model.simulate() and add a record with wall time and solver statistics if telemetry is started."""
+   if not telemetry_active():
+      return model.simulate(**kwargs)
+   simulationTime = kwargs['final_time'] - kwargs.get('start_time', 0)
+   start = time.perf_counter()
+   try:
+      sim_res = model.simulate(**kwargs)
+   except FMUException as error:
+      telemetry_record(mode, simulationTime, time.perf_counter()-start, False, values, error=str(error))
+      raise
+   wall_time = time.perf_counter() - start
+   try:
+      statistics = {'nsteps': int(sim_res.solver.statistics['nsteps']), 'nfcns': int(sim_res.solver.statistics['nfcns'])}
+   except (AttributeError, KeyError, TypeError):
+      statistics = {}
+   telemetry_record(mode, simulationTime, wall_time, True, values, statistics)
+   return sim_res
+
 # Simulation
 def simu(simulationTimeLocal=simulationTime, mode='Initial', options=opts_std, \
          diagrams=diagrams,timeDiscreteStates=timeDiscreteStates, stateValue=stateValue, \
@@ -537,16 +657,15 @@ def simu(simulationTimeLocal=simulationTime, mode='Initial', options=opts_std, \
          
    # Load model
    if model is None:
-      model = load_fmu(fmu_model) 
+      model = fmu_load(fmu_model, kind=flag_type) 
    model.reset()
       
    # Run simulation
    if mode in ['Initial', 'initial', 'init']:
       # Set parameters and intial state values:
-      for key in parValue.keys():
-         model.set(parLocation[key],parValue[key])   
+      model_set_values({parLocation[key]: parValue[key] for key in parValue.keys()})
       # Simulate
-      sim_res = model.simulate(final_time=simulationTime, options=options)  
+      sim_res = simulate_logged('init', parValue, final_time=simulationTime, options=options)  
       simulationDone = True
    elif mode in ['Continued', 'continued', 'cont']:
 
@@ -555,31 +674,13 @@ def simu(simulationTimeLocal=simulationTime, mode='Initial', options=opts_std, \
       else:
          
          # Set parameters and intial state values:
-         for key in parValue.keys():
-            model.set(parLocation[key],parValue[key])                
-
-         for key in stateValue.keys():
-            if not key[-1] == ']':
-               if key[-3:] == 'I.y': 
-                  model.set(key[:-10]+'I_start', stateValue[key]) 
-               elif key[-3:] == 'D.x': 
-                  model.set(key[:-10]+'D_start', stateValue[key]) 
-               else:
-                  model.set(key+'_start', stateValue[key])
-            elif key[-3] == '[':
-               model.set(key[:-3]+'_start'+key[-3:], stateValue[key]) 
-            elif key[-4] == '[':
-               model.set(key[:-4]+'_start'+key[-4:], stateValue[key]) 
-            elif key[-5] == '[':
-               model.set(key[:-5]+'_start'+key[-5:], stateValue[key]) 
-            else:
-               print('The state vecotr has more than 1000 states')
-               break
+         model_set_values({parLocation[key]: parValue[key] for key in parValue.keys()})
+         model_set_values({stateValueInitial[key]: stateValue[key] for key in stateValue.keys()})
 
          # Simulate
-         sim_res = model.simulate(start_time=prevFinalTime,
-                                 final_time=prevFinalTime + simulationTime,
-                                 options=options) 
+         sim_res = simulate_logged('cont', parValue, start_time=prevFinalTime,
+                                   final_time=prevFinalTime + simulationTime,
+                                   options=options) 
          simulationDone = True             
    else:
       print("Simulation mode not correct")
@@ -594,7 +695,7 @@ def simu(simulationTimeLocal=simulationTime, mode='Initial', options=opts_std, \
       for command in diagrams: eval(command)
             
       # Store final state values stateValue:
-      for key in list(stateValue.keys()): stateValue[key] = model.get(key)[0]        
+      stateValue.update(model_get_values(list(stateValue.keys())))
 
       # Store time from where simulation will start next time
       prevFinalTime = model.time
@@ -602,6 +703,274 @@ def simu(simulationTimeLocal=simulationTime, mode='Initial', options=opts_std, \
    else:
       print('Error: No simulation done')
       
+# Simulation without plots for calibration tools and worker processes
+def model_load(fmu_model=fmu_model):
+   """ Load a fresh instance of the FMU of the type flag_type, e.g. in each worker process of a pool. """
+   global model
+   model = fmu_load(fmu_model, kind=flag_type, log_level=0)
+
+def model_simulate(start_values, simulationTime=simulationTime, options=opts_fast, start_time=0, output=[], \
+                   variables=None, dtype=np.float64, stop_time=None):
+   """ Simulate with start values given as a dictionary of location names and return the result. 
+       Neither plots nor sim_res, stateValue and prevFinalTime are updated. Use options with 
+       result_handling 'memory' when run in several processes. The argument output is used only by FMPy.
+       With variables, a list or a dictionary of aliases, only these are returned in a compact SimResult.
+       Options from opts_stop() end the simulation when the culture has stopped and the remaining output times
+       get the final values. With stop_time the simulation ends at the first output time at or after stop_time,
+       and the remaining output times get NaN. Then the result is a SimResult with all variables."""
+   global model
+   if model is None:
+      model = fmu_load(fmu_model, kind=flag_type, log_level=0)
+   model.reset()
+   model_set_values(start_values)
+   stop = options.get('stop')
+   if stop is None and stop_time is None:
+      sim_res = simulate_logged('model_simulate', start_values, start_time=start_time, \
+                                final_time=start_time+simulationTime, options=options)
+   else:
+      sim_res = model_simulate_stop(start_values, simulationTime, options, start_time, stop, stop_time)
+   if variables is None: return sim_res
+   return SimResult.from_result(sim_res, variables, dtype)
+
+def model_result(res):
+   """ SimResult of the variables of a PyFMI result that vary in time, i.e. without the parameters """
+   n = len(res['time'])
+   return SimResult.from_result(res, [name for name in res.keys() if name != 'time' and len(res[name]) == n])
+
+class SimulationStopped(Exception):
+   """ Raised by StopResultHandler when the stop condition holds """
+
+class StopResultHandler(ResultHandlerMemory):
+   """ Result in memory as for result_handling 'memory', where the simulation ends with SimulationStopped at the
+       first output time where the stop condition of opts_stop() holds. The derivatives are read as variables
+       so that the condition is the same for ME-FMU and CS-FMU."""
+   def __init__(self, model, stop):
+      ResultHandlerMemory.__init__(self, model)
+      self.stop = stop
+      self.references = np.array([model.get_variable_valueref(stop['location'])] + \
+                                 [variable.value_reference for variable in model.get_derivatives_list().values()], \
+                                 dtype=np.uint32)
+
+   def integration_point(self, solver=None):
+      ResultHandlerMemory.integration_point(self, solver)
+      values = np.abs(self.model.get_real(self.references))
+      if values[0] < self.stop['eps'] and np.max(values[1:], initial=0) < self.stop['dtol']: raise SimulationStopped()
+
+def model_simulate_stop(start_values, simulationTime, options, start_time, stop, stop_time):
+   """ Simulation for model_simulate() with stop condition or stop_time in one call of model.simulate(). The
+       condition is checked at each output time by StopResultHandler, and with stop_time the simulation ends at
+       the first output time at or after stop_time, so that the result covers stop_time. The result has the output
+       times of ncp, where the remaining times get the final values when stopped by the condition and otherwise NaN."""
+   options = {key: value for key, value in options.items() if key != 'stop'}
+   ncp = options['ncp']
+   dt = simulationTime/ncp
+   grid = start_time + dt*np.arange(ncp + 1)
+   if stop_time is not None:
+      grid = grid[:min(max(int(np.ceil((stop_time - start_time)/dt - 1e-9)), 1), ncp) + 1]
+   options['ncp'] = len(grid) - 1
+   final_time = grid[-1]
+   handler = None
+   if stop is not None and stop['location'] is not None:
+      handler = StopResultHandler(model, stop)
+      options['result_handling'] = 'custom'
+      options['result_handler'] = handler
+   try:
+      data = model_result(simulate_logged('model_simulate', start_values, start_time=start_time, final_time=final_time, \
+                                          options=options))
+      stopped = False
+   except SimulationStopped:
+      data = model_result(FMIResult(model, result_data=handler.get_result(), options=options))
+      stopped = True
+
+   # Keep one row for each output time, also with events, and fill the remaining output times
+   grid = start_time + dt*np.arange(ncp + 1)
+   index = np.rint((data.data[0] - start_time)/dt).astype(int)
+   index, rows = np.unique(index, return_index=True)
+   keep = np.abs(data.data[0, rows] - grid[np.minimum(index, ncp)]) <= dt*1e-6
+   values = data.data[:, rows[keep]]
+   values = values[:, values[0] <= final_time + dt*1e-9]
+   rest = np.repeat(data.data[:, -1:], ncp + 1 - values.shape[1], axis=1) if stopped else \
+          np.full((len(values), ncp + 1 - values.shape[1]), np.nan)
+   values = np.concatenate([values, rest], axis=1)
+   values[0] = grid
+   return SimResult(values, data.names)
+
+# Simulation with a schedule of changes during the run
+def schedule_entries(schedule, simulationTime=simulationTime):
+   """ Schedule as a sorted list of (time, parameter changes, state increments) """
+   entries = [(float(entry[0]), dict(entry[1]), dict(entry[2]) if len(entry) > 2 else {}) for entry in schedule]
+   if any([entry[0] <= 0 for entry in entries]): raise ValueError('Changes at the start are given by par() and init()')
+   late = [entry[0] for entry in entries if entry[0] >= simulationTime]
+   if late != []: raise ValueError('Changes at time ' + str(late) + ' not before the simulation time ' + str(simulationTime))
+   for (_, _, increments) in entries:
+      for key in increments.keys():
+         if key not in stateValueInitial.keys(): raise ValueError('State increment of ' + key + ' not a state')
+   return sorted(entries, key=lambda entry: entry[0])
+
+def model_simulate_schedule(start_values, schedule, simulationTime=simulationTime, options=opts_fast, output=[], \
+                            parLocation=parLocation):
+   """ Simulate as model_simulate() with a schedule of changes during the run, a list of (time, parameter 
+       changes) or (time, parameter changes, state increments), e.g. [(3, {'qSmax': 0.7}), (4, {}, {'bioreactor.m[2]': 5})],
+       with parameters named as in par() and states as in stateValue. Changes of tunable parameters, and state
+       increments of an ME-FMU, are made in the run that continues with initialize False. Changes of fixed
+       parameters, and state increments of a CS-FMU, need initialization again from the state at that time as
+       in simu('cont'), which costs about one more simulation for each such change. At the time of a change
+       the result has one row with the values after the change. Return a SimResult."""
+   global model
+   if model is None:
+      model = fmu_load(fmu_model, kind=flag_type, log_level=0)
+   entries = schedule_entries(schedule, simulationTime)
+   restart = lambda entry: (entry[2] != {} and flag_type == 'CS') or \
+                           any([model.get_variable_variability(parLocation[key]) != FMI2_TUNABLE for key in entry[1].keys()])
+   states = list(model.get_states_list().keys()) if flag_type == 'ME' else []
+   times = [0.0] + sorted(set([entry[0] for entry in entries])) + [simulationTime]
+   options = {key: value for key, value in options.items() if key != 'stop'}
+   values = dict(start_values)
+   segments = []
+   for k in range(len(times)-1):
+      changes = [entry for entry in entries if entry[0] == times[k]]
+      for (_, parChanges, increments) in changes:
+         values.update({parLocation[key]: value for key, value in parChanges.items()})
+         for key, value in increments.items(): values[stateValueInitial[key]] = values[stateValueInitial[key]] + value
+      opts = dict(options)
+      opts['ncp'] = max(int(round(options['ncp']*(times[k+1]-times[k])/simulationTime)), 1)
+      if k == 0 or any([restart(entry) for entry in changes]):
+         res = model_simulate(values, times[k+1]-times[k], opts, start_time=times[k])
+      else:
+         if flag_type == 'ME': model.enter_event_mode()
+         model_set_values({parLocation[key]: value for (_, parChanges, _) in changes for key, value in parChanges.items()})
+         if flag_type == 'ME':
+            model.event_update()
+            model.enter_continuous_time_mode()
+            x = model.continuous_states.copy()
+            for (_, _, increments) in changes:
+               for key, value in increments.items(): x[states.index(key)] = x[states.index(key)] + value
+            model.continuous_states = x
+         opts['initialize'] = False
+         res = simulate_logged('model_simulate', values, start_time=times[k], final_time=times[k+1], options=opts)
+      segment = model_result(res)
+      segments.append(segment.data if k == len(times)-2 else segment.data[:, :-1])
+      values.update({stateValueInitial[key]: value for key, value in model_get_values(list(stateValueInitial.keys())).items()})
+   return SimResult(np.concatenate(segments, axis=1), segment.names)
+
+def simu_schedule(schedule, simulationTime=simulationTime, options=opts_std, diagrams=diagrams, \
+                  parValue=parValue, parLocation=parLocation):
+   """ Simulation from the start as simu() with a schedule of changes during the run, see model_simulate_schedule(), 
+       e.g. simu_schedule([(3, {'qSmax': 0.7}), (4, {}, {'bioreactor.m[2]': 5})]). Parameters keep the values 
+       in parValue, i.e. the changes are only for this simulation."""
+   global sim_res, prevFinalTime, t
+   options = options.copy()
+   options['result_handling'] = 'memory'
+   sim_res = model_simulate_schedule({parLocation[key]: parValue[key] for key in parValue.keys()}, schedule, \
+                                     simulationTime, options)
+   t = sim_res['time']
+   linetype = next(linecycler)    
+   for command in diagrams: eval(command)
+   stateValue.update(model_get_values(list(stateValue.keys())))
+   prevFinalTime = model.time
+
+# Solver tolerance tuning and named opts-profiles saved on file
+def opts_solver(rtol=None, atol=None, maxh=None, ncp=12):
+   """ Opts-profile like opts_fast for ME-FMU with given CVode tolerances and maximal step, None means default."""
+   opts = model.simulate_options()
+   opts["CVode_options"]["verbosity"] = 50 
+   if rtol is not None: opts["CVode_options"]["rtol"] = rtol
+   if atol is not None: opts["CVode_options"]["atol"] = atol
+   if maxh is not None: opts["CVode_options"]["maxh"] = maxh
+   opts['ncp'] = ncp
+   opts['result_handling'] = 'memory'
+   return opts
+
+def opts_stop(options=opts_fast, location='bioreactor.c[2]', eps=1e-3, dtol=1e-4, data=True):
+   """ Copy of an opts-profile where model_simulate() ends when the variable at location is below eps and all 
+       state derivatives are below dtol, i.e. the culture has stopped since substrate is exhausted, checked at 
+       the output times. With data the calibration tools simulate only up to the last time of data. 
+       Use location None for only the data."""
+   options = dict(options)
+   options['stop'] = {'location': location, 'eps': eps, 'dtol': dtol, 'data': data}
+   return options
+
+def opts_limit(options=opts_fast, timeout=None, maxsteps=None):
+   """ Copy of an opts-profile where a simulation fails with an exception when it takes longer than timeout 
+       seconds of wall time, or more than maxsteps CVode steps. Only for ME-FMU, for CS-FMU use the timeout of sweep()."""
+   options = options.copy()
+   if flag_type in ['ME', 'me']:
+      options["CVode_options"] = dict(options["CVode_options"])
+      if timeout is not None: options["CVode_options"]["time_limit"] = timeout
+      if maxsteps is not None: options["CVode_options"]["maxsteps"] = maxsteps
+   return options
+
+def opts_tune(parSets=[{}], simulationTime=simulationTime, tolerance=1e-3, ncp=12, name='opts_tuned', \
+              file='opts_profiles.json', rtol_list=[1e-4, 1e-5, 1e-6, 1e-7, 1e-8], atol_factor_list=[1, 0.01], \
+              maxh_list=[None], repeat=3, variables=['bioreactor.c[1]', 'bioreactor.c[2]'], parValue=parValue, \
+              parLocation=parLocation):
+   """ Find the cheapest CVode setting of rtol, atol = factor*rtol and maxh where X and S stay within tolerance,
+       relative to the largest value, from a reference simulation with tight tolerances. The check is done for each
+       of the parameter sets in parSets given as dictionaries that update parValue. The chosen setting is saved 
+       with name in the file and can later be used with opts_load(name). Return a table of all settings tried."""
+   if flag_type not in ['ME', 'me']:
+      print('Error: Tuning of CVode tolerances only for ME-FMU')
+      return
+
+   def run(opts):
+      elapsed = []
+      results = []
+      for parSet in parSets:
+         parValueLocal = dict(parValue); parValueLocal.update(parSet)
+         start_values = {parLocation[k]:parValueLocal[k] for k in parValueLocal.keys()}
+         wall_time = []
+         for k in range(repeat):
+            start_time = time.perf_counter()
+            sim_res = model_simulate(start_values, simulationTime, opts)
+            wall_time.append(time.perf_counter() - start_time)
+         elapsed.append(min(wall_time))
+         results.append(sim_res)
+      return sum(elapsed), results
+
+   # Reference with tight tolerances and the default setting for comparison
+   t_grid = np.linspace(0, simulationTime, ncp+1)
+   _, reference = run(opts_solver(rtol=1e-10, atol=1e-12, ncp=ncp))
+   reference = [{v: np.interp(t_grid, res['time'], res[v]) for v in variables} for res in reference]
+   def error(results):
+      return max([np.max(np.abs(np.interp(t_grid, res['time'], res[v]) - ref[v]))/max(np.max(np.abs(ref[v])), 1e-12) \
+                 for res, ref in zip(results, reference) for v in variables])
+   time_default, results = run(opts_solver(ncp=ncp))
+   table = [{'rtol': None, 'atol': None, 'maxh': None, 'time': time_default, 'error': error(results)}]
+
+   # Search all settings and choose the fastest within tolerance
+   for rtol in rtol_list:
+      for atol_factor in atol_factor_list:
+         for maxh in maxh_list:
+            try:
+               elapsed, results = run(opts_solver(rtol, atol_factor*rtol, maxh, ncp))
+               table.append({'rtol': rtol, 'atol': atol_factor*rtol, 'maxh': maxh, 'time': elapsed, 'error': error(results)})
+            except FMUException:
+               table.append({'rtol': rtol, 'atol': atol_factor*rtol, 'maxh': maxh, 'time': np.inf, 'error': np.inf})
+   accepted = [row for row in table if row['error'] <= tolerance]
+   if accepted == []:
+      print('Error: No setting within tolerance', tolerance)
+      return table
+   best = min(accepted, key=lambda row: row['time'])
+
+   # Save the profile on file together with earlier profiles
+   profile = dict(best); profile.update({'ncp': ncp, 'tolerance': tolerance, 'speedup': time_default/best['time'], \
+                                         'fmu_model': fmu_model})
+   try:
+      with open(file) as f: profiles = json.load(f)
+   except FileNotFoundError:
+      profiles = {}
+   profiles[name] = profile
+   with open(file, 'w') as f: json.dump(profiles, f, indent=3)
+   print(name, ': rtol =', best['rtol'], 'atol =', best['atol'], 'maxh =', best['maxh'], \
+         'error =', np.round(best['error'], 6), 'speedup =', np.round(profile['speedup'], 2))
+   return table
+
+def opts_load(name, file='opts_profiles.json', ncp=None):
+   """ Opts-profile with CVode settings saved by opts_tune(), optionally with another ncp."""
+   with open(file) as f: profile = json.load(f)[name]
+   if ncp is None: ncp = profile['ncp']
+   return opts_solver(profile['rtol'], profile['atol'], profile['maxh'], ncp)
+
 # Describe model parts of the combined system
 def describe_parts(component_list=[]):
    """List all parts of the model""" 
@@ -679,9 +1048,8 @@ def describe_general(name, decimals, parLocation=parLocation):
          
 # Plot process diagram
 def process_diagram(fmu_model=fmu_model, fmu_process_diagram=fmu_process_diagram):   
-   try:
-       process_diagram = zipfile.ZipFile(fmu_model, 'r').open('documentation/processDiagram.png')
-   except KeyError:
+   process_diagram = fmu_file(fmu_model, 'documentation/processDiagram.png')
+   if process_diagram is None:
        print('No processDiagram.png file in the FMU, but try the file on disk.')
        process_diagram = fmu_process_diagram
    try:
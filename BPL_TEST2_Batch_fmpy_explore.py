@@ -40,6 +40,19 @@
 # 2025-11-19 - FMU-explore 1.0.2 corrected again parLocation() with sheets as argument
 # 2026-03-31 - FMU-explore 1.0.3
 # 2026-04-11 - BPL 2.3.2
+# 2026-10-19 - Introduced model_simulate() and model_load() for use by calibration tools and worker processes
+# 2026-10-19 - FMU type and file can be chosen by BPL_TEST2_Batch_auto_explore.py through backend_choice
+# 2026-10-19 - Introduced opt-in telemetry of each simulation with telemetry_start()
+# 2026-10-19 - FMU extracted once to a shared cache and model description parsed once, see BPL_TEST2_Batch_fmucache.py
+# 2026-10-19 - Introduced SimResult for compact results of model_simulate() with export to pandas and Arrow
+# 2026-10-19 - Introduced opts_limit() with wall time and step limit for each simulation in sweeps
+# 2026-10-19 - Introduced simu_schedule() with changes of parameters and states as time events in one run
+# 2026-10-19 - Introduced opts_stop() and stop_time in model_simulate() to end when the culture has stopped
+# 2026-10-19 - Changes of simu_schedule() made by initialization from the current state as fixed parameters
+# 2026-10-19 - Changes of simu_schedule() of tunable parameters as time events and others by reset of one FMU instance
+# 2026-10-19 - Results of opts_stop() and stop_time in model_simulate() kept on the output times
+# 2026-10-19 - Simulation with stop_time ends at the first output time at or after stop_time
+# 2026-10-19 - Introduced backend_name of the explore script
 #------------------------------------------------------------------------------------------------------------------
 
 #------------------------------------------------------------------------------------------------------------------
@@ -53,15 +66,19 @@ import locale
 import numpy as np 
 import matplotlib.pyplot as plt
 import matplotlib.image as img
-import zipfile  
+import time
 
 from fmpy import simulate_fmu
-from fmpy import read_model_description
 import fmpy as fmpy
 
 from itertools import cycle
 from importlib.metadata import version  
 
+import BPL_TEST2_Batch_telemetry
+from BPL_TEST2_Batch_telemetry import telemetry_stop, telemetry_active, telemetry_record, telemetry_summary
+from BPL_TEST2_Batch_simresult import SimResult
+from BPL_TEST2_Batch_fmucache import fmu_extract, fmu_model_description, fmu_file
+
 # Set the environment - for Linux a JSON-file in the FMU is read
 if platform.system() == 'Linux': locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
 
@@ -69,6 +86,9 @@ if platform.system() == 'Linux': locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
 #  Setup application FMU
 #------------------------------------------------------------------------------------------------------------------
 
+# Backend of this explore script, e.g. announced to the workers by cluster_start()
+backend_name = 'fmpy'
+
 # Provde the right FMU and load for different platforms in user dialogue:
 if platform.system() == 'Windows':
    print('Windows - run FMU pre-compiled JModelica 2.14')
@@ -81,9 +101,18 @@ elif platform.system() == 'Linux':
 #  fmu_model ='BPL_TEST2_Batch_linux_2404_om_me.fmu'  
    flag_vendor = 'OM' 
    flag_type = 'ME'
+   if 'backend_choice' in globals():
+      fmu_model = backend_choice['fmu_model']
+      flag_type = backend_choice['flag_type']
 else:    
    print('There is no FMU for this platform')
 
+# FMU type used by simulate_fmu()
+if flag_type in ['CS', 'cs']:
+   fmi_type = 'CoSimulation'
+else:
+   fmi_type = 'ModelExchange'
+
 # Provide various opts-profiles
 if flag_type in ['CS', 'cs']:
    opts_std = {'NCP': 500}
@@ -96,8 +125,8 @@ elif flag_type in ['ME', 'me']:
 else:    
    print('There is no FMU for this platform')
 
-# Extract model_description from fmu_model
-model_description = read_model_description(fmu_model)
+# Extract model_description from fmu_model - parsed once and kept in the FMU cache
+model_description = fmu_model_description(fmu_model)
 
 # Provide various MSL and BPL versions
 if flag_vendor in ['JM', 'jm']:
@@ -487,6 +516,25 @@ def show(diagrams=diagrams):
    # Plot diagrams 
    for command in diagrams: eval(command)
 
+# Telemetry of simulations, see BPL_TEST2_Batch_telemetry.py
+def telemetry_start(file='BPL_TEST2_Batch_telemetry.jsonl', batch=100):
+   """ Start telemetry where each simulation append a record to file, read with telemetry_summary(file)."""
+   BPL_TEST2_Batch_telemetry.telemetry_start(file, batch, backend=backend_name, flag_type=flag_type, fmu_model=fmu_model)
+
+def simulate_logged(mode, values, **kwargs):
+   """ Call simulate_fmu() and add a record with wall time if telemetry is started."""
+   if not telemetry_active():
+      return simulate_fmu(**kwargs)
+   simulationTime = kwargs['stop_time'] - kwargs['start_time']
+   start = time.perf_counter()
+   try:
+      sim_res = simulate_fmu(**kwargs)
+   except Exception as error:
+      telemetry_record(mode, simulationTime, time.perf_counter()-start, False, values, error=repr(error))
+      raise
+   telemetry_record(mode, simulationTime, time.perf_counter()-start, True, values)
+   return sim_res
+
 # Define simulation
 def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagrams=diagrams, fmu_model=fmu_model, \
          stateValue=stateValue, stateValueInitial=stateValueInitial, stateValueInitialLoc=stateValueInitialLoc, \
@@ -516,9 +564,11 @@ def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagra
       start_values = {parLocation[k]:parValue[k] for k in parValue.keys()}
       
       # Simulate
-      sim_res = simulate_fmu(
-         filename = fmu_model,
+      sim_res = simulate_logged('init', start_values,
+         filename = fmu_extract(fmu_model),
+         model_description = fmu_model_description(fmu_model),
          validate = False,
+         fmi_type = fmi_type,
          start_time = 0,
          stop_time = simulationTime,
          output_interval = simulationTime/options['NCP'],
@@ -552,9 +602,11 @@ def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagra
          start_values = {parLocationMod[k]:parValueMod[k] for k in parValueMod.keys()}
   
          # Simulate
-         sim_res = simulate_fmu(
-            filename = fmu_model,
+         sim_res = simulate_logged('cont', start_values,
+            filename = fmu_extract(fmu_model),
+            model_description = fmu_model_description(fmu_model),
             validate = False,
+            fmi_type = fmi_type,
             start_time = prevFinalTime,
             stop_time = prevFinalTime + simulationTime,
             output_interval = simulationTime/options['NCP'],
@@ -584,6 +636,177 @@ def simu(simulationTime=simulationTime, mode='Initial', options=opts_std, diagra
    else:
       print('Error: No simulation done')
             
+# Simulation without plots for calibration tools and worker processes
+def model_load(fmu_model=fmu_model):
+   """ Corresponds to the pyfmi version, but FMPy instantiates the FMU in each call of simulate_fmu(). """
+   pass
+
+def model_simulate(start_values, simulationTime=simulationTime, options=opts_fast, start_time=0, output=[], \
+                   fmu_model=fmu_model, stateValue=stateValue, keyVariables=keyVariables, variables=None, dtype=np.float64, \
+                   stop_time=None, fmu_instance=None, input=None):
+   """ Simulate with start values given as a dictionary of location names and return the result. 
+       Neither plots nor sim_res, stateValue and prevFinalTime are updated. Beside the variables
+       in output are always the states and keyVariables stored. With fmu_instance the FMU instantiated before
+       is used, and reset by the caller before the next simulation. With input, a structured array of time
+       and tunable parameters as for simulate_fmu(), the parameters change during the run.
+       With variables, a list or a dictionary of aliases, only these are returned in a compact SimResult.
+       Options from opts_limit() make the simulation fail when it exceeds the wall time or number of steps.
+       Options from opts_stop() end the simulation when the culture has stopped and the remaining output times
+       get the final values. With stop_time the simulation ends at the first output time at or after stop_time,
+       and the remaining output times get NaN."""
+   if variables is not None:
+      locations = list(variables.values()) if isinstance(variables, dict) else list(variables)
+      output = output + [location for location in locations if location != 'time']
+   timeout, maxsteps, stop = options.get('timeout'), options.get('maxsteps'), options.get('stop')
+   dt = simulationTime/options['NCP']
+   final_time = start_time + simulationTime if stop_time is None else \
+                start_time + dt*min(max(int(np.ceil((stop_time - start_time)/dt - 1e-9)), 1), options['NCP'])
+   if stop is not None and stop['location'] is not None:
+      model_description = fmu_model_description(fmu_model)
+      references = [variable.valueReference for variable in model_description.modelVariables \
+                    if variable.name == stop['location']] + \
+                   [derivative.variable.valueReference for derivative in model_description.derivatives]
+   steps, stopped = [0], [False]
+   def step_finished(time, recorder):
+      steps[0] = steps[0] + 1
+      if stop is not None and stop['location'] is not None:
+         values = np.abs(recorder.fmu.getReal(references))
+         stopped[0] = values[0] < stop['eps'] and np.max(values[1:]) < stop['dtol']
+         if stopped[0]: recorder.sample(time, force=True)
+      return not stopped[0] and (maxsteps is None or steps[0] <= maxsteps)
+   sim_res = simulate_logged('model_simulate', start_values,
+      filename = fmu_extract(fmu_model),
+      model_description = fmu_model_description(fmu_model),
+      validate = False,
+      fmi_type = fmi_type,
+      start_time = start_time,
+      stop_time = final_time,
+      output_interval = simulationTime/options['NCP'],
+      record_events = True,
+      start_values = start_values,
+      fmi_call_logger = None,
+      timeout = timeout,
+      fmu_instance = fmu_instance,
+      input = input,
+      step_finished = step_finished if maxsteps is not None or stop is not None else None,
+      output = list(set(output + list(stateValue.keys()) + keyVariables))
+   )
+   if not stopped[0] and (timeout is not None or maxsteps is not None) and sim_res['time'][-1] < final_time - simulationTime*1e-9:
+      raise RuntimeError('Simulation stopped at time ' + str(sim_res['time'][-1]) + ' by the limit of ' + \
+                         str(timeout) + ' s or ' + str(maxsteps) + ' steps')
+   grid = start_time + simulationTime/options['NCP']*np.arange(options['NCP'] + 1)
+   last = sim_res[-1:]
+   if stop is not None or stop_time is not None:
+      # Keep one row for each output time, without the row at the time of stop between them
+      index, rows = np.unique(np.rint((sim_res['time'] - start_time)/dt).astype(int), return_index=True)
+      sim_res = sim_res[rows[np.abs(sim_res['time'][rows] - grid[np.minimum(index, options['NCP'])]) <= dt*1e-6]]
+   grid = grid[grid > sim_res['time'][-1] + simulationTime*1e-9]
+   if len(grid) > 0:
+      rest = np.repeat(last, len(grid))
+      if not stopped[0]:
+         for name in rest.dtype.names: rest[name] = np.nan
+      rest['time'] = grid
+      sim_res = np.concatenate([sim_res, rest])
+   if variables is None: return sim_res
+   return SimResult.from_result(sim_res, variables, dtype)
+
+# Simulation with a schedule of changes during the run
+def schedule_entries(schedule, simulationTime=simulationTime):
+   """ Schedule as a sorted list of (time, parameter changes, state increments) """
+   entries = [(float(entry[0]), dict(entry[1]), dict(entry[2]) if len(entry) > 2 else {}) for entry in schedule]
+   if any([entry[0] <= 0 for entry in entries]): raise ValueError('Changes at the start are given by par() and init()')
+   late = [entry[0] for entry in entries if entry[0] >= simulationTime]
+   if late != []: raise ValueError('Changes at time ' + str(late) + ' not before the simulation time ' + str(simulationTime))
+   for (_, _, increments) in entries:
+      for key in increments.keys():
+         if key not in stateValueInitial.keys(): raise ValueError('State increment of ' + key + ' not a state')
+   return sorted(entries, key=lambda entry: entry[0])
+
+def schedule_input(values, changes, start_time, fmu_model=fmu_model, parLocation=parLocation):
+   """ Input of simulate_fmu() with the changes of tunable parameters as steps at their times, or None """
+   if changes == []: return None
+   locations = sorted(set([parLocation[key] for (_, parChanges, _) in changes for key in parChanges.keys()]))
+   current = {variable.name: float(variable.start) for variable in fmu_model_description(fmu_model).modelVariables \
+              if variable.name in locations}
+   current.update({location: values[location] for location in locations if location in values.keys()})
+   rows = [(start_time,) + tuple([current[location] for location in locations])]
+   for t in sorted(set([entry[0] for entry in changes])):
+      rows.append((t,) + tuple([current[location] for location in locations]))
+      for (_, parChanges, _) in [entry for entry in changes if entry[0] == t]:
+         current.update({parLocation[key]: value for key, value in parChanges.items()})
+      rows.append((t,) + tuple([current[location] for location in locations]))
+   return np.array(rows, dtype=[('time', np.float64)] + [(location, np.float64) for location in locations])
+
+def model_simulate_schedule(start_values, schedule, simulationTime=simulationTime, options=opts_fast, output=[], \
+                            fmu_model=fmu_model, stateValue=stateValue, keyVariables=keyVariables, parLocation=parLocation):
+   """ Simulate as model_simulate() with a schedule of changes during the run, a list of (time, parameter 
+       changes) or (time, parameter changes, state increments), e.g. [(3, {'qSmax': 0.7}), (4, {}, {'bioreactor.m[2]': 5})],
+       with parameters named as in par() and states as in stateValue. Changes of tunable parameters are time
+       events of the run, given as input to simulate_fmu(). Changes of fixed parameters and state increments
+       need initialization again from the state at that time as in simu('cont'), done by a reset of the same
+       FMU instance so that each costs about a fifth of a new simulation. Each part is simulated by
+       model_simulate() with the options, e.g. from opts_limit(). At the time of a change the result has one
+       row with the values after the change."""
+   entries = schedule_entries(schedule, simulationTime)
+   model_description = fmu_model_description(fmu_model)
+   variability = {variable.name: variable.variability for variable in model_description.modelVariables}
+   restart = lambda entry: entry[2] != {} or any([variability[parLocation[key]] != 'tunable' for key in entry[1].keys()])
+   times = [0.0] + sorted(set([entry[0] for entry in entries if restart(entry)])) + [simulationTime]
+   options = {key: value for key, value in options.items() if key != 'stop'}
+   values = dict(start_values)
+   segments = []
+   fmu = fmpy.instantiate_fmu(fmu_extract(fmu_model), model_description, fmi_type)
+   try:
+      for k in range(len(times)-1):
+         for (_, parChanges, increments) in [entry for entry in entries if entry[0] == times[k]]:
+            values.update({parLocation[key]: value for key, value in parChanges.items()})
+            for key, value in increments.items(): values[stateValueInitial[key]] = values[stateValueInitial[key]] + value
+         changes = [entry for entry in entries if times[k] < entry[0] < times[k+1]]
+         opts = dict(options)
+         opts['NCP'] = max(int(round(options['NCP']*(times[k+1]-times[k])/simulationTime)), 1)
+         if k > 0: fmu.reset()
+         res = model_simulate(values, times[k+1]-times[k], opts, times[k], output, fmu_model, stateValue, keyVariables, \
+                              fmu_instance=fmu, input=schedule_input(values, changes, times[k], fmu_model, parLocation))
+         res = res[np.append(np.diff(res['time']) > 0, True)]
+         segments.append(res if k == len(times)-2 else res[:-1])
+         for (_, parChanges, _) in changes: values.update({parLocation[key]: value for key, value in parChanges.items()})
+         values.update({stateValueInitial[key]: res[key][-1] for key in stateValue.keys()})
+   finally:
+      fmu.freeInstance()
+   return np.concatenate(segments)
+
+def simu_schedule(schedule, simulationTime=simulationTime, options=opts_std, diagrams=diagrams, \
+                  parValue=parValue, parLocation=parLocation):
+   """ Simulation from the start as simu() with a schedule of changes during the run, see model_simulate_schedule(), 
+       e.g. simu_schedule([(3, {'qSmax': 0.7}), (4, {}, {'bioreactor.m[2]': 5})]). Parameters keep the values 
+       in parValue, i.e. the changes are only for this simulation."""
+   global sim_res, prevFinalTime, start_values
+   start_values = {parLocation[k]:parValue[k] for k in parValue.keys()}
+   output = [v.name for v in model_description.modelVariables if v.causality == 'local' and \
+             any([v.name in command for command in diagrams])]
+   sim_res = model_simulate_schedule(start_values, schedule, simulationTime, options, output)
+   linetype = next(linecycler)    
+   for command in diagrams: eval(command)
+   for key in stateValue.keys(): stateValue[key] = model_get(key)  
+   prevFinalTime = sim_res['time'][-1]
+
+def opts_stop(options=opts_fast, location='bioreactor.c[2]', eps=1e-3, dtol=1e-4, data=True):
+   """ Copy of an opts-profile where model_simulate() ends when the variable at location is below eps and all 
+       state derivatives are below dtol, i.e. the culture has stopped since substrate is exhausted, checked after 
+       each solver step. With data the calibration tools simulate only up to the last time of data. 
+       Use location None for only the data."""
+   options = dict(options)
+   options['stop'] = {'location': location, 'eps': eps, 'dtol': dtol, 'data': data}
+   return options
+
+def opts_limit(options=opts_fast, timeout=None, maxsteps=None):
+   """ Copy of an opts-profile where model_simulate() fails with an exception when the simulation takes longer 
+       than timeout seconds of wall time, or more than maxsteps output and event steps."""
+   options = dict(options)
+   options['timeout'] = timeout
+   options['maxsteps'] = maxsteps
+   return options
+
 # Describe model parts of the combined system
 def describe_parts(component_list=[]):
    """List all parts of the model""" 
@@ -629,7 +852,7 @@ def describe_general(name, decimals, parLocation=parLocation):
       print(description,'[',unit,']')
 
    elif name == 'process':
-      print(read_model_description(fmu_model).description)   
+      print(fmu_model_description(fmu_model).description)   
       
    elif name in parLocation.keys():
       description = model_get_variable_description(parLocation[name])
@@ -663,9 +886,8 @@ def describe_general(name, decimals, parLocation=parLocation):
 
 # Plot process diagram
 def process_diagram(fmu_model=fmu_model, fmu_process_diagram=fmu_process_diagram):   
-   try:
-       processDiagram = zipfile.ZipFile(fmu_model, 'r').open('documentation/processDiagram.png')
-   except KeyError:
+   processDiagram = fmu_file(fmu_model, 'documentation/processDiagram.png')
+   if processDiagram is None:
        print('No processDiagram.png file in the FMU, but try the file on disk.')
        processDiagram = fmu_process_diagram
    try:
@@ -708,14 +930,14 @@ def system_info():
    except NameError:
        print(' -Scipy: not installed in the notebook')
    print(' -FMPy:', version('fmpy'))
-   print(' -FMU by:', read_model_description(fmu_model).generationTool)
-   print(' -FMI:', read_model_description(fmu_model).fmiVersion)
+   print(' -FMU by:', fmu_model_description(fmu_model).generationTool)
+   print(' -FMI:', fmu_model_description(fmu_model).fmiVersion)
    if model_description.modelExchange is None:
       print(' -Type: CS')
    else:
       print(' -Type: ME')
-   print(' -Name:', read_model_description(fmu_model).modelName)
-   print(' -Generated:', read_model_description(fmu_model).generationDateAndTime)
+   print(' -Name:', fmu_model_description(fmu_model).modelName)
+   print(' -Generated:', fmu_model_description(fmu_model).generationDateAndTime)
    print(' -MSL:', MSL_version)    
    print(' -Description:', BPL_version)   
    print(' -Interaction:', FMU_explore)
@@ -0,0 +1,222 @@
+# Figure - Comparison of speed and accuracy of the FMU builds for the batch reactor model
+#          e.g. python BPL_TEST2_Batch_fmu_compare.py --record    to record baselines on this host
+#               python BPL_TEST2_Batch_fmu_compare.py             to compare and check against the baselines
+#          where each FMU file is run on each installed backend with a fixed grid of parameters
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with maximal deviation of X, S and mu from reference trajectories and simulations per second,
+#              checked against baselines recorded per host with exit code 1 when a build is worse
+# 2026-10-19 - Accuracy tolerance applied also without baseline, and a changed FMU file must be recorded
+#------------------------------------------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------------------------------------------
+#  Framework
+#------------------------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import glob
+import json
+import platform
+import argparse
+import itertools
+import subprocess
+import numpy as np
+
+from BPL_TEST2_Batch_fmucache import file_hash
+from BPL_TEST2_Batch_backend import backend_list, backend_candidates, backend_valid
+
+# Variables compared and the fixed grid of parameters and time, with initial values as in the explore scripts
+compare_location = {'X': 'bioreactor.c[1]', 'S': 'bioreactor.c[2]', 'mu': 'bioreactor.culture.mu'}
+compare_start = {'bioreactor.V_start': 1.0, 'bioreactor.m_start[1]': 1.0, 'bioreactor.m_start[2]': 10.0}
+compare_grid = {'bioreactor.culture.Y': [0.4, 0.5, 0.6], 'bioreactor.culture.qSmax': [0.8, 1.0, 1.2], \
+                'bioreactor.culture.Ks': [0.05, 0.1, 0.2]}
+compare_time = np.linspace(0, 8.0, 81)
+
+# Workload run for each candidate in a subprocess, the best of repeat runs of the grid gives the speed
+compare_workload = '''
+import sys, json, time, locale, platform
+import numpy as np
+if platform.system() == 'Linux':
+   try: locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+   except locale.Error: pass
+task = json.loads(sys.argv[1])
+backend, flag_type, fmu_model, repeat = task['backend'], task['flag_type'], task['fmu_model'], task['repeat']
+parSets, location, t = task['parSets'], task['location'], np.array(task['time'])
+ncp = len(t) - 1
+if backend == 'pyfmi':
+   from pyfmi import load_fmu
+   model = load_fmu(fmu_model, kind=flag_type, log_level=0)
+   opts = model.simulate_options()
+   if flag_type == 'ME': opts['CVode_options']['verbosity'] = 50
+   else: opts['silent_mode'] = True
+   opts['ncp'] = ncp
+   opts['result_handling'] = 'memory'
+   def simulate(parSet):
+      model.reset()
+      for key in parSet.keys(): model.set(key, parSet[key])
+      return model.simulate(final_time=t[-1], options=opts)
+else:
+   from fmpy import simulate_fmu
+   from BPL_TEST2_Batch_fmucache import fmu_extract, fmu_model_description
+   filename, model_description = fmu_extract(fmu_model), fmu_model_description(fmu_model)
+   def simulate(parSet):
+      return simulate_fmu(filename, validate=False, model_description=model_description,
+                          fmi_type='ModelExchange' if flag_type == 'ME' else 'CoSimulation',
+                          stop_time=t[-1], output_interval=t[-1]/ncp, start_values=parSet, output=location)
+wall_time = []
+for k in range(repeat):
+   trajectories = []
+   start_time = time.perf_counter()
+   for parSet in parSets:
+      sim_res = simulate(parSet)
+      trajectories.append([np.interp(t, sim_res['time'], sim_res[name]).tolist() for name in location])
+   wall_time.append(time.perf_counter() - start_time)
+print(json.dumps({'time': min(wall_time)/len(parSets), 'trajectories': trajectories}))
+'''
+
+def compare_arguments(argv=None):
+   parser = argparse.ArgumentParser(description='Speed and accuracy of the FMU builds of BPL_TEST2_Batch')
+   parser.add_argument('--fmu', nargs='+', default=None, help='FMU files, default all BPL_TEST2_Batch_*.fmu')
+   parser.add_argument('--backend', nargs='+', default=backend_list, help='backends if installed')
+   parser.add_argument('--repeat', type=int, default=3, help='runs of the grid where the fastest counts')
+   parser.add_argument('--record', action='store_true', help='record the results as baselines of this host')
+   parser.add_argument('--baseline', default='BPL_TEST2_Batch_fmu_baseline.json', help='file of baselines')
+   parser.add_argument('--accuracy-tolerance', type=float, default=1e-4, \
+                       help='allowed relative deviation beyond the recorded, or without baseline, default 1e-4')
+   parser.add_argument('--speed-tolerance', type=float, default=0.2, \
+                       help='allowed fraction of loss of simulations per second, default 0.2')
+   return parser.parse_args(argv)
+
+#------------------------------------------------------------------------------------------------------------------
+#  Candidates and runs
+#------------------------------------------------------------------------------------------------------------------
+
+def compare_name(candidate):
+   return ' '.join(candidate)
+
+def compare_run(candidate, repeat=3, timeout=600):
+   """Simulate the grid with one candidate in a subprocess and return the time per simulation and the
+      trajectories as an array of shape (parameter set, variable, time), or None if the candidate fails"""
+   backend, flag_type, fmu_model = candidate
+   parSets = [dict(compare_start, **dict(zip(compare_grid.keys(), values))) \
+              for values in itertools.product(*compare_grid.values())]
+   task = {'backend': backend, 'flag_type': flag_type, 'fmu_model': fmu_model, 'repeat': repeat, \
+           'parSets': parSets, 'location': list(compare_location.values()), 'time': compare_time.tolist()}
+   try:
+      output = subprocess.run([sys.executable, '-c', compare_workload, json.dumps(task)], capture_output=True, \
+                              text=True, timeout=timeout)
+      result = json.loads(output.stdout.strip().splitlines()[-1])
+   except (subprocess.TimeoutExpired, json.JSONDecodeError, IndexError):
+      return None
+   trajectories = np.array(result['trajectories'])
+   if not np.all(np.isfinite(trajectories)): return None
+   return {'time': result['time'], 'trajectories': trajectories}
+
+def compare_deviation(trajectories, reference):
+   """Maximal deviation for each variable relative to the largest value of the reference"""
+   return {key: float(np.max(np.abs(trajectories[:, j] - reference[:, j]))/max(np.max(np.abs(reference[:, j])), 1e-12)) \
+           for j, key in enumerate(compare_location.keys())}
+
+#------------------------------------------------------------------------------------------------------------------
+#  Baselines and report
+#------------------------------------------------------------------------------------------------------------------
+
+def compare_baseline_read(file):
+   try:
+      with open(file) as f: return json.load(f)
+   except FileNotFoundError:
+      return {'reference': None, 'hosts': {}}
+
+def compare_baseline_write(file, baseline):
+   with open(file + '.tmp', 'w') as f: json.dump(baseline, f, indent=3)
+   os.replace(file + '.tmp', file)
+
+def compare(args):
+   """Run all candidates, compare with the reference trajectories and check against the baselines of
+      this host. A check fails when a candidate fails to simulate, deviates more than the accuracy tolerance
+      beyond the recorded deviation, or beyond zero without baseline, is slower than recorded, or is a new
+      build of the FMU file with another hash than recorded. Return the report as a list of rows and whether
+      all checks passed."""
+   fmu_list = args.fmu if args.fmu is not None else sorted(glob.glob('BPL_TEST2_Batch_*.fmu'))
+   candidates = backend_candidates(fmu_list, args.backend)
+   if candidates == []: raise SystemExit('Error: There is no backend and FMU for this platform')
+   results = {candidate: compare_run(candidate, args.repeat) for candidate in candidates}
+   baseline = compare_baseline_read(args.baseline)
+   host = platform.node() + ' ' + platform.machine() + ' Python ' + platform.python_version()
+   recorded = baseline['hosts'].get(host, {})
+
+   # Reference trajectories are the recorded ones, or with --record the first candidate that agrees with the others
+   valid = [candidate for candidate in candidates if candidate in backend_valid(results, 'trajectories', 1e-3).keys()]
+   if args.record or baseline['reference'] is None:
+      if valid == []: raise SystemExit('Error: None of the candidates could simulate')
+      baseline['reference'] = {'candidate': compare_name(valid[0]), 'grid': compare_grid, 'time': compare_time.tolist(), \
+                               'trajectories': results[valid[0]]['trajectories'].tolist()}
+   reference = np.array(baseline['reference']['trajectories'])
+
+   report = []
+   passed = True
+   for candidate in candidates:
+      name = compare_name(candidate)
+      row = {'candidate': name, 'fmu_hash': file_hash(candidate[2])[:12]}
+      if results[candidate] is None:
+         row.update({'status': 'failed'})
+         passed = False
+         report.append(row)
+         continue
+      row['ms'] = 1000*results[candidate]['time']
+      row['per_second'] = 1/results[candidate]['time']
+      row['deviation'] = compare_deviation(results[candidate]['trajectories'], reference)
+      row['status'] = 'ok'
+      if args.record:
+         report.append(row)
+         continue
+      baseline_row = recorded.get(name)
+      if baseline_row is not None and baseline_row.get('fmu_hash') != row['fmu_hash']:
+         row['status'] = 'new build, run with --record'
+         baseline_row = None
+      elif baseline_row is None:
+         row['status'] = 'no baseline'
+      deviation = baseline_row['deviation'] if baseline_row is not None else {key: 0 for key in compare_location.keys()}
+      if any([row['deviation'][key] > deviation[key] + args.accuracy_tolerance for key in compare_location.keys()]):
+         row['status'] = 'worse accuracy'
+      elif baseline_row is not None and row['per_second'] < (1 - args.speed_tolerance)*baseline_row['per_second']:
+         row['status'] = 'slower, recorded ' + str(np.round(baseline_row['per_second'], 1)) + ' per second'
+      passed = passed and row['status'] in ['ok', 'no baseline']
+      report.append(row)
+
+   if args.record:
+      baseline['hosts'][host] = {row['candidate']: {'per_second': row['per_second'], 'deviation': row['deviation'], \
+                                                    'fmu_hash': row['fmu_hash']} for row in report if 'ms' in row}
+      compare_baseline_write(args.baseline, baseline)
+   return report, passed
+
+def compare_print(report):
+   print('Reference trajectories of X, S and mu from', len(list(itertools.product(*compare_grid.values()))), \
+         'parameter sets')
+   print('%-55s %9s %9s %10s %10s %10s  %s' % ('candidate', 'ms', 'per s', 'dev X', 'dev S', 'dev mu', 'status'))
+   for row in report:
+      if 'ms' in row:
+         print('%-55s %9.2f %9.1f %10.2e %10.2e %10.2e  %s' % (row['candidate'], row['ms'], row['per_second'], \
+               row['deviation']['X'], row['deviation']['S'], row['deviation']['mu'], row['status']))
+      else:
+         print('%-55s %9s %9s %10s %10s %10s  %s' % (row['candidate'], '-', '-', '-', '-', '-', row['status']))
+
+#------------------------------------------------------------------------------------------------------------------
+#  Main
+#------------------------------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+   args = compare_arguments()
+   args.fmu = None if args.fmu is None else [os.path.abspath(file) for file in args.fmu]
+   args.baseline = os.path.abspath(args.baseline)
+   os.chdir(os.path.dirname(os.path.abspath(__file__)))
+   report, passed = compare(args)
+   compare_print(report)
+   if args.record:
+      print('Baselines recorded in', args.baseline)
+   elif not passed:
+      print('Error: A build failed, is worse than its baseline or is new, see status')
+      sys.exit(1)
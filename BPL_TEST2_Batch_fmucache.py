@@ -0,0 +1,103 @@
+# Figure - Shared cache of extracted FMU files for the batch reactor model
+#          imported by BPL_TEST2_Batch_explore.py and BPL_TEST2_Batch_fmpy_explore.py
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with extraction once per FMU content, shared by notebooks and worker processes,
+#              and the model description parsed by FMPy stored next to it
+# 2026-10-19 - The hash of file content is here and used by the telemetry, instead of the other way
+#------------------------------------------------------------------------------------------------------------------
+
+import os
+import pickle
+import hashlib
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+try:
+   import fcntl
+except ImportError:
+   fcntl = None
+try:
+   import msvcrt
+except ImportError:
+   msvcrt = None
+
+# Directory of the cache with one sub-directory for each FMU content
+fmu_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'BPL_TEST2_Batch', 'fmu')
+
+# Extracted directory and model description already found in this process, keyed by FMU file, size and time
+fmu_cache_memo = {}
+
+@contextlib.contextmanager
+def fmu_lock(file):
+   """Exclusive lock between processes on the given lock file"""
+   with open(file, 'a+') as f:
+      if fcntl is not None:
+         fcntl.flock(f, fcntl.LOCK_EX)
+      elif msvcrt is not None:
+         msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+      try:
+         yield
+      finally:
+         if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+         elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def file_hash(file):
+   """Short hash of the content of a file, e.g. the FMU"""
+   with open(file, 'rb') as f: return hashlib.sha256(f.read()).hexdigest()[:16]
+
+def fmu_key(fmu_model):
+   stat = os.stat(fmu_model)
+   return (os.path.abspath(fmu_model), stat.st_size, stat.st_mtime_ns)
+
+def fmu_extract(fmu_model, cache=None):
+   """Directory with the content of the FMU. The FMU is extracted once for each content, to a temporary
+      directory that is renamed when complete, and under a lock so that processes started together wait
+      for the first one instead of extracting the same FMU in parallel."""
+   key = fmu_key(fmu_model)
+   if (key, 'directory') in fmu_cache_memo.keys(): return fmu_cache_memo[(key, 'directory')]
+   cache = fmu_cache_dir if cache is None else cache
+   directory = os.path.join(cache, file_hash(fmu_model))
+   if not os.path.isdir(directory):
+      os.makedirs(cache, exist_ok=True)
+      with fmu_lock(directory + '.lock'):
+         if not os.path.isdir(directory):
+            temp = tempfile.mkdtemp(dir=cache, prefix='.extract-')
+            try:
+               with zipfile.ZipFile(fmu_model, 'r') as fmu: fmu.extractall(temp)
+               os.rename(temp, directory)
+            except OSError:
+               shutil.rmtree(temp, ignore_errors=True)
+               if not os.path.isdir(directory): raise
+   fmu_cache_memo[(key, 'directory')] = directory
+   return directory
+
+def fmu_model_description(fmu_model, cache=None):
+   """Model description parsed by FMPy, stored in the cache directory for each version of FMPy"""
+   import fmpy
+   from fmpy import read_model_description
+   key = fmu_key(fmu_model)
+   if (key, 'model_description') in fmu_cache_memo.keys(): return fmu_cache_memo[(key, 'model_description')]
+   directory = fmu_extract(fmu_model, cache)
+   file = os.path.join(directory, 'modelDescription-fmpy-' + fmpy.__version__ + '.pickle')
+   try:
+      with open(file, 'rb') as f: model_description = pickle.load(f)
+   except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError):
+      model_description = read_model_description(directory)
+      with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as f:
+         pickle.dump(model_description, f)
+      os.replace(f.name, file)
+   fmu_cache_memo[(key, 'model_description')] = model_description
+   return model_description
+
+def fmu_file(fmu_model, name, cache=None):
+   """Path of a file in the FMU, e.g. documentation/processDiagram.png, or None if not there"""
+   file = os.path.join(fmu_extract(fmu_model, cache), *name.split('/'))
+   return file if os.path.exists(file) else None
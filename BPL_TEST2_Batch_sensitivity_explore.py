@@ -0,0 +1,162 @@
+# Figure - Global sensitivity analysis of the batch reactor model
+#          run after BPL_TEST2_Batch_explore.py or BPL_TEST2_Batch_fmpy_explore.py and
+#          BPL_TEST2_Batch_calibration_explore.py that gives the worker pool, i.e. in the notebook:
+#          run -i BPL_TEST2_Batch_sensitivity_explore.py
+#          and start the pool with pool_start() after this script so that the workers get sobol_chunk()
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with Sobol indices from Saltelli sampling, evaluated in chunks that are checkpointed on disk
+# 2026-10-19 - Resume only with the same data and options, checked by hash, otherwise an error or restart=True
+#------------------------------------------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------------------------------------------
+#  Framework
+#------------------------------------------------------------------------------------------------------------------
+
+import os
+import json
+import numpy as np
+import matplotlib.pyplot as plt
+import scipy.stats
+
+#------------------------------------------------------------------------------------------------------------------
+#  Sampling and evaluation
+#------------------------------------------------------------------------------------------------------------------
+
+def sobol_samples(parRange, n, seed=0):
+   """Saltelli samples for the parameters in parRange, a dictionary of (lower, upper), as rows of the
+      matrices A and B, each with n rows from a scrambled Sobol sequence, followed by the d matrices AB_i
+      that are A with column i from B. In total n*(d+2) rows."""
+   names = list(parRange.keys())
+   d = len(names)
+   lower = np.array([parRange[p][0] for p in names])
+   upper = np.array([parRange[p][1] for p in names])
+   AB = scipy.stats.qmc.Sobol(2*d, scramble=True, seed=seed).random(n)
+   A = lower + (upper-lower)*AB[:, :d]
+   B = lower + (upper-lower)*AB[:, d:]
+   rows = [A, B]
+   for i in range(d):
+      A_B = A.copy()
+      A_B[:, i] = B[:, i]
+      rows.append(A_B)
+   return np.vstack(rows)
+
+def sobol_chunk(task):
+   """Simulate a chunk of rows and write the outputs directly into the memory-mapped file, where
+      outputs are the mcLocation variables on the time grid or the loss function V for data.
+      Failed simulations are given NaN. Return the chunk number."""
+   (file, chunk, start, rows, names, t, simulationTime, options, parValue, data) = task
+   outputs = np.load(file, mmap_mode='r+')
+   for k, x in enumerate(rows):
+      try:
+         if data is not None:
+            outputs[start+k, 0, 0] = objective_data(x, names, data, simulationTime, options, parValue)
+         else:
+            parValueLocal = dict(parValue)
+            for i, p in enumerate(names): parValueLocal[p] = x[i]
+            res = model_simulate({parLocation[key]: parValueLocal[key] for key in parValueLocal.keys()}, \
+                                 simulationTime, options, output=list(mcLocation.values()))
+            for j, key in enumerate(mcLocation.keys()):
+               outputs[start+k, j] = np.interp(t, res['time'], res[mcLocation[key]])
+      except Exception:
+         outputs[start+k] = np.nan
+   outputs.flush()
+   del outputs
+   return chunk
+
+def sobol_save(file, array):
+   """Save array atomically, i.e. an interrupted save leave the previous file"""
+   np.save(file + '.tmp.npy', array)
+   os.replace(file + '.tmp.npy', file)
+
+def sobol(parRange, n=1024, file='BPL_TEST2_Batch_sobol', simulationTime=simulationTime, ncp=60, data=None, \
+          chunksize=64, seed=0, dtype='float32', options=opts_fast, parValue=parValue, restart=False):
+   """Sobol indices for the parameters in parRange, e.g. {'Y': (0.4, 0.6), 'VS_start': (8, 12)}, from
+      n*(d+2) simulations. The outputs are X, S and mu on a time grid of ncp+1 points, or with data
+      the loss function V. Outputs are written to file.npy by the workers chunk by chunk and finished
+      chunks are noted in file_done.npy, so that an interrupted run continues when called again with
+      the same arguments. The files are not reused with other arguments, data or options, but give an
+      error unless restart is True. Return the indices as from sobol_indices()."""
+   names = list(parRange.keys())
+   t = np.linspace(0, simulationTime, ncp+1)
+   nrows = n*(len(names)+2)
+   nchunks = (nrows + chunksize - 1)//chunksize
+   shape = (nrows, 1, 1) if data is not None else (nrows, len(mcLocation), len(t))
+   data = None if data is None else (data if isinstance(data, SeriesLoss) else data_arrays(data))
+   setup = {'parRange': {p: list(parRange[p]) for p in names}, 'n': n, 'simulationTime': simulationTime, 'ncp': ncp, \
+            'data': None if data is None else data_hash(data), 'options': data_hash(options), \
+            'chunksize': chunksize, 'seed': seed, 'dtype': dtype, \
+            'parValue': {key: float(parValue[key]) for key in parValue.keys()}}
+
+   # Continue from the files if the setup is the same, refuse if it differs and otherwise start from the beginning
+   try:
+      with open(file + '.json') as f: setup_file = json.load(f)
+      done = np.load(file + '_done.npy')
+      np.load(file + '.npy', mmap_mode='r')
+      resume = True
+   except (FileNotFoundError, ValueError):
+      resume = False
+   if resume and setup_file != setup and not restart:
+      differ = [key for key in setup.keys() if setup_file.get(key) != setup[key]]
+      raise ValueError('The files ' + file + '.* are from a run with other ' + ', '.join(differ) + \
+                       ', give another file or restart=True')
+   if resume and restart: resume = False
+   if not resume:
+      outputs = np.lib.format.open_memmap(file + '.npy', mode='w+', dtype=dtype, shape=shape)
+      del outputs
+      done = np.zeros(nchunks, dtype=bool)
+      sobol_save(file + '_done.npy', done)
+      with open(file + '.json', 'w') as f: json.dump(setup, f, indent=3)
+
+   rows = sobol_samples(parRange, n, seed)
+   options = options_ncp(options, ncp)
+   tasks = [(file + '.npy', chunk, chunk*chunksize, rows[chunk*chunksize:(chunk+1)*chunksize], names, t, \
+             simulationTime, options, parValue, data) for chunk in range(nchunks) if not done[chunk]]
+   if pool is None:
+      chunks = map(sobol_chunk, tasks)
+   else:
+      chunks = pool.imap_unordered(sobol_chunk, tasks)
+   for chunk in chunks:
+      done[chunk] = True
+      sobol_save(file + '_done.npy', done)
+   return sobol_indices(file)
+
+#------------------------------------------------------------------------------------------------------------------
+#  Indices
+#------------------------------------------------------------------------------------------------------------------
+
+def sobol_indices(file='BPL_TEST2_Batch_sobol'):
+   """First order indices S1 by Saltelli (2010) and total indices ST by Jansen (1999) for each output
+      and time point, where samples with a failed simulation are left out. Return a dictionary with time,
+      names, number of failed samples and for each output the arrays S1 and ST of shape (parameters, time)."""
+   with open(file + '.json') as f: setup = json.load(f)
+   names = list(setup['parRange'].keys())
+   n, d = setup['n'], len(names)
+   Y = np.asarray(np.load(file + '.npy', mmap_mode='r'), dtype=float)
+   Y = Y.reshape((d+2, n) + Y.shape[1:])
+   ok = np.all(np.isfinite(Y.reshape(d+2, n, -1)), axis=(0, 2))
+   f_A, f_B, f_AB = Y[0, ok], Y[1, ok], Y[2:, ok]
+   variance = np.var(np.concatenate([f_A, f_B]), axis=0)
+   variance = np.where(variance > 0, variance, np.nan)
+   S1 = np.mean(f_B*(f_AB - f_A), axis=1)/variance
+   ST = 0.5*np.mean((f_A - f_AB)**2, axis=1)/variance
+   outputs = ['V'] if setup['data'] else list(mcLocation.keys())
+   result = {'time': np.linspace(0, setup['simulationTime'], setup['ncp']+1), 'names': names, 'failed': int(n - np.sum(ok))}
+   for j, key in enumerate(outputs):
+      result[key] = {'S1': S1[:, j, 0], 'ST': ST[:, j, 0]} if setup['data'] else {'S1': S1[:, j], 'ST': ST[:, j]}
+   return result
+
+def sobol_plot(result):
+   """Diagram of first order and total indices over time for X, S and mu"""
+   outputs = [key for key in mcLocation.keys() if key in result.keys()]
+   plt.figure()
+   for j, key in enumerate(outputs):
+      for k, index in enumerate(['S1', 'ST']):
+         plt.subplot(len(outputs), 2, 2*j+k+1)
+         for i, p in enumerate(result['names']): plt.plot(result['time'], result[key][index][i], label=p)
+         plt.ylabel(key + ' ' + index); plt.ylim([-0.05, 1.05]); plt.grid()
+   plt.legend()
+   plt.xlabel('Time [h]')
+   plt.show()
@@ -0,0 +1,86 @@
+# Figure - Compact simulation result for the batch reactor model
+#          imported by BPL_TEST2_Batch_explore.py and BPL_TEST2_Batch_fmpy_explore.py
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with SimResult that keeps chosen variables in one 2-D array with export to pandas and Arrow
+#------------------------------------------------------------------------------------------------------------------
+
+import numpy as np
+
+class SimResult:
+   """Result of a simulation with only the chosen variables, stored as one contiguous array with one row
+      per variable and the time in the first row. Each variable is given as a view of its row, without copy,
+      and the names can be short aliases of the model variables, e.g. {'X': 'bioreactor.c[1]'}.
+      Works the same for results from PyFMI and FMPy."""
+
+   __slots__ = ('data', 'names', 'index', 'locations')
+
+   def __init__(self, data, names, locations=None):
+      self.data = np.ascontiguousarray(data)
+      self.names = list(names)
+      self.index = {name: i for i, name in enumerate(self.names)}
+      self.locations = dict(zip(self.names, locations if locations is not None else self.names))
+
+   @classmethod
+   def from_result(cls, res, variables, dtype=np.float64):
+      """From a PyFMI or FMPy result keep time and the variables given as a list of names, or as
+         a dictionary of alias and name in the model. Use dtype float32 to halve the memory."""
+      if isinstance(variables, dict):
+         names, locations = list(variables.keys()), list(variables.values())
+      else:
+         names, locations = list(variables), list(variables)
+      if 'time' not in names:
+         names, locations = ['time'] + names, ['time'] + locations
+      time = np.asarray(res['time'])
+      data = np.empty((len(names), len(time)), dtype=dtype)
+      for i, location in enumerate(locations): data[i] = res[location]
+      return cls(data, names, locations)
+
+   def __getitem__(self, name):
+      """View of the values of a variable given by alias or model name"""
+      if name not in self.index.keys():
+         name = {location: alias for alias, location in self.locations.items()}[name]
+      return self.data[self.index[name]]
+
+   def __contains__(self, name):
+      return name in self.index.keys() or name in self.locations.values()
+
+   def __len__(self):
+      return self.data.shape[1]
+
+   def __repr__(self):
+      return 'SimResult(' + str(len(self)) + ' time points of ' + ', '.join(self.names) + ', ' + str(self.data.dtype) + ')'
+
+   def __getstate__(self):
+      return (self.data, self.names, [self.locations[name] for name in self.names])
+
+   def __setstate__(self, state):
+      self.__init__(*state)
+
+   def keys(self):
+      return list(self.names)
+
+   @property
+   def time(self):
+      return self.data[0]
+
+   @property
+   def nbytes(self):
+      return self.data.nbytes
+
+   def astype(self, dtype):
+      return SimResult(self.data.astype(dtype), self.names, [self.locations[name] for name in self.names])
+
+   def to_pandas(self):
+      """DataFrame with one column per variable, sharing memory with the result where pandas allows"""
+      import pandas as pd
+      return pd.DataFrame(self.data.T, columns=self.names, copy=False)
+
+   def to_arrow(self):
+      """Arrow table with one column per variable built on the rows without copy, requires pyarrow"""
+      import pyarrow as pa
+      dtype = pa.from_numpy_dtype(self.data.dtype)
+      return pa.Table.from_arrays([pa.Array.from_buffers(dtype, len(self), [None, pa.py_buffer(self.data[i])]) \
+                                   for i in range(len(self.names))], names=self.names)
@@ -0,0 +1,107 @@
+# Figure - Telemetry of simulations with the batch reactor model
+#          imported by BPL_TEST2_Batch_explore.py and BPL_TEST2_Batch_fmpy_explore.py
+#
+# GNU General Public License v3.0
+# Copyright (c) 2026, Jan Peter Axelsson, All rights reserved.
+#------------------------------------------------------------------------------------------------------------------
+# 2026-10-19 - Start with opt-in JSON-lines log of simulations, written in batches, and summary reader
+#------------------------------------------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import socket
+import hashlib
+import atexit
+import multiprocessing.util
+import numpy as np
+
+from BPL_TEST2_Batch_fmucache import file_hash
+
+# State of the telemetry, where records are kept in a buffer and appended to file in batches
+telemetry = {'file': None, 'batch': 100, 'buffer': [], 'identity': {}, 'pid': None, 'last_flush': 0, 'interval': 10}
+
+def par_hash(values):
+   """Short hash of parameter values given as a dictionary"""
+   text = json.dumps({key: float(values[key]) if np.isscalar(values[key]) and not isinstance(values[key], str) \
+                      else str(values[key]) for key in sorted(values.keys())})
+   return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+def telemetry_start(file='BPL_TEST2_Batch_telemetry.jsonl', batch=100, interval=10, **identity):
+   """Start telemetry where each simulation append one record to file. The records are written
+      when batch records are collected or interval seconds has passed, and at exit.
+      The identity, e.g. backend and fmu_model, is included in each record."""
+   telemetry_flush()
+   telemetry['file'] = file
+   telemetry['batch'] = batch
+   telemetry['interval'] = interval
+   telemetry['identity'] = dict(identity)
+   telemetry['identity']['host'] = socket.gethostname()
+   if 'fmu_model' in identity.keys(): telemetry['identity']['fmu_hash'] = file_hash(identity['fmu_model'])
+   telemetry['pid'] = os.getpid()
+   telemetry['last_flush'] = time.time()
+
+def telemetry_stop():
+   """Write remaining records and stop telemetry"""
+   telemetry_flush()
+   telemetry['file'] = None
+
+def telemetry_active():
+   return telemetry['file'] is not None
+
+def telemetry_record(mode, simulationTime, wall_time, success, values={}, statistics={}, error=None):
+   """Add a record of one simulation, where statistics are solver counters if available"""
+   if telemetry['file'] is None: return
+   if telemetry['pid'] != os.getpid():
+      # Forked worker process - do not write the buffer of the parent again and write own buffer at exit
+      telemetry['pid'] = os.getpid()
+      telemetry['buffer'] = []
+      multiprocessing.util.Finalize(None, telemetry_flush, exitpriority=10)
+   record = {'t': round(time.time(), 3), 'pid': telemetry['pid'], 'par': par_hash(values) if values else None, \
+             'mode': mode, 'simulationTime': simulationTime, 'wall_time': round(wall_time, 6), 'success': success}
+   record.update(statistics)
+   if error is not None: record['error'] = error[:200]
+   record.update(telemetry['identity'])
+   telemetry['buffer'].append(record)
+   if len(telemetry['buffer']) >= telemetry['batch'] or time.time() - telemetry['last_flush'] > telemetry['interval']:
+      telemetry_flush()
+
+def telemetry_flush():
+   """Append the buffered records to file in one write"""
+   if telemetry['file'] is None or telemetry['buffer'] == []: return
+   text = ''.join([json.dumps(record) + '\n' for record in telemetry['buffer']])
+   with open(telemetry['file'], 'a') as f: f.write(text)
+   telemetry['buffer'] = []
+   telemetry['last_flush'] = time.time()
+
+atexit.register(telemetry_flush)
+
+def telemetry_read(file='BPL_TEST2_Batch_telemetry.jsonl'):
+   """Read all records from file as a list of dictionaries, a broken last line is skipped"""
+   records = []
+   with open(file) as f:
+      for line in f:
+         try:
+            records.append(json.loads(line))
+         except json.JSONDecodeError:
+            pass
+   return records
+
+def telemetry_summary(file='BPL_TEST2_Batch_telemetry.jsonl', group=['mode', 'backend'], percentiles=[50, 90, 99], \
+                      since=None):
+   """Latency percentiles in ms and failure rate for each group of records, optionally only since a time"""
+   records = [record for record in telemetry_read(file) if since is None or record['t'] >= since]
+   groups = {}
+   for record in records:
+      key = tuple([record.get(g) for g in group])
+      if key not in groups.keys(): groups[key] = []
+      groups[key].append(record)
+   summary = {}
+   for key, items in groups.items():
+      wall_time = 1000*np.array([item['wall_time'] for item in items])
+      failures = sum([not item['success'] for item in items])
+      summary[key] = {'n': len(items), 'failures': failures, 'failure_rate': failures/len(items)}
+      for p in percentiles: summary[key]['p'+str(p)+'_ms'] = float(np.percentile(wall_time, p))
+      steps = [item['nsteps'] for item in items if 'nsteps' in item.keys()]
+      if steps != []: summary[key]['nsteps_mean'] = float(np.mean(steps))
+   return summary